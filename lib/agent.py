@@ -0,0 +1,375 @@
+'''
+This module runs the debugger as an agent next to the database and lets a
+thin client drive it over a socket. Every command is executed by the agent,
+only its output crosses the network, so stepping many times, tracing or
+fanning out cost one round trip per command instead of one per step.
+
+Messages are JSON objects, each prefixed by its length as a 4 byte unsigned
+big-endian integer. The client sends `{"id": 1, "command": "si", "args":
+["10"]}`, the agent answers with the same id and the output of the command as
+a list of events: `["log", level, message]` for log messages and `["text",
+text]` for printed text, which includes terminal escape sequences. Sending
+`{"cancel": 1}` while the command runs interrupts it, like Ctrl-C does at the
+local prompt; the command still gets its response.
+
+The agent runs any command, including SQL, for whoever connects. It only
+listens on a non-loopback address when a shared secret is set in the
+environment variable `PYDEBUG_AGENT_TOKEN`; clients then send `{"token":
+"..."}` as their first message and the agent answers `{"authenticated":
+true}` or an error before closing the connection. The token travels in
+plain text, hence prefer an SSH tunnel to the loopback address.
+'''
+
+import asyncio
+import hmac
+import json
+import socket
+import struct
+import sys
+import threading
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+from loguru import logger
+from prompt_toolkit.application import create_app_session
+from prompt_toolkit.data_structures import Size
+from prompt_toolkit.input import DummyInput
+from prompt_toolkit.output.vt100 import Vt100_Output
+
+from lib.commands import COMMANDS
+from lib.helpers import is_loopback
+
+
+HEADER = struct.Struct('>I')
+
+# Messages larger than this are rejected, the connection is closed
+MAX_MESSAGE_SIZE = 64 * 1024 * 1024
+
+# Environment variable holding the shared secret of agent and clients
+TOKEN_ENV = 'PYDEBUG_AGENT_TOKEN'
+
+# Width printed text is formatted for
+TERMINAL_SIZE = Size(rows=50, columns=160)
+
+
+def encode_frame(message: Dict[str, Any]) -> bytes:
+    body = json.dumps(message).encode()
+    return HEADER.pack(len(body)) + body
+
+
+def decode_length(header: bytes) -> int:
+    (length,) = HEADER.unpack(header)
+    if length > MAX_MESSAGE_SIZE:
+        raise ValueError(f'Message of {length} bytes is too large')
+
+    return length
+
+
+async def read_frame(reader: asyncio.StreamReader) -> Optional[Dict[str, Any]]:
+    '''
+    Read one message. Returns None when the peer closed the connection.
+    '''
+    try:
+        header = await reader.readexactly(HEADER.size)
+    except asyncio.IncompleteReadError:
+        return None
+
+    return json.loads(await reader.readexactly(decode_length(header)))
+
+
+class _Capture:
+    '''
+    File-like object collecting printed text as events.
+    '''
+
+    def __init__(self, events: List[list]):
+        self.events = events
+        self.encoding = 'utf-8'
+
+    def write(self, text: str):
+        # Older prompt_toolkit versions write encoded bytes
+        if isinstance(text, bytes):
+            text = text.decode(self.encoding, 'replace')
+        if text:
+            self.events.append(['text', text])
+
+    def flush(self):
+        pass
+
+    def isatty(self) -> bool:
+        return True
+
+
+def run_captured(debugger, command: str, args: List[str]) -> List[list]:
+    '''
+    Execute a command and return everything it logged or printed. Only
+    messages logged by the calling thread are captured.
+    '''
+    events = []
+    thread = threading.get_ident()
+    handler = logger.add(
+        lambda message: events.append(['log', message.record['level'].name,
+                                       message.record['message']]),
+        level='INFO', format='{message}',
+        filter=lambda record: record['thread'].id == thread)
+    output = Vt100_Output(_Capture(events), lambda: TERMINAL_SIZE, term='xterm')
+    try:
+        # The agent has no terminal to read from, e.g. when run as a service
+        with create_app_session(input=DummyInput(), output=output):
+            debugger.execute_command(command, args)
+
+    except Exception:
+        logger.exception(f'Command {command} failed')
+
+    finally:
+        logger.remove(handler)
+
+    return events
+
+
+class AgentSession:
+    '''
+    Serves one client. Commands run one at a time on a worker thread, the
+    debugger is not thread-safe.
+    '''
+
+    def __init__(self, debugger, reader: asyncio.StreamReader, writer, worker=None,
+                 token: Optional[str] = None):
+        self.debugger = debugger
+        self.reader = reader
+        self.writer = writer
+        self.worker = worker or ThreadPoolExecutor(max_workers=1)
+        self.token = token
+        self.running = None
+        self.cancelled = set()
+
+    async def handle(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        command = request.get('command', '')
+        args = [str(arg) for arg in request.get('args', [])]
+        if COMMANDS.resolve(command) not in COMMANDS:
+            return {'id': request.get('id'), 'error': f'Command {command} not found.'}
+
+        if request.get('id') in self.cancelled:
+            self.cancelled.discard(request.get('id'))
+            return {'id': request.get('id'), 'error': f'Command {command} cancelled.'}
+
+        self.running = request.get('id')
+        try:
+            loop = asyncio.get_running_loop()
+            events = await loop.run_in_executor(self.worker, run_captured, self.debugger,
+                                                command, args)
+        finally:
+            self.running = None
+
+        return {'id': request.get('id'), 'output': events}
+
+    def cancel(self, request_id):
+        '''
+        Interrupt a command, or drop it if it did not start yet.
+        '''
+        if request_id == self.running:
+            logger.info(f'Cancelling request {request_id}')
+            self.debugger.interrupt()
+        else:
+            self.cancelled.add(request_id)
+
+    async def _process(self, requests: asyncio.Queue):
+        while True:
+            request = await requests.get()
+            try:
+                self.writer.write(encode_frame(await self.handle(request)))
+                await self.writer.drain()
+            finally:
+                requests.task_done()
+
+    async def authenticate(self) -> bool:
+        '''
+        Check the token the client sends as its first message.
+        '''
+        try:
+            request = await read_frame(self.reader)
+        except (ValueError, json.JSONDecodeError):
+            request = None
+
+        token = request.get('token') if isinstance(request, dict) else None
+        if not isinstance(token, str) or not hmac.compare_digest(token.encode(),
+                                                                 self.token.encode()):
+            logger.warning('Client sent an invalid token, closing connection')
+            self.writer.write(encode_frame({'error': 'Invalid token.'}))
+            await self.writer.drain()
+            return False
+
+        self.writer.write(encode_frame({'authenticated': True}))
+        await self.writer.drain()
+        return True
+
+    async def serve(self):
+        if self.token is not None and not await self.authenticate():
+            return
+
+        # Frames are read while a command runs, such that it can be cancelled
+        requests = asyncio.Queue()
+        processor = asyncio.ensure_future(self._process(requests))
+        try:
+            while True:
+                try:
+                    request = await read_frame(self.reader)
+                except (ValueError, json.JSONDecodeError) as error:
+                    logger.error(f'Invalid message, closing connection: {error}')
+                    return
+
+                if request is None:
+                    await requests.join()
+                    return
+
+                if 'cancel' in request:
+                    self.cancel(request['cancel'])
+                else:
+                    await requests.put(request)
+
+        finally:
+            processor.cancel()
+
+
+async def _serve(debugger, host: str, port: int, token: Optional[str]):
+    # There is only one debugger, hence clients are served one after another
+    lock = asyncio.Lock()
+    worker = ThreadPoolExecutor(max_workers=1)
+
+    async def _client(reader, writer):
+        async with lock:
+            peer = writer.get_extra_info('peername')
+            logger.info(f'Client {peer} connected')
+            try:
+                await AgentSession(debugger, reader, writer, worker, token).serve()
+            finally:
+                writer.close()
+            logger.info(f'Client {peer} disconnected')
+
+    server = await asyncio.start_server(_client, host, port)
+    logger.info(f'Agent listening on {host}:{port}')
+    async with server:
+        await server.serve_forever()
+
+
+def check_address(host: str, token: Optional[str]):
+    '''
+    Refuse to serve on an address reachable from other machines without a
+    token.
+    '''
+    if not token and not is_loopback(host):
+        raise ValueError(f'Refusing to serve on {host} without a token, set {TOKEN_ENV} '
+                         'or tunnel to 127.0.0.1 over SSH')
+
+
+def serve_agent(debugger, host: str, port: int, token: Optional[str] = None):
+    '''
+    Serve thin clients connecting to the given port, one at a time. Clients
+    must send the token first, if one is given.
+    '''
+    check_address(host, token)
+    asyncio.run(_serve(debugger, host, port, token or None))
+
+
+class AgentClient:
+    '''
+    Blocking client of an agent, used by the thin client prompt.
+    '''
+
+    def __init__(self, host: str, port: int, timeout: Optional[float] = None,
+                 token: Optional[str] = None):
+        self.address = (host, port)
+        self.timeout = timeout
+        self.token = token
+        self._ids = 0
+        self._connect()
+
+    def _connect(self):
+        self._socket = socket.create_connection(self.address)
+        self._socket.settimeout(self.timeout)
+        # Received bytes are kept until a frame is complete, an interrupted
+        # read does not lose part of a frame
+        self._buffer = bytearray()
+        if self.token:
+            self._authenticate()
+
+    def _authenticate(self):
+        self._socket.sendall(encode_frame({'token': self.token}))
+        response = self._read_frame()
+        if not response.get('authenticated'):
+            self.close()
+            raise ConnectionError(response.get('error', 'Agent refused the token'))
+
+    def _read_frame(self) -> Dict[str, Any]:
+        while True:
+            if len(self._buffer) >= HEADER.size:
+                end = HEADER.size + decode_length(bytes(self._buffer[:HEADER.size]))
+                if len(self._buffer) >= end:
+                    body = bytes(self._buffer[HEADER.size:end])
+                    del self._buffer[:end]
+                    return json.loads(body)
+
+            chunk = self._socket.recv(65536)
+            if not chunk:
+                raise ConnectionError('Agent closed the connection')
+            self._buffer.extend(chunk)
+
+    def _response(self, request_id: int) -> Dict[str, Any]:
+        '''
+        Read frames until the response to the given request arrives.
+        Responses to earlier, interrupted requests are dropped.
+        '''
+        while True:
+            response = self._read_frame()
+            if response.get('id') == request_id:
+                return response
+
+            logger.debug(f'Dropping response to request {response.get("id")}')
+
+    def execute(self, command: str, args: List[str]) -> Dict[str, Any]:
+        '''
+        Execute a command on the agent and return its response. Ctrl-C
+        cancels the command on the agent, a second Ctrl-C stops waiting and
+        reconnects.
+        '''
+        self._ids += 1
+        request_id = self._ids
+        self._socket.sendall(encode_frame({'id': request_id, 'command': command,
+                                           'args': args}))
+        try:
+            return self._response(request_id)
+        except KeyboardInterrupt:
+            self._socket.sendall(encode_frame({'cancel': request_id}))
+
+        try:
+            return self._response(request_id)
+        except KeyboardInterrupt:
+            self.close()
+            self._connect()
+            raise
+
+    def close(self):
+        self._socket.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def replay(response: Dict[str, Any], write=None):
+    '''
+    Show the output of a command executed by the agent, in order.
+    '''
+    if 'error' in response:
+        logger.error(response['error'])
+        return
+
+    write = write or sys.stdout.write
+    for event in response.get('output', []):
+        if event[0] == 'log':
+            logger.log(event[1], event[2])
+        else:
+            write(event[1])
@@ -0,0 +1,153 @@
+'''
+This module analyses recorded trace files: merged coverage, hot lines and the
+history of a variable. Trace files are split into shards of consecutive steps
+which are aggregated in a process pool, the partial results are merged
+afterwards.
+'''
+
+import json
+import os
+
+from collections import Counter, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional
+
+
+# Shards are at least this large, smaller files are not worth splitting
+SHARD_SIZE = 16 * 1024 * 1024
+
+Shard = namedtuple('Shard', ['path', 'start', 'end'])
+HotLine = namedtuple('HotLine', ['oid', 'line', 'hits', 'elapsed_us'])
+TraceReport = namedtuple('TraceReport', ['steps', 'lines', 'hot_lines', 'variable', 'history'])
+
+
+class TraceAggregate:
+    '''
+    Partial or merged result of analysing traces.
+    '''
+
+    def __init__(self):
+        self.steps = 0
+        self.hits = Counter()
+        self.elapsed = Counter()
+        # Changes of the watched variable per trace file: (step, value)
+        self.history = {}
+
+    def merge(self, other: 'TraceAggregate') -> 'TraceAggregate':
+        '''
+        Merge another aggregate into this one. Aggregates of shards of the same
+        file have to be merged in step order.
+        '''
+        self.steps += other.steps
+        self.hits.update(other.hits)
+        self.elapsed.update(other.elapsed)
+
+        for path, changes in other.history.items():
+            history = self.history.setdefault(path, [])
+            for step, value in changes:
+                # A shard always reports its first value, skip it if it is
+                # the same as at the end of the previous shard.
+                if not history or history[-1][1] != value:
+                    history.append((step, value))
+
+        return self
+
+    def hot_lines(self, top: int = 10) -> List[HotLine]:
+        '''
+        The lines with the most time spent, ties broken by hits.
+        '''
+        lines = sorted(self.hits, key=lambda key: (self.elapsed[key], self.hits[key]),
+                       reverse=True)
+        return [HotLine(oid, line, self.hits[(oid, line)], self.elapsed[(oid, line)])
+                for oid, line in lines[:top]]
+
+    def report(self, top: int = 10, variable: Optional[str] = None) -> TraceReport:
+        return TraceReport(self.steps, len(self.hits), self.hot_lines(top), variable,
+                           self.history)
+
+
+def shard_trace(path: str, shard_size: int = SHARD_SIZE) -> List[Shard]:
+    '''
+    Split a trace file into byte ranges of roughly `shard_size` bytes. Every
+    range starts at the beginning of a line, so every shard covers a range of
+    consecutive steps.
+    '''
+    size = os.path.getsize(path)
+    boundaries = [0]
+    with open(path, 'rb') as trace_file:
+        position = shard_size
+        while position < size:
+            trace_file.seek(position)
+            trace_file.readline()
+            boundary = trace_file.tell()
+            if boundary >= size:
+                break
+            boundaries.append(boundary)
+            position = boundary + shard_size
+
+    boundaries.append(size)
+    return [Shard(path, start, end) for start, end in zip(boundaries, boundaries[1:])]
+
+
+def aggregate_shard(shard: Shard, variable: Optional[str] = None) -> TraceAggregate:
+    '''
+    Aggregate the steps of one shard. If a variable is given, its changes are
+    collected from the variables recorded in the trace.
+    '''
+    aggregate = TraceAggregate()
+    history = []
+    last = object()
+
+    with open(shard.path, 'rb') as trace_file:
+        trace_file.seek(shard.start)
+        position = shard.start
+        for raw in trace_file:
+            position += len(raw)
+            line = raw.decode()
+            if not line.startswith('#') and line.strip():
+                fields = line.rstrip('\n').split('\t', 4)
+                key = (int(fields[1]), int(fields[2]))
+                aggregate.steps += 1
+                aggregate.hits[key] += 1
+                aggregate.elapsed[key] += int(fields[3])
+
+                if variable and len(fields) > 4:
+                    value = json.loads(fields[4]).get(variable)
+                    if value != last:
+                        history.append((int(fields[0]), value))
+                        last = value
+
+            if position >= shard.end:
+                break
+
+    if variable:
+        aggregate.history[shard.path] = history
+
+    return aggregate
+
+
+def analyze_traces(paths: List[str], variable: Optional[str] = None,
+                   workers: Optional[int] = None,
+                   shard_size: int = SHARD_SIZE) -> TraceAggregate:
+    '''
+    Analyse trace files in parallel. Shards are processed in a process pool,
+    results are merged in order.
+    '''
+    shards = [shard for path in paths for shard in shard_trace(path, shard_size)]
+    result = TraceAggregate()
+    if not shards:
+        return result
+
+    if len(shards) == 1 or workers == 1:
+        return _merge_all(result, (aggregate_shard(shard, variable) for shard in shards))
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        partials = pool.map(aggregate_shard, shards, [variable] * len(shards))
+        return _merge_all(result, partials)
+
+
+def _merge_all(result: TraceAggregate, partials) -> TraceAggregate:
+    for partial in partials:
+        result.merge(partial)
+    return result
+
@@ -0,0 +1,260 @@
+'''
+This module keeps the breakpoints locally, indexed by function OID and line.
+The table is the source of truth: it outlives debugging sessions, is pushed to
+the server in a single round trip when a session starts and every change is
+mirrored to the server as it happens. The server is asked which breakpoints
+it actually took, those are tracked as resources of the session. Breakpoint
+sets can be saved to and loaded from a file.
+'''
+
+import json
+import re
+
+from collections import namedtuple, OrderedDict
+from itertools import count
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from loguru import logger
+
+from lib.loops import STRINGS
+
+
+BreakpointEntry = namedtuple('BreakpointEntry', ['number', 'oid', 'line', 'func', 'enabled'])
+
+# Lines which only open, continue or close a block, execution never stops there
+BLOCK_LINE = re.compile(
+    r'^(?:declare|begin|exception|else|end(?:\s+(?:if|loop|case))?(?:\s+\w+)?\s*;?'
+    r'|(?:elsif|elseif|when)\b.*\bthen|<<\w+>>|\$\w*\$.*)$', re.IGNORECASE)
+
+# How a line ends if the next line starts a statement of its own
+STATEMENT_END = re.compile(r'(?:;|\b(?:then|loop|else|begin|declare|exception)|<<\w+>>|\$\w*\$)$',
+                           re.IGNORECASE)
+
+
+def _code(text: str) -> str:
+    return STRINGS.sub("''", text).split('--')[0].strip()
+
+
+def is_executable(source: List[str], line: int) -> bool:
+    '''
+    Whether the target can stop at a line of the source. Empty lines,
+    comments, lines only opening or closing a block (like `BEGIN`, `ELSE` or
+    `END IF;`) and continuations of a statement spanning several lines, like
+    the `LOOP` of a `FOR` loop, are not executable.
+    '''
+    if not 1 <= line <= len(source):
+        return False
+
+    code = _code(source[line - 1])
+    if not code or BLOCK_LINE.match(code):
+        return False
+
+    for previous in reversed(source[:line - 1]):
+        previous = _code(previous)
+        if previous:
+            return bool(STATEMENT_END.search(previous) or BLOCK_LINE.match(previous))
+
+    return True
+
+
+class BreakpointRegistry:
+    '''
+    Local breakpoint table, mirrored to the session of a proxy if attached.
+    Breakpoints are referred to by number, like in gdb. Breakpoints set on
+    the server are tracked in `resources` if given.
+    '''
+
+    def __init__(self, resources=None):
+        self._entries: Dict[Tuple[int, int], BreakpointEntry] = OrderedDict()
+        self._numbers = count(1)
+        self.proxy = None
+        self.resources = resources
+        self._handles: Dict[Tuple[int, int], int] = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __iter__(self) -> Iterator[BreakpointEntry]:
+        return iter(list(self._entries.values()))
+
+    def entries(self) -> List[BreakpointEntry]:
+        return list(self._entries.values())
+
+    def get(self, oid: int, line: int) -> Optional[BreakpointEntry]:
+        return self._entries.get((oid, line))
+
+    def lines(self, oid: int) -> List[int]:
+        '''
+        Lines of the enabled breakpoints of a function.
+        '''
+        return [entry.line for entry in self if entry.oid == oid and entry.enabled]
+
+    def find(self, numbers: Iterable[int]) -> List[BreakpointEntry]:
+        '''
+        Entries by number. Raises KeyError for unknown numbers.
+        '''
+        by_number = {entry.number: entry for entry in self}
+        missing = [number for number in numbers if number not in by_number]
+        if missing:
+            raise KeyError(f'No breakpoint {", ".join(str(number) for number in missing)}')
+
+        return [by_number[number] for number in numbers]
+
+    def attach(self, proxy):
+        '''
+        Mirror the table to the session of a proxy, setting all enabled
+        breakpoints at once.
+        '''
+        self.proxy = proxy
+        self._push([entry for entry in self if entry.enabled], True)
+
+    def detach(self):
+        '''
+        Forget the session, its breakpoints are released with it.
+        '''
+        self.proxy = None
+        self._handles = {}
+
+    def _verify(self, entries: List[BreakpointEntry]) -> List[BreakpointEntry]:
+        '''
+        The entries the server has a breakpoint for. The others are reported,
+        e.g. the line does not exist or the function was recreated.
+        '''
+        if not entries:
+            return []
+
+        on_server = {(breakpoint.oid, breakpoint.line)
+                     for breakpoint in self.proxy.get_breakpoints()}
+        verified = []
+        for entry in entries:
+            if (entry.oid, entry.line) in on_server:
+                verified.append(entry)
+            else:
+                logger.warning(f'Breakpoint {entry.number} at line {entry.line} of '
+                               f'{entry.func or entry.oid} was not set on the server')
+
+        return verified
+
+    def _push(self, entries: List[BreakpointEntry], enabled: bool):
+        if self.proxy is None:
+            return
+
+        breakpoints = [(entry.oid, entry.line) for entry in entries]
+        if enabled:
+            self.proxy.set_breakpoints(breakpoints)
+            for entry in self._verify(entries):
+                if self.resources is not None and (entry.oid, entry.line) not in self._handles:
+                    self._handles[(entry.oid, entry.line)] = self.resources.track(
+                        'breakpoint', f'{entry.oid}:{entry.line}', None)
+        else:
+            self.proxy.drop_breakpoints(breakpoints)
+            for key in breakpoints:
+                if key in self._handles:
+                    self.resources.release(self._handles.pop(key), close=False)
+
+    def add(self, oid: int, lines: Iterable[int], func: Optional[str] = None,
+            enabled: bool = True) -> List[BreakpointEntry]:
+        '''
+        Add breakpoints to a function, lines which already have one are
+        skipped. Returns the new entries.
+        '''
+        added = []
+        for line in lines:
+            if (oid, line) not in self._entries:
+                entry = BreakpointEntry(next(self._numbers), oid, line, func, enabled)
+                self._entries[(oid, line)] = entry
+                added.append(entry)
+
+        self._push([entry for entry in added if entry.enabled], True)
+        return added
+
+    def _set_enabled(self, entries: List[BreakpointEntry], enabled: bool):
+        changed = [entry for entry in entries if entry.enabled != enabled]
+        for entry in changed:
+            self._entries[(entry.oid, entry.line)] = entry._replace(enabled=enabled)
+
+        self._push(changed, enabled)
+
+    def enable(self, numbers: Iterable[int]):
+        self._set_enabled(self.find(numbers), True)
+
+    def disable(self, numbers: Iterable[int]):
+        self._set_enabled(self.find(numbers), False)
+
+    def _delete(self, entries: List[BreakpointEntry]):
+        for entry in entries:
+            del self._entries[(entry.oid, entry.line)]
+
+        self._push([entry for entry in entries if entry.enabled], False)
+
+    def delete(self, numbers: Iterable[int]):
+        self._delete(self.find(numbers))
+
+    def clear(self, oid: Optional[int] = None):
+        '''
+        Delete all breakpoints, or all of one function.
+        '''
+        self._delete([entry for entry in self if oid is None or entry.oid == oid])
+
+    def replace(self, oid: int, lines: Iterable[int]) -> List[BreakpointEntry]:
+        '''
+        Make the given lines the only breakpoints of a function.
+        '''
+        lines = list(lines)
+        self._delete([entry for entry in self if entry.oid == oid and entry.line not in lines])
+        self.add(oid, lines)
+        return [self._entries[(oid, line)] for line in lines]
+
+    def dump(self, names: Optional[Dict[int, str]] = None) -> List[Dict]:
+        '''
+        All breakpoints as plain data. Function names are included, such that
+        breakpoints survive functions being recreated.
+        '''
+        names = names or {}
+        return [{'func': names.get(entry.oid, entry.func), 'oid': entry.oid,
+                 'line': entry.line, 'enabled': entry.enabled} for entry in self]
+
+    def restore(self, saved: List[Dict],
+                oids: Optional[Dict[str, int]] = None) -> List[BreakpointEntry]:
+        '''
+        Add dumped breakpoints. OIDs are looked up by function name if
+        possible, breakpoints of functions which no longer exist are skipped.
+        Everything is set on the server in one round trip.
+        '''
+        oids = oids or {}
+        by_function = OrderedDict()
+        for breakpoint in saved:
+            func = breakpoint.get('func')
+            oid = oids.get(func, breakpoint['oid'])
+            if oids and func and func not in oids:
+                logger.warning(f'Skipping breakpoint in {func}, the function does not exist')
+                continue
+
+            by_function.setdefault((oid, func, breakpoint.get('enabled', True)), []).append(
+                breakpoint['line'])
+
+        added = []
+        proxy, self.proxy = self.proxy, None
+        try:
+            for (oid, func, enabled), lines in by_function.items():
+                added.extend(self.add(oid, lines, func, enabled))
+        finally:
+            self.proxy = proxy
+
+        self._push([entry for entry in added if entry.enabled], True)
+        return added
+
+    def save(self, path: str, names: Optional[Dict[int, str]] = None):
+        '''
+        Write all breakpoints to a JSON file.
+        '''
+        with open(path, 'w') as breakpoints_file:
+            json.dump({'version': 1, 'breakpoints': self.dump(names)}, breakpoints_file,
+                      indent=1)
+
+    def load(self, path: str, oids: Optional[Dict[str, int]] = None) -> List[BreakpointEntry]:
+        '''
+        Add the breakpoints of a JSON file.
+        '''
+        with open(path, 'r') as breakpoints_file:
+            return self.restore(json.load(breakpoints_file)['breakpoints'], oids)
@@ -0,0 +1,146 @@
+'''
+This module saves the state of the debugger to a local cache file when it
+exits and restores it on the next start: the catalog of functions, sources,
+breakpoints and watches. There is one file per DSN, named by a hash of the
+DSN, such that credentials are never written to disk.
+
+Restoring is validated with a single query: sources are only reused if the
+`xmin` of their function did not change, the catalog only if its fingerprint
+did not change.
+'''
+
+import hashlib
+import json
+import os
+
+from time import perf_counter
+from typing import Any, Dict, Optional
+
+from loguru import logger
+
+from lib.helpers import SQLFunction, get_catalog_state
+
+
+CHECKPOINT_VERSION = 1
+
+CACHE_DIR = os.path.join(os.environ.get('XDG_CACHE_HOME', os.path.expanduser('~/.cache')),
+                         'plpgsql-pydebug')
+
+
+class Checkpoint:
+    '''
+    The cache file of one DSN.
+    '''
+
+    def __init__(self, path: str):
+        self.path = path
+
+    @classmethod
+    def for_dsn(cls, dsn: str, directory: str = CACHE_DIR) -> 'Checkpoint':
+        key = hashlib.sha256(dsn.encode()).hexdigest()[:16]
+        return cls(os.path.join(directory, f'{key}.json'))
+
+    def history_file(self) -> str:
+        '''
+        The command history of the DSN, next to the checkpoint.
+        '''
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        return f'{os.path.splitext(self.path)[0]}.history'
+
+    def load(self) -> Optional[Dict[str, Any]]:
+        try:
+            with open(self.path, 'r') as checkpoint_file:
+                state = json.load(checkpoint_file)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as error:
+            logger.warning(f'Ignoring unreadable checkpoint {self.path}: {error}')
+            return None
+
+        if state.get('version') != CHECKPOINT_VERSION:
+            return None
+
+        return state
+
+    def save(self, state: Dict[str, Any]):
+        '''
+        Write the state, replacing the previous one atomically.
+        '''
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        temporary = f'{self.path}.tmp'
+        with open(temporary, 'w') as checkpoint_file:
+            json.dump(dict(state, version=CHECKPOINT_VERSION), checkpoint_file)
+        os.replace(temporary, self.path)
+
+
+def save_checkpoint(debugger, checkpoint: Checkpoint):
+    '''
+    Save the state of a debugger. Sources are saved with the current `xmin`
+    of their function.
+    '''
+    sources = debugger.source_view.sources()
+    current = get_catalog_state(debugger.database, sources)
+    # Breakpoints set by OID are saved with their function name too
+    names = {function.oid: function.name for function in debugger.catalog.functions()} \
+        if len(debugger.breakpoints) else {}
+
+    state = {
+        'database': current.database,
+        'sources': {str(oid): {'xmin': current.xmins[oid], 'lines': lines}
+                    for oid, lines in sources.items() if oid in current.xmins},
+        'breakpoints': debugger.breakpoints.dump(names),
+        'watches': list(debugger.watches),
+    }
+
+    if debugger.catalog.loaded:
+        state['catalog'] = {'fingerprint': list(debugger.catalog.fingerprint),
+                            'functions': [list(function)
+                                          for function in debugger.catalog.functions()]}
+
+    checkpoint.save(state)
+    logger.debug(f'Saved checkpoint {checkpoint.path}')
+
+
+def restore_checkpoint(debugger, checkpoint: Checkpoint) -> bool:
+    '''
+    Restore the state of a debugger, validating it against the database.
+    Returns whether a checkpoint was restored.
+    '''
+    started = perf_counter()
+    state = checkpoint.load()
+    if state is None:
+        return False
+
+    sources = {int(oid): source for oid, source in state.get('sources', {}).items()}
+    current = get_catalog_state(debugger.database, sources)
+    if current.database != state.get('database'):
+        logger.warning(f'Ignoring checkpoint of database {state.get("database")}')
+        return False
+
+    catalog = state.get('catalog')
+    catalog_valid = bool(catalog) and \
+        tuple(catalog['fingerprint']) == (current.functions, current.xmin_sum)
+    if catalog_valid:
+        debugger.catalog.set([SQLFunction(*function) for function in catalog['functions']],
+                             (current.functions, current.xmin_sum))
+
+    reused = 0
+    for oid, source in sources.items():
+        if current.xmins.get(oid) == source['xmin']:
+            debugger.source_view.remember(oid, source['lines'])
+            reused += 1
+
+    # Functions may have been recreated with new OIDs, look them up by name
+    oids = None
+    if state.get('breakpoints') and not catalog_valid:
+        oids = {function.name: function.oid for function in debugger.catalog.functions()}
+    debugger.breakpoints.restore(state.get('breakpoints', []), oids)
+
+    for expression in state.get('watches', []):
+        debugger.watches.add(expression)
+
+    logger.debug(f'Restored checkpoint in {(perf_counter() - started) * 1000:.1f} ms: '
+                 f'catalog {"valid" if catalog_valid else "stale"}, '
+                 f'{reused}/{len(sources)} sources, {len(debugger.breakpoints)} breakpoints, '
+                 f'{len(debugger.watches)} watches')
+    return True
@@ -1,84 +1,284 @@
 
 
 from collections import namedtuple, OrderedDict
-from pprint import pprint
-from typing import Generator, List, Tuple
+from typing import Callable, Dict, Iterable, List, Optional, Tuple, Union
 
 from loguru import logger
-from prompt_toolkit.document import Document
-from prompt_toolkit.completion import Completer, Completion, CompleteEvent
 
-from lib.formatters import print_source
+from lib.formatters import (print_breakpoints, print_fanout_report, print_growth,
+                            print_profile, print_resources, print_result_stats,
+                            print_slow_report, print_source, print_sql_stats, print_stack,
+                            print_trace_report, print_value, print_variables, print_waits,
+                            print_watches)
 
 
 Command = namedtuple('Command', ['func', 'prereq', 'return_func'])
 
+# Describes a single positional argument of a command. If `rest` is set, the
+# argument consumes all remaining words, joined by spaces.
+Argument = namedtuple('Argument', ['name', 'type', 'required', 'rest'],
+                      defaults=[True, False])
+
 
 class Commands(OrderedDict):
     def __init__(self, command_list: dict):
         super().__init__(command_list)
+        self.version = 0
+        self.aliases = {}
+        for name, command in self.items():
+            for alias in command.get('aliases', []):
+                self.aliases[alias] = name
+
         logger.info(self.keys())
 
     @property
     def help(self):
         return [(key, command['help']) for key, command in self.items()]
 
+    @property
+    def names(self) -> List[str]:
+        '''
+        All command names, including aliases.
+        '''
+        return list(self.keys()) + list(self.aliases.keys())
+
+    def resolve(self, name: str) -> str:
+        '''
+        Return the name of the command an alias points to.
+        '''
+        return self.aliases.get(name, name)
+
+    def register(self, name: str, func: Union[str, Callable], help: str,
+                 prereq: Optional[str] = None, return_func: Optional[Callable] = None,
+                 aliases: Iterable[str] = (), args: Iterable[Argument] = (),
+                 actions: Optional[Dict[str, List[Argument]]] = None):
+        '''
+        Register an additional command. `func` is either a dotted attribute
+        path on the debugger (like `proxy.cont`) or a callable which gets the
+        debugger passed as first argument. Bumps `version` so dispatchers
+        recompile their tables.
+
+        Commands whose first argument is an action (like `profile export`) map
+        every action to the arguments following it in `actions`. Those are
+        passed to the command by name, e.g. `profile export pprof out` calls
+        `_profile_wrapper('export', fmt='pprof', path='out')`.
+        '''
+        self[name] = {
+            'command': Command(func, prereq, return_func),
+            'help': help,
+            'aliases': list(aliases),
+            'args': list(args),
+            'actions': actions,
+        }
+        for alias in aliases:
+            self.aliases[alias] = name
+
+        self.version += 1
+
 
 COMMANDS = Commands({
+    'analyze': {
+        'command': Command('_analyze_wrapper', None, print_trace_report),
+        'help': ('Analyse trace files: analyze <trace files> [--var <variable>] '
+                 '[--top <n>] [--workers <n>]')
+    },
+    'brclear': {
+        'command': Command('breakpoints.clear', None, None),
+        'help': 'Delete all breakpoints'
+    },
+    'brdelete': {
+        'command': Command('_delete_breakpoints_wrapper', None, None),
+        'help': 'Delete breakpoints by number',
+        'aliases': ['brdel'],
+    },
+    'brdisable': {
+        'command': Command('_disable_breakpoints_wrapper', None, None),
+        'help': 'Disable breakpoints by number, they are kept but not hit'
+    },
+    'brenable': {
+        'command': Command('_enable_breakpoints_wrapper', None, None),
+        'help': 'Enable disabled breakpoints by number'
+    },
+    'brload': {
+        'command': Command('_load_breakpoints_wrapper', None, print_breakpoints),
+        'help': 'Load breakpoints from a file',
+        'args': [Argument('path', str, rest=True)],
+    },
+    'brsave': {
+        'command': Command('_save_breakpoints_wrapper', None, None),
+        'help': 'Save all breakpoints to a file',
+        'args': [Argument('path', str, rest=True)],
+    },
+    'breakslow': {
+        'command': Command('_break_slow_wrapper', 'active_session', print_slow_report),
+        'help': ('Step over statements until one takes longer than <ms>, '
+                 'breakslow [<ms>] [<top>]; shows the slowest lines so far'),
+        'args': [Argument('threshold_ms', float, required=False),
+                 Argument('top', int, required=False)],
+    },
     'brshow': {
-        'command': Command('proxy.get_breakpoints', 'active_session', pprint),
+        'command': Command('breakpoints.entries', None, print_breakpoints),
         'help': 'Show all breakpoints'
     },
     'brset': {
-        'command': Command('_set_breakpoint_wrapper', 'active_session', None),
-        'help': 'Set a breakpoint'
+        'command': Command('_set_breakpoint_wrapper', 'active_session', print_breakpoints),
+        'help': 'Set breakpoints in the current function: brset <line> [<line> ...]'
     },
     'continue': {
         'command': Command('proxy.cont', 'active_session', None),
         'help': 'Continue until the next breakpoint'
     },
+    'deposit': {
+        'command': Command('_deposit_wrapper', 'active_session', None),
+        'help': 'Change the value of a variable in the selected frame: deposit <name> <value>',
+        'args': [Argument('name', str), Argument('value', str, rest=True)],
+    },
+    'down': {
+        'command': Command('_down_wrapper', 'active_session', print_stack),
+        'help': 'Select the frame called by the selected frame'
+    },
     'exit': {
         'help': 'Exit the debugger'
     },
+    'fanout': {
+        'command': Command('_fanout_wrapper', None, print_fanout_report),
+        'help': ('Debug-run a function for many inputs in parallel: '
+                 'fanout <func> --args-file <file> [--trace-dir <dir>] '
+                 '[--connections <n>] [--max-steps <n>]')
+    },
+    'frame': {
+        'command': Command('_frame_wrapper', 'active_session', print_stack),
+        'help': 'Select a frame of the stack by its level',
+        'args': [Argument('level', int)],
+    },
     'func': {
         'command': Command('show_all_functions', None, None),
         'help': 'Show all functions'
     },
+    'growth': {
+        'command': Command('_growth_wrapper', None, print_growth),
+        'help': ('Track the sizes of variables at every stop inside loops and flag those '
+                 'growing super-linearly, growth [on|off|reset]'),
+        'args': [Argument('action', str, required=False)],
+    },
     'help': {
         # This should be intercepted in run.py
         'help': 'Show help'
     },
+    'loop': {
+        'command': Command('_loop_wrapper', 'active_session', logger.info),
+        'help': 'Run the innermost loop up to the start of iteration <n>',
+        'args': [Argument('iteration', int)],
+    },
+    'print': {
+        'command': Command('_print_variable_wrapper', 'active_session', print_value),
+        'help': 'Print a variable in full, e.g. print var[3].field',
+        'args': [Argument('path', str, rest=True)],
+    },
+    'profile': {
+        'command': Command('_profile_wrapper', None, print_profile),
+        'help': ('Profile lines and call stacks and export them for KCachegrind, speedscope '
+                 'or pprof, profile [record [<max steps>]|load <traces>|'
+                 'export callgrind|speedscope|pprof <path>|reset]'),
+        'args': [Argument('action', str, required=False)],
+        'actions': {
+            'record': [Argument('max_steps', int, required=False)],
+            'load': [Argument('traces', str, rest=True)],
+            'export': [Argument('fmt', str), Argument('path', str)],
+            'reset': [],
+        },
+    },
+    'resources': {
+        'command': Command('resources.live', None, print_resources),
+        'help': 'Show connections, listeners and breakpoints held by the debugger'
+    },
+    'results': {
+        'command': Command('_results_wrapper', None, print_result_stats),
+        'help': ('Where rows returned by the function go, fetched in batches, '
+                 'results log|discard|file <path> [<fetch size>]'),
+        'args': [Argument('kind', str, required=False)],
+        'actions': {
+            'log': [Argument('fetch_size', int, required=False)],
+            'discard': [Argument('fetch_size', int, required=False)],
+            'file': [Argument('path', str), Argument('fetch_size', int, required=False)],
+        },
+    },
     'run': {
         'command': Command('_start_debug_session_wrapper', None, None),
-        'help': 'Run a function call and attach'
+        'help': 'Run a function call and attach',
+        'args': [Argument('call', str, rest=True)],
     },
     'si': {
-        'command': Command('proxy.step_into', 'active_session', logger.info),
-        'help': 'Step into the next function or pause at the next executable statement'
+        'command': Command('_step_into_wrapper', 'active_session', logger.info),
+        'help': ('Step into the next function or pause at the next executable statement, '
+                 'si [count] [until <predicate>] steps many times in one round trip')
+    },
+    'skiploop': {
+        'command': Command('_skip_loop_wrapper', 'active_session', logger.info),
+        'help': 'Run the innermost loop to its end, stops at breakpoints'
     },
     'so': {
-        'command': Command('proxy.step_over', 'active_session', logger.info),
-        'help': 'Step over the next function and pause at the next executable statement'
+        'command': Command('_step_over_wrapper', 'active_session', logger.info),
+        'help': ('Step over the next function and pause at the next executable statement, '
+                 'so [count] [until <predicate>] steps many times in one round trip')
     },
     'source': {
-        'command': Command('_get_source_wrapper', 'active_session', print_source),
-        'help': 'Show the source of the current active function'
+        'command': Command('_show_source_wrapper', 'active_session', print_source),
+        'help': 'Show the source around the current line, page with + and -',
+        'args': [Argument('position', str, required=False)],
+    },
+    'sqlstats': {
+        'command': Command('_sql_stats_wrapper', None, print_sql_stats),
+        'help': ('Attribute pg_stat_statements deltas to source lines, '
+                 'sqlstats [on|off|reset], shown next to source'),
+        'args': [Argument('action', str, required=False)],
     },
     'stack': {
-        'command': Command('proxy.get_stack', 'active_session', pprint),
-        'help': 'Show the current stack'
+        'command': Command('stack.entries', 'active_session', print_stack),
+        'help': 'Show the current stack, the selected frame is marked'
+    },
+    'stepper': {
+        'command': Command('_stepper_wrapper', None, None),
+        'help': ('Show whether steps are batched on the server, stepper install creates '
+                 'the helper function for it'),
+        'args': [Argument('action', str, required=False)],
     },
     'stop': {
         'command': Command('stop_debug_session', None, None),
-        'help': 'Stop debugging the current active target'
+        'help': 'Stop debugging the current active target',
+        'aliases': ['abort', 'exit', 'quit'],
+    },
+    'unwatch': {
+        'command': Command('_unwatch_wrapper', None, None),
+        'help': 'Remove a watch by expression or number',
+        'args': [Argument('watch', str, rest=True)],
+    },
+    'up': {
+        'command': Command('_up_wrapper', 'active_session', print_stack),
+        'help': 'Select the caller of the selected frame'
     },
     'vars': {
-        'command': Command('proxy.get_variables', 'active_session', pprint),
-        'help': 'Show variables of the current frame'
+        'command': Command('variables.summary', 'active_session', print_variables),
+        'help': 'Show variables of the current frame, values are truncated'
+    },
+    'waits': {
+        'command': Command('_waits_wrapper', None, print_waits),
+        'help': ('Sample wait events and locks of the target while it runs, '
+                 'waits [on [<interval ms>]|off|reset]; shows them per line'),
+        'args': [Argument('action', str, required=False),
+                 Argument('interval_ms', float, required=False)],
+    },
+    'watch': {
+        'command': Command('_watch_wrapper', None, print_watches),
+        'help': 'Watch a variable or SQL expression, values are shown after every stop',
+        'args': [Argument('expression', str, required=False, rest=True)],
     },
 })
 
 
+register_command = COMMANDS.register
+
+
 def parse_command(command: str) -> Tuple[str,List]:
     command, _, args = command.partition(' ')
 
@@ -87,17 +287,3 @@ def parse_command(command: str) -> Tuple[str,List]:
         args = []
 
     return command, args
-
-
-class CommandCompleter(Completer):
-    def __init__(self):
-        self.command_keys = list(COMMANDS.keys())
-
-    def get_completions(self, document: Document,
-                        complete_event: CompleteEvent) -> Generator[Completion, None, None]:
-        check = document.text
-        matches = [key for key in self.command_keys if key.startswith(check)]
-        for match in matches:
-            meta_text = COMMANDS[match]['help']
-            position = document.cursor_position
-            yield Completion(match, start_position=-position, display_meta=meta_text)
@@ -0,0 +1,270 @@
+'''
+This module completes what is typed at the prompt: command names, and
+depending on the command, function names, variable names or line numbers.
+
+Names are kept in a burst trie: a node branches on one character per level
+and its words are kept as a sorted list of suffixes until there are too many
+of them, only then the node is split by the next character. Looking up a
+prefix walks at most one node per character and then bisects a short list,
+so completing against tens of thousands of functions takes microseconds,
+while the trie stays about as small as the list of names.
+
+Completion runs on every keystroke, hence it only uses what the debugger
+fetched already. The database is only asked when Tab is pressed.
+'''
+
+from bisect import bisect_left
+from typing import Any, Dict, Generator, Iterable, List, Optional, Tuple
+
+from prompt_toolkit.completion import CompleteEvent, Completer, Completion
+from prompt_toolkit.document import Document
+
+from lib.commands import COMMANDS
+from lib.variables import truncate
+
+
+# Words kept in a node before it is split
+BURST_SIZE = 64
+
+# Completions offered at most, the menu cannot show more anyway
+MAX_COMPLETIONS = 100
+
+# What the arguments of a command complete to. Breakpoints take any number of
+# lines, all other commands only complete their first argument.
+ARGUMENT_KINDS = {
+    'brset': 'line',
+    'deposit': 'variable',
+    'fanout': 'function',
+    'print': 'variable',
+    'run': 'function',
+    'source': 'line',
+    'watch': 'variable',
+}
+EVERY_ARGUMENT = {'brset'}
+
+
+class _Node:
+    __slots__ = ('children', 'bucket', 'values')
+
+    def __init__(self):
+        # Either `children` maps characters to nodes, or the node is a leaf
+        # and `bucket` holds sorted (suffix, value) pairs
+        self.children: Optional[Dict[str, '_Node']] = None
+        self.bucket: List[Tuple[str, Any]] = []
+        # Values of words ending at a split node
+        self.values: List[Any] = []
+
+
+class PrefixTrie:
+    '''
+    Maps words to values and finds all words starting with a prefix, in
+    sorted order. A word can be inserted more than once.
+    '''
+
+    def __init__(self, items: Iterable[Tuple[str, Any]] = ()):
+        self._root = _Node()
+        self._size = 0
+        for word, value in sorted(items, key=lambda item: item[0]):
+            self.insert(word, value)
+
+    def __len__(self) -> int:
+        return self._size
+
+    def insert(self, word: str, value: Any = None):
+        node = self._root
+        depth = 0
+        while node.children is not None:
+            if depth == len(word):
+                node.values.append(value)
+                self._size += 1
+                return
+
+            node = node.children.setdefault(word[depth], _Node())
+            depth += 1
+
+        suffix = word[depth:]
+        # Inserting in sorted order, like the constructor does, only appends
+        if node.bucket and node.bucket[-1][0] > suffix:
+            node.bucket.insert(bisect_left(node.bucket, (suffix,)), (suffix, value))
+        else:
+            node.bucket.append((suffix, value))
+        self._size += 1
+
+        if len(node.bucket) > BURST_SIZE:
+            self._burst(node)
+
+    def _burst(self, node: _Node):
+        node.children = {}
+        for suffix, value in node.bucket:
+            if not suffix:
+                node.values.append(value)
+            else:
+                child = node.children.setdefault(suffix[0], _Node())
+                child.bucket.append((suffix[1:], value))
+
+        node.bucket = []
+        for child in node.children.values():
+            if len(child.bucket) > BURST_SIZE:
+                self._burst(child)
+
+    def _collect(self, node: _Node, word: str, limit: int,
+                 found: List[Tuple[str, Any]]):
+        if node.children is None:
+            for suffix, value in node.bucket:
+                if len(found) >= limit:
+                    return
+                found.append((word + suffix, value))
+            return
+
+        for value in node.values:
+            if len(found) >= limit:
+                return
+            found.append((word, value))
+
+        for char in sorted(node.children):
+            if len(found) >= limit:
+                return
+            self._collect(node.children[char], word + char, limit, found)
+
+    def prefix(self, prefix: str, limit: int = MAX_COMPLETIONS) -> List[Tuple[str, Any]]:
+        '''
+        Up to `limit` (word, value) pairs of the words starting with `prefix`.
+        '''
+        node = self._root
+        depth = 0
+        while node.children is not None and depth < len(prefix):
+            node = node.children.get(prefix[depth])
+            if node is None:
+                return []
+            depth += 1
+
+        if node.children is not None:
+            found = []
+            self._collect(node, prefix, limit, found)
+            return found
+
+        rest = prefix[depth:]
+        found = []
+        for index in range(bisect_left(node.bucket, (rest,)), len(node.bucket)):
+            suffix, value = node.bucket[index]
+            if not suffix.startswith(rest) or len(found) >= limit:
+                break
+            found.append((prefix[:depth] + suffix, value))
+
+        return found
+
+
+def function_trie(functions) -> PrefixTrie:
+    '''
+    Index functions by their name without the argument types, overloaded
+    functions share a name.
+    '''
+    return PrefixTrie((function.name.partition('(')[0], function.name)
+                      for function in functions)
+
+
+def _is_code(line: str) -> bool:
+    stripped = line.strip()
+    return bool(stripped) and not stripped.startswith('--')
+
+
+class CommandCompleter(Completer):
+    '''
+    Completes command names and, if a debugger is given, their arguments.
+    '''
+
+    def __init__(self, debugger=None):
+        self.debugger = debugger
+        self._commands: Optional[PrefixTrie] = None
+        self._commands_version = None
+        self._functions: Optional[PrefixTrie] = None
+        self._functions_version = None
+
+    @property
+    def command_keys(self) -> List[str]:
+        return COMMANDS.names
+
+    @property
+    def commands(self) -> PrefixTrie:
+        if self._commands is None or self._commands_version != COMMANDS.version:
+            self._commands = PrefixTrie((name, COMMANDS.resolve(name))
+                                        for name in self.command_keys)
+            self._commands_version = COMMANDS.version
+
+        return self._commands
+
+    def functions(self, catalog) -> PrefixTrie:
+        if self._functions is None or self._functions_version != catalog.version:
+            self._functions = function_trie(catalog.functions())
+            self._functions_version = catalog.version
+
+        return self._functions
+
+    def get_completions(self, document: Document,
+                        complete_event: CompleteEvent) -> Generator[Completion, None, None]:
+        text = document.text_before_cursor
+        command, separator, rest = text.partition(' ')
+        if not separator:
+            for name, resolved in self.commands.prefix(command):
+                yield Completion(name, start_position=-len(command),
+                                 display_meta=COMMANDS[resolved]['help'])
+            return
+
+        command = COMMANDS.resolve(command)
+        kind = ARGUMENT_KINDS.get(command)
+        words = rest.split(' ')
+        if self.debugger is None or kind is None:
+            return
+        if len(words) > 1 and command not in EVERY_ARGUMENT:
+            return
+
+        explicit = complete_event.completion_requested
+        yield from getattr(self, f'_complete_{kind}')(words[-1], explicit)
+
+    def _complete_function(self, word: str,
+                           explicit: bool) -> Generator[Completion, None, None]:
+        catalog = self.debugger.catalog
+        if not catalog.loaded and not explicit:
+            return
+
+        previous = None
+        for name, signature in self.functions(catalog).prefix(word):
+            if name == previous:
+                continue
+            previous = name
+            yield Completion(f'{name}(', start_position=-len(word), display=name,
+                             display_meta=signature)
+
+    def _complete_variable(self, word: str,
+                           explicit: bool) -> Generator[Completion, None, None]:
+        # Only the variable itself, not a path into it
+        if not self.debugger.active_session() or '[' in word or '.' in word:
+            return
+
+        variables = self.debugger.variables.cached()
+        if variables is None and explicit:
+            variables = self.debugger.variables.get_variables()
+
+        for name, variable in (variables or {}).items():
+            if name.startswith(word):
+                yield Completion(name, start_position=-len(word),
+                                 display_meta=truncate(variable.value, 40))
+
+    def _complete_line(self, word: str, explicit: bool) -> Generator[Completion, None, None]:
+        if not self.debugger.active_session() or not word.isdigit() and word:
+            return
+
+        location = self.debugger.stack.location()
+        oid = location.oid if location else self.debugger.target.oid
+        lines = self.debugger.source_view.cached_lines(oid)
+        if lines is None and explicit:
+            lines = self.debugger.source_view.get_lines(self.debugger.proxy, oid)
+
+        found = 0
+        for number, line in enumerate(lines or [], 1):
+            if found >= MAX_COMPLETIONS:
+                return
+            if _is_code(line) and str(number).startswith(word):
+                found += 1
+                yield Completion(str(number), start_position=-len(word),
+                                 display_meta=line.strip())
@@ -0,0 +1,449 @@
+'''
+This module implements a headless Debug Adapter Protocol (DAP) server, such
+that IDEs like VS Code can drive the debugger. Messages are read and written
+asynchronously over stdio or a TCP socket, while all calls into the debugger
+run on a single worker thread, one after another. Events like `stopped` or
+`output` for notices of the target are pushed as soon as they happen.
+
+IDEs send the same read-only requests (stack, scopes, variables, ...) many
+times per stop. Those are answered once per stop, concurrent duplicates wait
+for the request already in flight.
+
+DAP has no authentication, whoever connects can run SQL in the database.
+Hence the TCP server only listens on loopback addresses, reach it from other
+machines through an SSH tunnel.
+'''
+
+import asyncio
+import json
+import sys
+
+from concurrent.futures import ThreadPoolExecutor
+from itertools import count
+from threading import Thread
+from typing import Any, Dict, List, Optional
+
+from loguru import logger
+
+from lib.breakpoints import is_executable
+from lib.helpers import is_loopback
+
+
+# There is only one thread of execution in a target
+THREAD_ID = 1
+
+# Read-only requests which are answered once per stop
+COALESCED = ('threads', 'stackTrace', 'scopes', 'variables', 'source')
+
+# Requests which resume the target and the proxy function doing so
+RESUMING = {'next': 'step_over', 'stepIn': 'step_into', 'continue': 'cont'}
+
+# Put into the notice queue of a target to stop forwarding its notices
+STOP_PUMP = object()
+
+
+async def read_message(reader: asyncio.StreamReader) -> Optional[Dict[str, Any]]:
+    '''
+    Read one message framed by a `Content-Length` header. Returns None when
+    the client closed the stream.
+    '''
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if not line:
+            return None
+
+        line = line.decode().strip()
+        if not line:
+            break
+
+        name, _, value = line.partition(':')
+        headers[name.strip().lower()] = value.strip()
+
+    body = await reader.readexactly(int(headers['content-length']))
+    return json.loads(body)
+
+
+def encode_message(message: Dict[str, Any]) -> bytes:
+    body = json.dumps(message).encode()
+    return f'Content-Length: {len(body)}\r\n\r\n'.encode() + body
+
+
+class DapSession:
+    '''
+    Serves one client. Maps DAP requests onto the debugger and its proxy.
+    '''
+
+    def __init__(self, debugger, reader: asyncio.StreamReader, writer):
+        self.debugger = debugger
+        self.reader = reader
+        self.writer = writer
+        self._seq = count(1)
+        self._worker = ThreadPoolExecutor(max_workers=1)
+        self._loop = None
+
+        # Responses of coalesced requests of the current stop, by request
+        self._coalesced: Dict[tuple, asyncio.Future] = {}
+        # Variable references of the current stop: reference -> (frame, path)
+        self._references: Dict[int, tuple] = {}
+        self._reference_ids: Dict[tuple, int] = {}
+
+        self._stop_on_entry = True
+        self._running = True
+
+        self.handlers = {
+            'initialize': self.initialize,
+            'launch': self.launch,
+            'configurationDone': self.configuration_done,
+            'setBreakpoints': self.set_breakpoints,
+            'disconnect': self.disconnect,
+            'threads': self.threads,
+            'stackTrace': self.stack_trace,
+            'source': self.source,
+            'scopes': self.scopes,
+            'variables': self.variables,
+        }
+
+    async def _call(self, func, *args):
+        '''
+        Run a blocking call into the debugger on the worker thread.
+        '''
+        return await self._loop.run_in_executor(self._worker, func, *args)
+
+    async def send(self, message: Dict[str, Any]):
+        message['seq'] = next(self._seq)
+        self.writer.write(encode_message(message))
+        await self.writer.drain()
+
+    async def send_event(self, event: str, body: Optional[Dict[str, Any]] = None):
+        await self.send({'type': 'event', 'event': event, 'body': body or {}})
+
+    async def respond(self, request: Dict[str, Any], body: Any = None,
+                      error: Optional[str] = None):
+        response = {'type': 'response', 'request_seq': request['seq'],
+                    'command': request['command'], 'success': error is None}
+        if error is None:
+            response['body'] = body or {}
+        else:
+            response['message'] = error
+        await self.send(response)
+
+    async def serve(self):
+        '''
+        Handle requests until the client disconnects. Every request is handled
+        in its own task, such that duplicates can be coalesced.
+        '''
+        self._loop = asyncio.get_running_loop()
+        tasks = set()
+
+        try:
+            while self._running:
+                request = await read_message(self.reader)
+                if request is None:
+                    break
+
+                if request.get('type') != 'request':
+                    continue
+
+                task = asyncio.ensure_future(self.handle(request))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+
+            if tasks:
+                await asyncio.gather(*tasks)
+
+        finally:
+            if self._running:
+                await self._call(self._stop_session)
+            self._worker.shutdown(wait=True)
+
+    async def handle(self, request: Dict[str, Any]):
+        command = request['command']
+        arguments = request.get('arguments') or {}
+        logger.debug(f'DAP request: {command} {arguments}')
+
+        if command in RESUMING:
+            # Requests following this one must not get responses of this stop
+            self._coalesced = {}
+            body = {'allThreadsContinued': True} if command == 'continue' else {}
+            await self.respond(request, body)
+            await self.resume(RESUMING[command])
+            return
+
+        handler = self.handlers.get(command)
+        if handler is None:
+            await self.respond(request, error=f'Unsupported request {command}')
+            return
+
+        try:
+            if command in COALESCED:
+                body = await self.coalesce(command, arguments, handler)
+            else:
+                body = await handler(arguments)
+
+        except Exception as error:
+            logger.error(f'DAP request {command} failed: {error}')
+            await self.respond(request, error=str(error))
+            return
+
+        await self.respond(request, body)
+
+        if command == 'initialize':
+            await self.send_event('initialized')
+        elif command == 'configurationDone':
+            await self.resume('step_into' if self._stop_on_entry else 'cont', 'entry')
+
+    def coalesce(self, command: str, arguments: Dict[str, Any], handler) -> asyncio.Future:
+        '''
+        Answer a read-only request once per stop. Duplicates share the future
+        of the first request, whether it is still in flight or done.
+        '''
+        key = (command, json.dumps(arguments, sort_keys=True))
+        future = self._coalesced.get(key)
+        if future is None or (future.done() and future.exception()):
+            future = asyncio.ensure_future(self._call(handler, arguments))
+            self._coalesced[key] = future
+
+        return asyncio.shield(future)
+
+    def _step(self, method: str):
+        '''
+        Resume the target on the worker thread. Variable references are only
+        valid for one stop and are dropped as well.
+        '''
+        position = getattr(self.debugger.proxy, method)()
+        self._references = {}
+        self._reference_ids = {}
+        return position
+
+    async def resume(self, method: str, reason: str = 'step'):
+        '''
+        Resume the target and report where it stopped, or that it finished.
+        '''
+        if not self.debugger.active_session():
+            await self.send_event('terminated')
+            return
+
+        try:
+            position = await self._call(self._step, method)
+        except Exception as error:
+            logger.error(f'Resuming the target failed: {error}')
+            position = None
+
+        if position is None:
+            await self._call(self._stop_session)
+            await self.send_event('terminated')
+            return
+
+        if method == 'cont':
+            reason = 'breakpoint'
+
+        await self.send_event('stopped', {'reason': reason, 'threadId': THREAD_ID,
+                                          'allThreadsStopped': True})
+
+    async def initialize(self, arguments: Dict[str, Any]) -> Dict[str, Any]:
+        return {'supportsConfigurationDoneRequest': True}
+
+    async def launch(self, arguments: Dict[str, Any]) -> Dict[str, Any]:
+        '''
+        Start the function call given as `call`, e.g. `"call": "foo(1)"`.
+        '''
+        if 'call' not in arguments:
+            raise ValueError('Missing function call to debug, e.g. "call": "foo(1)"')
+
+        self._stop_on_entry = arguments.get('stopOnEntry', True)
+        await self._call(self.debugger._start_debug_session_wrapper, arguments['call'])
+        if not self.debugger.active_session():
+            raise RuntimeError(f'Could not start {arguments["call"]}')
+
+        Thread(target=self._pump_notices, args=(self.debugger.target,), daemon=True).start()
+        return {}
+
+    async def configuration_done(self, arguments: Dict[str, Any]) -> Dict[str, Any]:
+        return {}
+
+    async def disconnect(self, arguments: Dict[str, Any]) -> Dict[str, Any]:
+        self._running = False
+        await self._call(self._stop_session)
+        return {}
+
+    def _stop_session(self):
+        '''
+        Stop the debugging session and wake up the notice pump of its target.
+        '''
+        target = self.debugger.target
+        self.debugger.stop_debug_session()
+        if target is not None:
+            target.notice_queue.put_nowait(STOP_PUMP)
+
+    def _pump_notices(self, target):
+        '''
+        Forward notices of the target as output events until the session ends.
+        Runs in its own thread, blocking on the notice queue until
+        `_stop_session` wakes it up.
+        '''
+        # Notices read while the target started come first
+        notices, target.pending_notices = target.pending_notices, []
+        for notice in notices:
+            self._send_notice(notice)
+
+        while True:
+            notice = target.notice_queue.get()
+            if notice is STOP_PUMP:
+                break
+
+            self._send_notice(notice)
+
+    def _send_notice(self, notice: str):
+        asyncio.run_coroutine_threadsafe(
+            self.send_event('output', {'category': 'console', 'output': notice}),
+            self._loop)
+
+    async def set_breakpoints(self, arguments: Dict[str, Any]) -> Dict[str, Any]:
+        '''
+        Replace the breakpoints of one function. Sources are identified by the
+        function OID as source reference, or by the function name.
+        '''
+        source = arguments.get('source', {})
+        oid = source.get('sourceReference')
+        if not oid and source.get('name'):
+            oid = await self._call(self.debugger.catalog.oid, source['name'].partition('(')[0])
+
+        lines = [breakpoint['line'] for breakpoint in arguments.get('breakpoints', [])]
+        if not oid:
+            return {'breakpoints': [{'verified': False, 'line': line,
+                                     'message': 'Unknown function'} for line in lines]}
+
+        return {'breakpoints': await self._call(self._set_function_breakpoints, oid, lines)}
+
+    def _set_function_breakpoints(self, oid: int, lines: List[int]) -> List[Dict[str, Any]]:
+        '''
+        Replace the breakpoints of a function in the registry. Lines are only
+        validated once a session is active, before that they are kept as they
+        are and set on launch.
+        '''
+        if self.debugger.active_session():
+            source = self.debugger.source_view.get_lines(self.debugger.proxy, oid)
+            valid = [line for line in lines if is_executable(source, line)]
+        else:
+            valid = lines
+
+        self.debugger.breakpoints.replace(oid, valid)
+        return [{'verified': bool(self.debugger.active_session()) and line in valid,
+                 'line': line} for line in lines]
+
+    def _reference(self, frame: int, path: Optional[str]) -> int:
+        key = (frame, path)
+        if key not in self._reference_ids:
+            self._reference_ids[key] = len(self._references) + 1
+            self._references[self._reference_ids[key]] = key
+
+        return self._reference_ids[key]
+
+    def threads(self, arguments: Dict[str, Any]) -> Dict[str, Any]:
+        return {'threads': [{'id': THREAD_ID, 'name': 'target'}]}
+
+    def stack_trace(self, arguments: Dict[str, Any]) -> Dict[str, Any]:
+        entries = self.debugger.stack.entries()
+        frames = [{'id': entry.level, 'name': entry.name, 'line': entry.line, 'column': 1,
+                   'source': {'name': entry.name, 'sourceReference': entry.oid}}
+                  for entry in entries]
+        return {'stackFrames': frames, 'totalFrames': len(frames)}
+
+    def source(self, arguments: Dict[str, Any]) -> Dict[str, Any]:
+        oid = arguments.get('sourceReference') or arguments['source']['sourceReference']
+        lines = self.debugger.source_view.get_lines(self.debugger.proxy, oid)
+        return {'content': '\n'.join(lines)}
+
+    def scopes(self, arguments: Dict[str, Any]) -> Dict[str, Any]:
+        return {'scopes': [{'name': 'Locals', 'expensive': False,
+                            'variablesReference': self._reference(arguments['frameId'], None)}]}
+
+    def variables(self, arguments: Dict[str, Any]) -> Dict[str, Any]:
+        '''
+        Variables of a frame, or the children of an expandable variable.
+        Children get a reference only if they can be expanded themselves.
+        '''
+        frame, path = self._references[arguments['variablesReference']]
+        self.debugger.stack.select(frame)
+        inspector = self.debugger.variables
+
+        if path is None:
+            variables = inspector.get_variables()
+            types = inspector.get_types(variable.dtype for variable in variables.values())
+            children = [(name, name, variable.value,
+                         inspector.is_expandable(variable.dtype, variable.value),
+                         types[variable.dtype].name if variable.dtype in types else None)
+                        for name, variable in variables.items()]
+        else:
+            children = [child + (None,) for child in inspector.children(path)]
+
+        result = []
+        for label, child_path, value, expandable, type_name in children:
+            if value is None:
+                value = 'NULL'
+            elif not isinstance(value, str):
+                value = json.dumps(value)
+
+            variable = {'name': label, 'value': value,
+                        'variablesReference': self._reference(frame, child_path)
+                        if expandable else 0}
+            if type_name:
+                variable['type'] = type_name
+            result.append(variable)
+
+        return {'variables': result}
+
+
+async def _serve_stdio(debugger):
+    loop = asyncio.get_running_loop()
+    reader = asyncio.StreamReader()
+    await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), sys.stdin)
+    transport, protocol = await loop.connect_write_pipe(
+        asyncio.streams.FlowControlMixin, sys.stdout)
+    writer = asyncio.StreamWriter(transport, protocol, reader, loop)
+
+    await DapSession(debugger, reader, writer).serve()
+
+
+def serve_stdio(debugger):
+    '''
+    Serve a single client over stdin and stdout.
+    '''
+    asyncio.run(_serve_stdio(debugger))
+
+
+async def _serve_tcp(debugger, host: str, port: int):
+    # There is only one debugger, hence clients are served one after another
+    lock = asyncio.Lock()
+
+    async def _client(reader, writer):
+        async with lock:
+            logger.info('DAP client connected')
+            try:
+                await DapSession(debugger, reader, writer).serve()
+            finally:
+                writer.close()
+            logger.info('DAP client disconnected')
+
+    server = await asyncio.start_server(_client, host, port)
+    logger.info(f'Serving DAP on {host}:{port}')
+    async with server:
+        await server.serve_forever()
+
+
+def check_address(host: str):
+    '''
+    Refuse to serve on an address reachable from other machines.
+    '''
+    if not is_loopback(host):
+        raise ValueError(f'Refusing to serve DAP on {host}, it has no authentication, '
+                         'tunnel to 127.0.0.1 over SSH instead')
+
+
+def serve_tcp(debugger, host: str, port: int):
+    '''
+    Serve clients connecting to the given port, one at a time.
+    '''
+    check_address(host)
+    asyncio.run(_serve_tcp(debugger, host, port))
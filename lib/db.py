@@ -25,6 +25,15 @@ class DB:
         self._conn = DB._get_conn(dsn, is_async)
         self.pid = self._conn.get_backend_pid()
 
+    def has_extension(self, name: str = 'pldbgapi') -> bool:
+        '''
+        Check whether an extension is installed in the current database. This
+        is a read-only catalog lookup and does not require DDL privileges.
+        '''
+        result = self.run_sql(
+            f"SELECT 1 FROM pg_extension WHERE extname = '{name}'", fetch_result=True)
+        return bool(result)
+
     def try_load_extension(self):
         '''
         Tries to load the `pldbgapi` extension. Exits with 1 if it fails.
@@ -63,6 +72,30 @@ class DB:
         '''
         self._conn.close()
 
+    def cursor(self):
+        '''
+        Return a new cursor of the connection.
+        '''
+        return self._conn.cursor()
+
+    def count_rows(self, sql: str, notice_queue: Optional[Queue] = None) -> int:
+        '''
+        Execute a statement and return the number of rows it processed, e.g.
+        the rows skipped by `MOVE`. Errors are raised.
+        '''
+        with self._conn.cursor() as cur:
+            cur.execute(sql)
+            if self._conn.async_:
+                DB._async_conn_wait(self._conn, notice_queue=notice_queue)
+
+            return cur.rowcount
+
+    def cancel(self):
+        '''
+        Cancel the query currently running on this connection, if any.
+        '''
+        self._conn.cancel()
+
     def run_sql(self, sql: str, fetch_result: bool = False,
                 notice_queue: Optional[Queue] = None) -> Optional[list]:
         '''
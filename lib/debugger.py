@@ -3,25 +3,43 @@ This is the main debugger module. It receives commands to execute and
 distributes them accordingly to either the target or the proxy.
 '''
 
-from functools import reduce as f_reduce
+from argparse import ArgumentParser
+from functools import partial
+from glob import glob
+from typing import Callable, List, Optional, Tuple
 
 from loguru import logger
 
-from lib.commands import COMMANDS
+from lib.analysis import TraceReport, analyze_traces
+from lib.breakpoints import BreakpointEntry, BreakpointRegistry, is_executable
 from lib.db import DB
-from lib.formatters import print_notices
-from lib.helpers import get_all_functions
-from lib.target import Target
-from lib.proxy import Proxy
+from lib.dispatch import Dispatcher
+from lib.fanout import Fanout, FanoutReport, read_args_file
+from lib.formatters import (print_growth_warnings, print_loop_state, print_notices,
+                            print_wait_events, print_watches)
+from lib.checkpoint import Checkpoint, restore_checkpoint, save_checkpoint
+from lib.growth import GrowthEntry, GrowthTracker
+from lib.helpers import FunctionCatalog
+from lib.loops import Loop, LoopTracker
+from lib.profile import (FORMATS, Profile, ProfileSummary, export_profile,
+                         get_function_symbols, record_profile)
+from lib.resources import DEBUGGER, SESSION, ResourceTracker
+from lib.results import (FETCH_SIZE, DiscardSink, FileSink, LogSink, ResultSink,
+                         ResultStats)
+from lib.slow import SlowLineTracker, SlowReport, step_until_slow
+from lib.source import SourceView
+from lib.statements import LineStatsEntry, StatementCollector
+from lib.stepper import STEP_BATCH, STEPPER_FUNCTION, has_stepper, install_stepper
+from lib.stack import StackEntry, StackNavigator
+from lib.variables import VariableInspector
+from lib.waits import WaitEntry, WaitSampler
+from lib.watches import WatchList
+from lib.target import Target, SHUTDOWN_TIMEOUT
+from lib.proxy import Breakpoint, Frame, Proxy, Step
 
 
-def rgetattr(obj, attr, *args):
-    '''
-    Get an attribute recursively. For instance `self.foo.bar` returns `bar`.
-    '''
-    def _getattr(obj, attr):
-        return getattr(obj, attr, *args)
-    return f_reduce(_getattr, [obj] + attr.split('.'))
+# Stop hunting slow statements after this many steps
+MAX_SLOW_STEPS = 100000
 
 
 class Debugger:
@@ -29,11 +47,93 @@ class Debugger:
     This is the main class for PL/pgSQL debugging.
     '''
     def __init__(self, dsn: str):
+        self.resources = ResourceTracker()
         self.database = DB(dsn)
-        self.database.try_load_extension()
+        self.resources.track('connection', f'debugger (pid {self.database.pid})',
+                             self.database.cleanup, DEBUGGER)
 
         self.proxy = None
         self.target = None
+        self.dispatcher = Dispatcher(self)
+        self.source_view = SourceView()
+        self._variables = None
+        self._stack = None
+        self.watches = WatchList()
+        self.breakpoints = BreakpointRegistry(self.resources)
+        self.catalog = FunctionCatalog(self.database)
+        self.checkpoint = None
+        self._stepper = None
+        self.slow_lines = SlowLineTracker()
+        self.statements = None
+        self._statements_handle = None
+        self.waits = None
+        self._waits_handle = None
+        self.result_sink: ResultSink = LogSink()
+        self.fetch_size = FETCH_SIZE
+        self.loops = LoopTracker(self._get_source_lines)
+        self.growth = None
+        self.profile = Profile()
+
+    @property
+    def variables(self) -> VariableInspector:
+        '''
+        The variable inspector of the current session.
+        '''
+        if self._variables is None or self._variables.proxy is not self.proxy:
+            self._variables = VariableInspector(self.proxy)
+
+        return self._variables
+
+    @property
+    def stack(self) -> StackNavigator:
+        '''
+        The stack navigator of the current session.
+        '''
+        if self._stack is None or self._stack.proxy is not self.proxy:
+            self._stack = StackNavigator(self.proxy)
+
+        return self._stack
+
+    def ensure_extension(self):
+        '''
+        Make sure `pldbgapi` is available. Only falls back to creating the
+        extension if the cheap catalog lookup does not find it.
+        '''
+        if not self.database.has_extension():
+            self.database.try_load_extension()
+
+    def stepper_installed(self) -> bool:
+        '''
+        Whether the helper stepping many times on the server is installed, only
+        looked up once. Stepping falls back to one round trip per step without it.
+        '''
+        if self._stepper is None:
+            self._stepper = has_stepper(self.database)
+
+        return self._stepper
+
+    def install_stepper(self) -> bool:
+        '''
+        Install the helper, only done on request since it creates a schema and
+        a function in the database.
+        '''
+        self._stepper = install_stepper(self.database)
+        if self.active_session():
+            self.proxy.stepper = self._stepper
+
+        return self._stepper
+
+    def restore(self, checkpoint: Checkpoint) -> bool:
+        '''
+        Restore the state saved when the debugger exited last time. The state
+        is saved again on `close`.
+        '''
+        self.checkpoint = checkpoint
+        try:
+            return restore_checkpoint(self, checkpoint)
+        except Exception:
+            logger.exception('Could not restore checkpoint, starting from scratch')
+            return False
 
     def active_session(self):
         '''
@@ -42,7 +142,7 @@ class Debugger:
         return (self.proxy) and (self.target)
 
     def show_all_functions(self):
-        functions = get_all_functions(self.database)
+        functions = self.catalog.functions()
         logger.info(functions)
 
     def _start_debug_session_wrapper(self, *args):
@@ -53,32 +153,63 @@ class Debugger:
 
     def _start_debug_session(self, func_call: str, target: Target, proxy: Proxy):
         '''
-        Start a new debugging session from scratch.
+        Start a new debugging session from scratch. All resources of the
+        session are released again if starting fails.
         '''
-        self.target = target
-        if not self.target.start(func_call):
-            logger.error('Could not start target')
-            self.target.cleanup()
+        if self.active_session():
+            self.stop_debug_session()
+
+        self.resources.track('connection', f'target (pid {target.database.pid})',
+                             target.cleanup)
+        self.resources.track('connection', f'proxy (pid {proxy.database.pid})', proxy.cleanup)
+
+        try:
+            self.target = target
+            self.target.sink = self.result_sink
+            self.target.fetch_size = self.fetch_size
+            # Sources are kept across sessions unless a function changed since
+            if self.catalog.loaded and not self.catalog.validate():
+                self.source_view.forget()
+            func_oid = self.catalog.oid(func_call.partition('(')[0].strip())
+            if not self.target.start(func_call, func_oid=func_oid):
+                logger.error('Could not start target')
+                self.resources.close_all(SESSION)
+                self.target = None
+                return
+
+            logger.debug('Started target')
+            self.resources.track('listener', f'target on port {target.port}',
+                                 partial(target.wait_for_shutdown, SHUTDOWN_TIMEOUT))
+
+            self.proxy = proxy
+            self.proxy.attach(self.target.port)
+            self.resources.track('session', f'debug session {proxy.session_id}', proxy.abort)
+            self.breakpoints.attach(proxy)
+            self.proxy.stepper = self.stepper_installed()
+            self._update_collectors()
+
+        except Exception:
+            self.resources.close_all(SESSION)
             self.target = None
-            return
+            self.proxy = None
+            raise
 
-        logger.debug('Started target')
+        finally:
+            self.dispatcher.invalidate()
 
-        self.proxy = proxy
-        self.proxy.attach(self.target.port)
         logger.debug('Proxy started')
 
     def stop_debug_session(self):
         '''
         Stop the current debugging session.
         '''
-        if self.active_session():
-            self.proxy.abort()
-            self.target.wait_for_shutdown()
-            self.target.cleanup()
+        self.resources.close_all(SESSION)
+        self.breakpoints.detach()
 
         self.proxy = None
         self.target = None
+        self.dispatcher.invalidate()
+        self.loops.reset()
 
     def _get_source_wrapper(self) -> str:
         '''
@@ -86,49 +217,578 @@ class Debugger:
         '''
         return self.proxy.get_source(self.target.oid)
 
-    def _set_breakpoint_wrapper(self, *args):
+    def _get_source_lines(self, oid: int) -> List[str]:
+        return self.source_view.get_lines(self.proxy, oid)
+
+    def _show_source_wrapper(self, position: str = None):
+        '''
+        Helper function to render a window of the source of the function the
+        target currently stopped in.
+        '''
+        current = self.stack.location()
+        oid = current.oid if current else self.target.oid
+        current_line = current.line if current else None
+        breakpoints = self.breakpoints.lines(oid)
+        annotations = self.statements.annotations(oid) if self.statements else None
+
+        return self.source_view.render(self.proxy, oid, position, current_line, breakpoints,
+                                       annotations)
+
+    def _select_frame(self, select: Callable[[], Frame]) -> StackEntry:
+        try:
+            select()
+        except IndexError as error:
+            logger.error(str(error))
+            return None
+
+        return self.stack.entries()[self.proxy.frame]
+
+    def _frame_wrapper(self, level: int) -> StackEntry:
+        '''
+        Helper function to select a frame by level.
+        '''
+        return self._select_frame(partial(self.stack.select, level))
+
+    def _up_wrapper(self) -> StackEntry:
+        return self._select_frame(self.stack.up)
+
+    def _down_wrapper(self) -> StackEntry:
+        return self._select_frame(self.stack.down)
+
+    def _print_variable_wrapper(self, path: str):
+        '''
+        Helper function to expand a variable, or a part of it, in full.
+        '''
+        try:
+            value = self.variables.expand(path)
+            return 'NULL' if value is None else value
+
+        except (KeyError, IndexError, TypeError, ValueError) as error:
+            logger.error(f'Cannot print {path}: {error.args[0] if error.args else error}')
+
+    def _deposit_wrapper(self, name: str, value: str):
+        '''
+        Helper function to change the value of a variable.
+        '''
+        if not self.proxy.deposit(name, value):
+            logger.error(f'Could not set {name} to {value}')
+
+    def _step_wrapper(self, step_into: bool, args: List[str]) -> Breakpoint:
         '''
-        Helper function to set a breakpoint in the current target function.
+        Step once, or many times with `[count] [until <predicate>]`. Stepping
+        many times stops at enabled breakpoints or once the SQL predicate over
+        `oid` and `line` holds, e.g. `si 500 until line = 12`.
         '''
+        args = list(args)
+        until = None
+        if 'until' in args:
+            index = args.index('until')
+            until = ' '.join(args[index + 1:])
+            args = args[:index]
+            if not until:
+                logger.error('Missing predicate after until')
+                return None
+
         try:
-            line_number = args[0]
-            result = self.proxy.set_breakpoint(self.target.oid, line_number)
-            return result
+            count = int(args[0]) if args else (STEP_BATCH if until else 1)
+        except ValueError:
+            logger.error(f'Invalid step count: {args[0]}')
+            return None
+
+        if count < 1 or len(args) > 1:
+            logger.error('Usage: si|so [count] [until <predicate>]')
+            return None
+
+        if count == 1 and not until:
+            return self.proxy.step_into() if step_into else self.proxy.step_over()
+
+        stop_at = [(entry.oid, entry.line) for entry in self.breakpoints if entry.enabled]
+        stops = self.proxy.step_many(count, step_into, stop_at, until)
+        self.loops.observe_steps(stops, self.proxy.position, self.proxy.stops)
+        logger.debug(f'Stepped {len(stops)} times')
+        return self.proxy.position
+
+    def _current_loop(self) -> Optional[Loop]:
+        position = self.proxy.position
+        loop = self.loops.innermost(position.oid, position.line) if position else None
+        if loop is None:
+            logger.error('Not in a loop')
+
+        return loop
+
+    def _step_through_loop(self, loop: Loop, done: Callable[[Step], bool],
+                           stop_at: List[Tuple[int, int]]):
+        '''
+        Step over statements in batches until `done` holds for a stop, the
+        target left the loop or hit a breakpoint.
+        '''
+        breakpoints = {(entry.oid, entry.line) for entry in self.breakpoints if entry.enabled}
+        until = f'oid <> {loop.oid} OR line < {loop.start} OR line > {loop.end}'
+        while True:
+            stops = self.proxy.step_many(STEP_BATCH, False, list(breakpoints) + stop_at, until)
+            self.loops.observe_steps(stops, self.proxy.position, self.proxy.stops)
+            position = self.proxy.position
+            if position is None or not stops:
+                return
+
+            if (position.oid != loop.oid or not loop.start <= position.line <= loop.end
+                    or (position.oid, position.line) in breakpoints or done(position)):
+                return
+
+    def _skip_loop_wrapper(self) -> Breakpoint:
+        '''
+        Helper function to run the innermost loop to its end.
+        '''
+        loop = self._current_loop()
+        if loop is None:
+            return None
+
+        self._step_through_loop(loop, lambda position: False, [])
+        return self.proxy.position
+
+    def _loop_wrapper(self, iteration: int) -> Breakpoint:
+        '''
+        Helper function to run the innermost loop up to the start of the given
+        iteration.
+        '''
+        loop = self._current_loop()
+        if loop is None:
+            return None
+
+        if iteration <= self.loops.iteration(loop):
+            logger.error(f'Already in iteration {self.loops.iteration(loop)}')
+            return None
+
+        # Reaching the first line of the body starts an iteration, step until
+        # it is known
+        while self.loops.first_line(loop) is None:
+            position = self.proxy.step_over()
+            state = self.loops.observe(position, self.proxy.stops)
+            if state is None or state.loop != loop:
+                return position
+
+        first = (loop.oid, self.loops.first_line(loop))
+        self._step_through_loop(
+            loop, lambda position: self.loops.iteration(loop) >= iteration, [first])
+
+        if self.loops.iteration(loop) < iteration:
+            logger.info(f'Loop ended in iteration {self.loops.iteration(loop)}')
+        return self.proxy.position
+
+    def _break_slow_wrapper(self, threshold_ms: float = None, top: int = 10) -> SlowReport:
+        '''
+        Helper function to step over statements until one is slower than the
+        threshold. Without threshold, only shows the slowest lines so far.
+        '''
+        if threshold_ms is None:
+            return SlowReport(None, None, None, None, self.slow_lines.top(top))
+
+        slow = step_until_slow(self.proxy, self.slow_lines, threshold_ms, MAX_SLOW_STEPS)
+        stack, variables = None, None
+        if slow and slow.position is not None:
+            stack = self.stack.entries()
+            variables = self.variables.summary()
+
+        return SlowReport(threshold_ms, slow, stack, variables, self.slow_lines.top(top))
+
+    def _results_wrapper(self, kind: Optional[str] = None, path: Optional[str] = None,
+                         fetch_size: Optional[int] = None) -> ResultStats:
+        '''
+        Helper function to choose where the rows returned by the target go:
+        `results log|discard|file <path> [<fetch size>]`. Without arguments,
+        shows the current choice and the statistics of the last run.
+        '''
+        if kind is not None:
+            if kind == 'file' and path:
+                sink = FileSink(path)
+            elif kind in ('log', 'discard'):
+                sink = LogSink() if kind == 'log' else DiscardSink()
+            else:
+                logger.error('Usage: results log|discard|file <path> [<fetch size>]')
+                return None
+
+            if fetch_size is not None:
+                self.fetch_size = max(1, fetch_size)
+
+            self.result_sink.close()
+            self.result_sink = sink
+            if self.target:
+                logger.info('The target keeps its result settings until the next run')
+
+        logger.info(f'Results: {self.result_sink}, fetching {self.fetch_size} rows at a time')
+        return self.result_sink.stats
+
+    def _update_collectors(self):
+        '''
+        Let the proxy notify the enabled collectors whenever the target runs.
+        '''
+        if self.waits is not None:
+            self.waits.pid = self.target.database.pid if self.target else None
+
+        if self.proxy:
+            self.proxy.collectors = [collector for collector in (self.statements, self.waits)
+                                     if collector is not None]
+
+    def _waits_wrapper(self, action: str = None, interval_ms: float = None) -> List[WaitEntry]:
+        '''
+        Helper function to switch sampling wait events of the target on or
+        off, reset them or show them per line.
+        '''
+        if action == 'on':
+            if self.waits is None:
+                sampler = WaitSampler(DB(self.database.dsn))
+                self._waits_handle = self.resources.track(
+                    'connection', f'wait sampler (pid {sampler.database.pid})',
+                    sampler.database.cleanup, DEBUGGER)
+                self.waits = sampler
+
+            if interval_ms:
+                self.waits.interval = interval_ms / 1000
+
+        elif action == 'off' and self.waits is not None:
+            self.resources.release(self._waits_handle)
+            self.waits = None
+            self._waits_handle = None
 
-        # This is not enough here
-        except IndexError:
+        elif action == 'reset' and self.waits is not None:
+            self.waits.reset()
+
+        elif action not in (None, 'on', 'off', 'reset'):
+            logger.error(f'Unknown action {action}, use on, off or reset')
+            return None
+
+        self._update_collectors()
+
+        if self.waits is None:
+            logger.info('Wait sampling is off')
+            return None
+
+        return self.waits.entries()
+
+    def _record_growth(self) -> List[GrowthEntry]:
+        location = self.stack.location()
+        if location is None:
+            return []
+
+        return self.growth.record(self.variables, location.oid, location.func, self.loops.state)
+
+    def _growth_wrapper(self, action: str = None) -> List[GrowthEntry]:
+        '''
+        Helper function to switch tracking the sizes of variables on or off,
+        reset them or show the variables which grew.
+        '''
+        if action == 'on' and self.growth is None:
+            self.growth = GrowthTracker()
+
+        elif action == 'off':
+            self.growth = None
+
+        elif action == 'reset' and self.growth is not None:
+            self.growth.reset()
+
+        elif action not in (None, 'on', 'off', 'reset'):
+            logger.error(f'Unknown action {action}, use on, off or reset')
+            return None
+
+        if self.growth is None:
+            logger.info('Tracking variable sizes is off')
+            return None
+
+        return self.growth.entries()
+
+    def _sql_stats_wrapper(self, action: str = None) -> List[LineStatsEntry]:
+        '''
+        Helper function to switch collecting per-line statement statistics
+        on or off, reset them or show them.
+        '''
+        if action == 'on' and self.statements is None:
+            collector = StatementCollector(DB(self.database.dsn))
+            if not collector.available():
+                collector.database.cleanup()
+                return None
+
+            self._statements_handle = self.resources.track(
+                'connection', f'statement statistics (pid {collector.database.pid})',
+                collector.database.cleanup, DEBUGGER)
+            self.statements = collector
+
+        elif action == 'off' and self.statements is not None:
+            self.resources.release(self._statements_handle)
+            self.statements = None
+            self._statements_handle = None
+
+        elif action == 'reset' and self.statements is not None:
+            self.statements.reset()
+
+        elif action not in (None, 'on', 'off', 'reset'):
+            logger.error(f'Unknown action {action}, use on, off or reset')
+            return None
+
+        self._update_collectors()
+
+        if self.statements is None:
+            logger.info('Statement statistics are off')
+            return None
+
+        return self.statements.entries()
+
+    def _step_into_wrapper(self, *args) -> Breakpoint:
+        return self._step_wrapper(True, args)
+
+    def _step_over_wrapper(self, *args) -> Breakpoint:
+        return self._step_wrapper(False, args)
+
+    def _watch_wrapper(self, expression: str = None):
+        '''
+        Helper function to add a watch. Without expression, shows all watches.
+        '''
+        if expression:
+            self.watches.add(expression)
+
+        if self.active_session():
+            return self.watches.evaluate(self.variables)
+
+        logger.info(f'Watching: {", ".join(self.watches)}')
+
+    def _unwatch_wrapper(self, expression: str):
+        '''
+        Helper function to remove a watch by expression or number.
+        '''
+        if not self.watches.remove(expression):
+            logger.error(f'No such watch: {expression}')
+
+    def _fanout_wrapper(self, *args) -> FanoutReport:
+        '''
+        Helper function to debug-run a function for all argument sets of a
+        file in parallel.
+        '''
+        parser = ArgumentParser(prog='fanout', add_help=False)
+        parser.add_argument('func')
+        parser.add_argument('--args-file', required=True)
+        parser.add_argument('--trace-dir')
+        parser.add_argument('--trace-variables', action='store_true')
+        parser.add_argument('--connections', type=int, default=16)
+        parser.add_argument('--max-steps', type=int, default=100000)
+
+        try:
+            options = parser.parse_args(args)
+        except SystemExit:
+            return None
+
+        func_oid = self.catalog.oid(options.func)
+        if not func_oid:
+            logger.error(f'Function {options.func} not found')
+            return None
+
+        fanout = Fanout(self.database.dsn, options.connections, options.max_steps,
+                        options.trace_dir, options.trace_variables, self.stepper_installed())
+        return fanout.run(options.func, func_oid, read_args_file(options.args_file))
+
+    def _analyze_wrapper(self, *args) -> TraceReport:
+        '''
+        Helper function to analyse trace files, e.g. written by `fanout`.
+        '''
+        parser = ArgumentParser(prog='analyze', add_help=False)
+        parser.add_argument('traces', nargs='+')
+        parser.add_argument('--var')
+        parser.add_argument('--top', type=int, default=10)
+        parser.add_argument('--workers', type=int)
+
+        try:
+            options = parser.parse_args(args)
+        except SystemExit:
+            return None
+
+        paths = sorted(path for pattern in options.traces for path in glob(pattern))
+        if not paths:
+            logger.error('No trace files found')
+            return None
+
+        aggregate = analyze_traces(paths, options.var, options.workers)
+        return aggregate.report(options.top, options.var)
+
+    def _stepper_wrapper(self, action: Optional[str] = None) -> Optional[bool]:
+        '''
+        Helper function to show whether the stepper helper is installed, or to
+        install it.
+        '''
+        if action == 'install':
+            self.install_stepper()
+        elif action is not None:
+            logger.error(f'Unknown action {action}, use install')
+            return None
+
+        installed = self.stepper_installed()
+        if installed:
+            logger.info(f'{STEPPER_FUNCTION} is installed, steps are taken in batches')
+        else:
+            logger.info(f'{STEPPER_FUNCTION} is not installed, stepping one by one. '
+                        'Install it with "stepper install"')
+        return installed
+
+    def _profile_wrapper(self, action: Optional[str] = None, max_steps: Optional[int] = None,
+                         traces: str = '', fmt: Optional[str] = None,
+                         path: Optional[str] = None) -> ProfileSummary:
+        '''
+        Helper function to record a profile by stepping the target with
+        stacks, add trace files to it, export or reset it.
+        '''
+        if action == 'record':
+            if not self.active_session():
+                logger.error('No active session')
+                return None
+
+            steps = record_profile(self.proxy, self.profile, max_steps)
+            self.loops.observe_steps([], self.proxy.position, self.proxy.stops)
+            logger.info(f'Recorded {steps} steps')
+
+        elif action == 'load':
+            paths = sorted(found for pattern in traces.split() for found in glob(pattern))
+            if not paths:
+                logger.error('No trace files found')
+                return None
+            aggregate = analyze_traces(paths)
+            self.profile.add_lines(aggregate.hits, aggregate.elapsed)
+
+        elif action == 'export':
+            if fmt not in FORMATS or not path:
+                logger.error(f'Usage: profile export {"|".join(FORMATS)} <path>')
+                return None
+            directory = export_profile(self.profile, self._profile_symbols(), fmt, path)
+            logger.info(f'Wrote {path}, sources to {directory}')
+
+        elif action == 'reset':
+            self.profile.reset()
+
+        elif action is not None:
+            logger.error(f'Unknown action {action}, use record, load, export or reset')
+            return None
+
+        return self.profile.summary()
+
+    def _profile_symbols(self):
+        '''
+        Names and sources of the profiled functions. Sources fetched by the
+        session are used as they are, the others come from the catalog.
+        '''
+        symbols = get_function_symbols(self.database, self.profile.oids())
+        for oid, lines in self.source_view.sources().items():
+            if oid in symbols:
+                symbols[oid] = (symbols[oid][0], '\n'.join(lines))
+
+        return symbols
+
+    def _set_breakpoint_wrapper(self, *args) -> List[BreakpointEntry]:
+        '''
+        Helper function to set breakpoints in the current target function.
+        Lines which are not executable are rejected.
+        '''
+        try:
+            lines = [int(arg) for arg in args]
+        except ValueError:
+            logger.error(f'Invalid line number in: {" ".join(args)}')
+            return None
+
+        if not lines:
             logger.error('Could not get breakpoint line number.')
+            return None
+
+        oid = self.target.oid
+        source = self.source_view.get_lines(self.proxy, oid)
+        invalid = [line for line in lines if not is_executable(source, line)]
+        if invalid:
+            logger.error(f'Not an executable line: {", ".join(str(line) for line in invalid)}')
+
+        return self.breakpoints.add(oid, [line for line in lines if line not in invalid])
+
+    def _change_breakpoints(self, change, args):
+        try:
+            change([int(arg) for arg in args])
+        except (KeyError, ValueError) as error:
+            logger.error(f'Cannot change breakpoints: {error.args[0] if error.args else error}')
+
+    def _enable_breakpoints_wrapper(self, *args):
+        self._change_breakpoints(self.breakpoints.enable, args)
+
+    def _disable_breakpoints_wrapper(self, *args):
+        self._change_breakpoints(self.breakpoints.disable, args)
+
+    def _delete_breakpoints_wrapper(self, *args):
+        self._change_breakpoints(self.breakpoints.delete, args)
+
+    def _save_breakpoints_wrapper(self, path: str):
+        '''
+        Helper function to save all breakpoints, together with function names.
+        '''
+        names = {function.oid: function.name for function in self.catalog.functions()}
+        self.breakpoints.save(path, names)
+        logger.info(f'Saved {len(self.breakpoints)} breakpoints to {path}')
+
+    def _load_breakpoints_wrapper(self, path: str) -> List[BreakpointEntry]:
+        '''
+        Helper function to load breakpoints, functions are looked up by name.
+        '''
+        oids = {function.name: function.oid for function in self.catalog.functions()}
+        try:
+            return self.breakpoints.load(path, oids)
+        except (OSError, ValueError, KeyError) as error:
+            logger.error(f'Cannot load breakpoints from {path}: {error}')
 
     def _run_command(self, command_name, args):
         '''
         Execute a debugging command.
         '''
-        if command_name in ('abort', 'exit', 'quit'):
-            command_name = 'stop'
+        self.dispatcher.dispatch(command_name, args)
 
-        try:
-            command = COMMANDS[command_name]['command']
+    def interrupt(self):
+        '''
+        Cancel what the session is waiting for, e.g. `continue` waiting for a
+        breakpoint. Called from another thread than the running command.
+        '''
+        if self.active_session():
+            self.proxy.database.cancel()
 
-            if command.prereq:
-                assert getattr(self, command.prereq)()
+    def close(self):
+        '''
+        Stop the session and release everything the debugger created. Saves
+        the state first if it was restored from a checkpoint.
+        '''
+        if self.checkpoint:
+            try:
+                save_checkpoint(self, self.checkpoint)
+            except Exception:
+                logger.exception('Could not save checkpoint')
+            self.checkpoint = None
 
-            func = rgetattr(self, command.func)
-            logger.debug(f'Calling {func} with {args}')
-            result = func(*args)
+        self.stop_debug_session()
 
-            if command.return_func:
-                command.return_func(result)
+        self.resources.close_all()
 
-        except KeyError:
-            logger.error(f'Cannot find definition for "{command_name}"')
+    def __enter__(self):
+        return self
 
+    def __exit__(self, *args):
+        self.close()
 
     def execute_command(self, command, args):
         '''
         Parse and execute a given command.
         '''
         logger.debug(f'Executing: {command} with args {args}')
+        epoch = self.proxy.epoch if self.active_session() else None
         self._run_command(command, args)
 
         if self.active_session():
             print_notices(self.target.get_notices())
+
+            if self.proxy.epoch != epoch:
+                print_loop_state(self.loops.observe(self.proxy.position, self.proxy.stops))
+
+            if self.growth is not None and self.proxy.epoch != epoch:
+                print_growth_warnings(self._record_growth())
+
+            if self.waits and self.waits.last and self.proxy.epoch != epoch:
+                print_wait_events(self.waits.last)
+
+            if self.watches and self.proxy.epoch != epoch:
+                print_watches(self.watches.evaluate(self.variables))
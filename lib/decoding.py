@@ -0,0 +1,65 @@
+'''
+This module converts the text values of variables into Python types, e.g.
+`numeric` into `Decimal` or `timestamp` into `datetime`. It reuses the type
+casters of psycopg2, which are looked up once per type OID. Types without a
+caster (composites, enums, ...) are kept as text.
+'''
+
+from typing import Any, Callable, Dict, Optional
+
+import psycopg2
+import psycopg2.extensions
+
+from loguru import logger
+
+
+# Text types need no decoding. psycopg2 before 2.9 decodes them with the
+# connection of the cursor and crashes without one.
+TEXT_OIDS = frozenset(psycopg2.extensions.UNICODE.values)
+
+
+class Decoder:
+    '''
+    Decodes text values by type OID. Casters registered on the connection
+    take precedence over the global ones, like for query results. Casters
+    implemented in Python, like the one for JSON, need a database.
+    '''
+
+    def __init__(self, database=None):
+        self.database = database
+        self._casters: Dict[int, Optional[Callable]] = {}
+
+    def caster(self, oid: int, cursor=None) -> Optional[Callable]:
+        if oid not in self._casters:
+            connection = getattr(cursor, 'connection', None)
+            local = getattr(connection, 'string_types', None) or {}
+            self._casters[oid] = local.get(oid, psycopg2.extensions.string_types.get(oid))
+
+        return self._casters[oid]
+
+    def decode(self, oid: Optional[int], value: Optional[str]) -> Any:
+        '''
+        Decode a text value of the given type. Values which cannot be decoded
+        are returned as they are.
+        '''
+        if value is None or oid is None or oid in TEXT_OIDS or \
+                (oid in self._casters and self._casters[oid] is None):
+            return value
+
+        if self.database is None:
+            return self._cast(oid, value, None)
+
+        # Some casters (e.g. for timestamptz) need a cursor for time zones
+        with self.database.cursor() as cur:
+            return self._cast(oid, value, cur)
+
+    def _cast(self, oid: int, value: str, cursor) -> Any:
+        caster = self.caster(oid, cursor)
+        if caster is None:
+            return value
+
+        try:
+            return caster(value, cursor)
+        except (psycopg2.Error, ValueError, TypeError) as error:
+            logger.debug(f'Cannot decode {value!r} of type {oid}: {error}')
+            return value
@@ -0,0 +1,171 @@
+'''
+This module turns the command table into callables. The table is compiled once
+per debugging session, such that executing a command is a single dictionary
+lookup instead of resolving attribute paths on every call.
+'''
+
+from collections import namedtuple
+from functools import partial
+from typing import Any, Dict, List, Tuple
+
+from loguru import logger
+
+from lib.commands import COMMANDS, Argument, Commands
+from lib.helpers import rgetattr
+
+
+BoundCommand = namedtuple('BoundCommand', ['name', 'func', 'prereq', 'return_func', 'args',
+                                           'actions'])
+
+
+class Dispatcher:
+    '''
+    Binds the commands of a command table to an owner, typically the debugger.
+    Has to be invalidated whenever attributes referenced by commands change,
+    e.g. when a new proxy is created.
+    '''
+
+    def __init__(self, owner: Any, commands: Commands = COMMANDS):
+        self.owner = owner
+        self.commands = commands
+        self._table = None
+        self._version = None
+
+    def invalidate(self):
+        '''
+        Drop the compiled table, it is rebuilt on the next dispatch.
+        '''
+        self._table = None
+
+    def _bind(self, func) -> Any:
+        if func is None:
+            return None
+
+        if callable(func):
+            return partial(func, self.owner)
+
+        return rgetattr(self.owner, func, None)
+
+    def compile(self) -> Dict[str, BoundCommand]:
+        '''
+        Resolve all commands and aliases of the command table.
+        '''
+        table = {}
+        for name, entry in self.commands.items():
+            command = entry.get('command')
+            if not command:
+                continue
+
+            table[name] = BoundCommand(name, self._bind(command.func),
+                                       self._bind(command.prereq), command.return_func,
+                                       entry.get('args', []), entry.get('actions'))
+
+        for alias, name in self.commands.aliases.items():
+            if name in table:
+                table[alias] = table[name]
+
+        self._table = table
+        self._version = self.commands.version
+        logger.debug(f'Compiled {len(table)} commands')
+        return table
+
+    @classmethod
+    def convert_args(cls, schema: List[Argument], args: List[str]) -> List[Any]:
+        '''
+        Convert raw arguments according to the schema of a command. Commands
+        without schema get their arguments passed as they are. More arguments
+        than the schema has are refused, unless the last one takes the rest.
+        '''
+        if not schema:
+            return args
+
+        if len(args) > len(schema) and not schema[-1].rest:
+            raise ValueError(f'Too many arguments, expected at most {len(schema)}: '
+                             f'{" ".join(args[len(schema):])} is left over')
+
+        converted = []
+        for index, argument in enumerate(schema):
+            if argument.rest:
+                value = ' '.join(args[index:])
+            elif index < len(args):
+                value = args[index]
+            else:
+                value = ''
+
+            if not value:
+                if argument.required:
+                    raise ValueError(f'Missing argument "{argument.name}"')
+                break
+
+            try:
+                converted.append(argument.type(value))
+            except ValueError:
+                raise ValueError(f'Invalid value for "{argument.name}": {value}')
+
+            if argument.rest:
+                break
+
+        return converted
+
+    @classmethod
+    def convert_action_args(cls, schema: List[Argument], actions: Dict[str, List[Argument]],
+                            args: List[str]) -> Tuple[List[Any], Dict[str, Any]]:
+        '''
+        Convert the arguments of a command taking an action first. The
+        arguments after the action are converted by the schema of the action
+        and returned by name.
+        '''
+        converted = cls.convert_args(schema[:1], args[:1])
+        if not converted:
+            return converted, {}
+
+        action = converted[0]
+        if action not in actions:
+            raise ValueError(f'Unknown {schema[0].name} "{action}", use {", ".join(actions)}')
+
+        if not actions[action]:
+            if len(args) > 1:
+                raise ValueError(f'"{action}" takes no arguments')
+            return converted, {}
+
+        values = cls.convert_args(actions[action], args[1:])
+        return converted, {argument.name: value
+                           for argument, value in zip(actions[action], values)}
+
+    def dispatch(self, name: str, args: List[str]) -> Any:
+        '''
+        Execute a command by name (or alias) with the given raw arguments.
+        '''
+        table = self._table
+        if table is None or self._version != self.commands.version:
+            table = self.compile()
+
+        command = table.get(name)
+        if command is None:
+            logger.error(f'Cannot find definition for "{name}"')
+            return None
+
+        if command.prereq and not command.prereq():
+            logger.error(f'Cannot run "{name}", no active debugging session')
+            return None
+
+        if command.func is None:
+            logger.error(f'Cannot resolve "{name}"')
+            return None
+
+        try:
+            if command.actions:
+                args, kwargs = Dispatcher.convert_action_args(command.args, command.actions, args)
+            else:
+                args, kwargs = Dispatcher.convert_args(command.args, args), {}
+        except ValueError as error:
+            logger.error(f'{command.name}: {error}')
+            return None
+
+        logger.debug(f'Calling {command.func} with {args} {kwargs}')
+        result = command.func(*args, **kwargs)
+
+        if command.return_func:
+            command.return_func(result)
+
+        return result
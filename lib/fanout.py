@@ -0,0 +1,145 @@
+'''
+This module debug-runs a single function for many argument sets concurrently.
+Every run gets its own target and proxy, is stepped automatically until the
+function returns and has its line coverage recorded. Results of all runs are
+merged into one report.
+'''
+
+import os
+
+from collections import Counter, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from time import perf_counter
+from typing import List, Optional, Tuple
+
+from loguru import logger
+
+from lib.proxy import Proxy
+from lib.stepper import STEP_BATCH
+from lib.target import SHUTDOWN_TIMEOUT, Target
+from lib.trace import TraceRecorder, auto_step
+
+
+# Every run needs a connection for the target and one for the proxy
+CONNECTIONS_PER_RUN = 2
+
+FanoutRun = namedtuple('FanoutRun', ['args', 'steps', 'lines', 'elapsed', 'error'])
+FanoutReport = namedtuple('FanoutReport', ['func_name', 'runs', 'coverage', 'elapsed'])
+
+
+def read_args_file(path: str) -> List[str]:
+    '''
+    Read argument sets, one per line, e.g. `2` or `'abc', 3`. Empty lines and
+    lines starting with `#` are skipped.
+    '''
+    with open(path, 'r') as args_file:
+        lines = [line.strip() for line in args_file]
+
+    return [line for line in lines if line and not line.startswith('#')]
+
+
+class Fanout:
+    '''
+    Runs a function for many argument sets on a pool of workers. The number
+    of workers is bounded by the number of connections it may use.
+    '''
+
+    def __init__(self, dsn: str, connections: int = 16, max_steps: int = 100000,
+                 trace_dir: Optional[str] = None, trace_variables: bool = False,
+                 batch_stepping: bool = False):
+        self.dsn = dsn
+        self.connections = connections
+        self.max_steps = max_steps
+        self.trace_dir = trace_dir
+        self.trace_variables = trace_variables
+        # Step on the server in batches, needs the stepper helper installed
+        self.batch_stepping = batch_stepping
+
+    def workers(self, inputs: int) -> int:
+        '''
+        Number of workers to use for the given number of inputs. Runs mostly
+        wait on the server, hence more workers than cores are fine.
+        '''
+        cores = os.cpu_count() or 1
+        return max(1, min(self.connections // CONNECTIONS_PER_RUN, cores * 4, inputs))
+
+    def _run_one(self, index: int, func_name: str, func_oid: int,
+                 args: str) -> Tuple[FanoutRun, Counter]:
+        '''
+        Debug-run the function once, stepping into every statement.
+        '''
+        trace_path = None
+        if self.trace_dir:
+            trace_path = os.path.join(self.trace_dir, f'{index:05}.trace')
+
+        started = perf_counter()
+        target = Target(self.dsn)
+        proxy = None
+
+        try:
+            if not target.start(f'{func_name}({args})', once=True, func_oid=func_oid):
+                return FanoutRun(args, 0, 0, 0.0, 'could not start target'), Counter()
+
+            proxy = Proxy(self.dsn)
+            proxy.attach(target.port)
+
+            # Variables are read at every step, which needs a round trip anyway
+            trace_variables = trace_path and self.trace_variables
+            batch = STEP_BATCH if self.batch_stepping and not trace_variables else 1
+            proxy.stepper = self.batch_stepping
+
+            with TraceRecorder(trace_path) as recorder:
+                for position, elapsed in auto_step(proxy, max_steps=self.max_steps,
+                                                   batch=batch):
+                    variables = None
+                    if trace_variables:
+                        variables = {var.name: var.value for var in proxy.get_variables()}
+                    recorder.record(position, elapsed, variables)
+
+            error = None
+            if recorder.steps >= self.max_steps:
+                proxy.abort()
+                error = f'stopped after {self.max_steps} steps'
+
+            # A target which never finishes must not hang the whole fanout
+            if not target.wait_for_shutdown(SHUTDOWN_TIMEOUT):
+                error = f'timed out after {SHUTDOWN_TIMEOUT:g} s waiting for the target'
+            elif target.error:
+                error = str(target.error).strip()
+
+            return FanoutRun(args, recorder.steps, len(recorder.coverage),
+                             perf_counter() - started, error), recorder.coverage
+
+        finally:
+            if proxy:
+                proxy.cleanup()
+            target.cleanup()
+
+    def run(self, func_name: str, func_oid: int, inputs: List[str]) -> FanoutReport:
+        '''
+        Run the function for all inputs and merge their coverage.
+        '''
+        if self.trace_dir:
+            os.makedirs(self.trace_dir, exist_ok=True)
+
+        workers = self.workers(len(inputs))
+        logger.info(f'Running {func_name} for {len(inputs)} inputs on {workers} workers')
+
+        started = perf_counter()
+        runs = []
+        coverage = Counter()
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(self._run_one, index, func_name, func_oid, args)
+                       for index, args in enumerate(inputs)]
+
+            for args, future in zip(inputs, futures):
+                try:
+                    run, run_coverage = future.result()
+                except Exception as error:
+                    logger.exception(f'Run with ({args}) failed')
+                    run, run_coverage = FanoutRun(args, 0, 0, 0.0, str(error)), Counter()
+
+                runs.append(run)
+                coverage.update(run_coverage)
+
+        return FanoutReport(func_name, runs, coverage, perf_counter() - started)
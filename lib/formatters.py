@@ -1,8 +1,10 @@
 
-from typing import List, Tuple
+from pprint import pformat
+from typing import Any, List, Optional, Tuple
 
 from loguru import logger
 from prompt_toolkit import print_formatted_text, HTML
+from prompt_toolkit.formatted_text import FormattedText
 
 
 def print_help(help: List[Tuple[str, str]]):
@@ -10,12 +12,230 @@ def print_help(help: List[Tuple[str, str]]):
         print_formatted_text(HTML(f'<b>{command:8}</b>: {help}'))
 
 
-def print_source(src: str):
-    for index, line in enumerate(src.split('\n')):
-        line_number = index + 1
-        logger.info('{line_number:3}: {line}')
+def print_source(lines: List[FormattedText]):
+    for line in lines:
+        print_formatted_text(line)
 
 
 def print_notices(notices: List[str]):
     for notice in notices:
         logger.info(notice.strip())
+
+
+def print_variables(variables: List[Tuple[str, str, str]]):
+    for name, type_name, value in variables:
+        print_formatted_text(FormattedText([
+            ('bold', f'{name:16}'), ('ansibrightblack', f' {type_name:12} '), ('', value)
+        ]))
+
+
+def print_value(value: Any):
+    if value is None:
+        return
+
+    print_formatted_text(value if isinstance(value, str) else pformat(value))
+
+
+def print_watches(watches: Optional[List[Tuple[str, Any, bool]]]):
+    for index, (expression, value, changed) in enumerate(watches or []):
+        value = value if isinstance(value, str) else pformat(value)
+        print_formatted_text(FormattedText([
+            ('ansibrightblack', f'{index + 1:2}: '),
+            ('bold', expression),
+            ('', ' = '),
+            ('ansiyellow bold' if changed else '', value),
+            ('ansiyellow', ' (changed)' if changed else ''),
+        ]))
+
+
+def print_fanout_report(report):
+    if report is None:
+        return
+
+    failed = [run for run in report.runs if run.error]
+    logger.info(f'{report.func_name}: {len(report.runs)} runs, {len(failed)} failed, '
+                f'{report.elapsed:.2f} s')
+
+    for run in report.runs:
+        status = run.error or 'ok'
+        print_formatted_text(f'  ({run.args}): {run.steps} steps, {run.lines} lines, '
+                             f'{run.elapsed * 1000:.0f} ms, {status}')
+
+    print_formatted_text('Coverage (oid, line: hits):')
+    for (oid, line), hits in sorted(report.coverage.items()):
+        print_formatted_text(f'  {oid}, {line:4}: {hits}')
+
+
+def print_trace_report(report):
+    if report is None:
+        return
+
+    logger.info(f'{report.steps} steps, {report.lines} lines')
+
+    print_formatted_text('Hot lines (oid, line: time, hits):')
+    for oid, line, hits, elapsed_us in report.hot_lines:
+        print_formatted_text(f'  {oid}, {line:4}: {elapsed_us / 1000:10.2f} ms, {hits} hits')
+
+    for path, changes in report.history.items():
+        print_formatted_text(f'History of {report.variable} in {path}:')
+        for step, value in changes:
+            print_formatted_text(f'  {step:8}: {value}')
+
+
+def print_resources(resources):
+    if not resources:
+        logger.info('No resources held')
+
+    for handle, kind, name, scope, _ in resources:
+        print_formatted_text(f'{handle:4}: {kind:10} {name} ({scope})')
+
+
+def print_breakpoints(entries):
+    if entries is None:
+        return
+
+    if not entries:
+        logger.info('No breakpoints')
+
+    for number, oid, line, func, enabled in entries:
+        print_formatted_text(FormattedText([
+            ('' if enabled else 'ansibrightblack',
+             f'{number:4}: {func or oid} line {line}{"" if enabled else " (disabled)"}'),
+        ]))
+
+
+def print_stack(entries):
+    if entries is None:
+        return
+
+    if not isinstance(entries, list):
+        entries = [entries]
+
+    for level, name, oid, line, args, selected in entries:
+        print_formatted_text(FormattedText([
+            ('bold' if selected else '', f'{">" if selected else " "} #{level:<3}'),
+            ('', f'{name} line {line} '),
+            ('ansibrightblack', f'({args})' if args else ''),
+        ]))
+
+
+def print_slow_report(report):
+    if report is None:
+        return
+
+    if report.threshold_ms is not None:
+        if report.slow is None:
+            logger.info(f'No step took longer than {report.threshold_ms:g} ms')
+        else:
+            oid, line, func = report.slow.line
+            position = report.slow.position
+            stopped = f'stopped at line {position.line}' if position else 'target finished'
+            logger.info(f'{func or oid} line {line} took {report.slow.elapsed_ms:.2f} ms, '
+                        f'{stopped}')
+
+    if report.stack:
+        print_stack(report.stack)
+
+    if report.variables:
+        print_variables(report.variables)
+
+    print_formatted_text('Slowest lines (line: slowest step, total, hits):')
+    for oid, line, func, hits, max_ms, total_ms in report.top:
+        print_formatted_text(f'  {func or oid} line {line:4}: {max_ms:10.2f} ms, '
+                             f'{total_ms:10.2f} ms, {hits} hits')
+
+
+def print_sql_stats(entries):
+    if entries is None:
+        return
+
+    if not entries:
+        logger.info('No statement statistics collected yet')
+
+    for oid, line, func, stats in entries:
+        print_formatted_text(
+            f'{func or oid} line {line:4}: {stats.calls} calls, {stats.rows} rows, '
+            f'{stats.shared_blks_hit} blks hit, {stats.shared_blks_read} blks read, '
+            f'{stats.time_ms:.2f} ms')
+
+
+def _format_wait_events(events) -> str:
+    total = sum(count for _, count in events)
+    return ', '.join(f'{event} {count * 100 / total:.0f}%' for event, count in events)
+
+
+def print_wait_events(events):
+    if events:
+        logger.info(f'Waits: {_format_wait_events(events.most_common())}')
+
+
+def print_waits(entries):
+    if entries is None:
+        return
+
+    if not entries:
+        logger.info('No wait events sampled yet')
+
+    for oid, line, func, events in entries:
+        samples = sum(count for _, count in events)
+        print_formatted_text(f'{func or oid} line {line:4}: {samples} samples, '
+                             f'{_format_wait_events(events)}')
+
+
+def _format_size(size: int) -> str:
+    for unit in ('B', 'KiB', 'MiB'):
+        if size < 1024:
+            return f'{size:.0f} {unit}' if unit == 'B' else f'{size:.1f} {unit}'
+        size /= 1024
+
+    return f'{size:.1f} GiB'
+
+
+def _format_growth(entry) -> str:
+    exponent = f', ~n^{entry.exponent:.1f}' if entry.exponent is not None else ''
+    return (f'{entry.name} in {entry.func or entry.oid} (loop at lines {entry.loop.start}-'
+            f'{entry.loop.end}): {_format_size(entry.first)} -> {_format_size(entry.last)} '
+            f'after {entry.iterations} iterations{exponent}')
+
+
+def print_growth_warnings(entries):
+    for entry in entries:
+        logger.warning(f'Growing super-linearly: {_format_growth(entry)}')
+
+
+def print_growth(entries):
+    if entries is None:
+        return
+
+    if not entries:
+        logger.info('No variable grew yet')
+
+    for entry in entries:
+        marker = '!' if entry.flagged else ' '
+        print_formatted_text(f'{marker} {_format_growth(entry)}')
+
+
+def print_profile(summary):
+    if summary is None:
+        return
+
+    logger.info(f'Profile: {summary.steps} steps, {summary.elapsed_us / 1000:.2f} ms in '
+                f'{summary.functions} functions, {summary.stacks} distinct stacks')
+
+
+def print_result_stats(stats):
+    if stats is None:
+        return
+
+    logger.info(f'Last result: {stats.rows} rows in {stats.batches} batches, '
+                f'{stats.bytes / 1024:.1f} KiB, largest batch {stats.peak_batch_bytes / 1024:.1f} '
+                f'KiB, {stats.elapsed:.2f} s')
+
+
+def print_loop_state(state):
+    if state is None or not state.iteration:
+        return
+
+    period = f', {state.period} steps per iteration' if state.period else ''
+    logger.info(f'Loop at lines {state.loop.start}-{state.loop.end}: '
+                f'iteration {state.iteration}{period}')
@@ -0,0 +1,217 @@
+'''
+This module tracks how much memory the variables of the target take. At every
+stop, the size of every variable is recorded: the length of its text value
+and, for larger values, `pg_column_size` of the typed value on the server.
+Values are only sent back to the server when their text changed size, and
+never if they are huge, then the text size has to do.
+Sizes are kept per variable and loop as a series over the iterations of the
+loop, such that variables growing faster than the number of iterations, like
+an array appended to its own copy or text concatenated with ever longer
+pieces, are flagged long before the backend runs out of memory.
+
+Growth is measured as the exponent `k` of `size - first size ~ iterations^k`,
+fitted on a log-log scale. Appending a fixed amount per iteration gives
+`k = 1`, anything clearly above counts as super-linear.
+'''
+
+from array import array
+from collections import namedtuple
+from math import log
+from typing import Dict, List, Optional, Tuple
+
+import psycopg2
+
+from loguru import logger
+
+from lib.loops import Loop, LoopState
+
+
+# Points kept per series, every other point is dropped once it is full
+MAX_POINTS = 512
+
+# Points needed before growth is judged
+MIN_POINTS = 4
+
+# Growth exponent above which growth counts as super-linear
+SUPERLINEAR = 1.3
+
+# Variables which grew less than this are not flagged, in bytes
+MIN_GROWTH = 4096
+
+# Values with a longer text are measured on the server as well, in bytes
+SERVER_SIZE_MIN = 256
+
+# Values with a longer text are not sent back to the server, in bytes
+SERVER_SIZE_MAX = 1 << 20
+
+GrowthEntry = namedtuple('GrowthEntry', ['oid', 'func', 'name', 'loop', 'iterations', 'first',
+                                         'last', 'text_size', 'exponent', 'flagged'])
+
+
+def growth_exponent(xs, sizes) -> Optional[float]:
+    '''
+    Least-squares slope of log(growth) over log(iterations), relative to the
+    first point. None if there are too few points with growth.
+    '''
+    points = [(log(x - xs[0]), log(size - sizes[0]))
+              for x, size in zip(xs, sizes) if x > xs[0] and size > sizes[0]]
+    if len(points) < MIN_POINTS - 1:
+        return None
+
+    mean_x = sum(x for x, _ in points) / len(points)
+    mean_y = sum(y for _, y in points) / len(points)
+    variance = sum((x - mean_x) ** 2 for x, _ in points)
+    if not variance:
+        return None
+
+    return sum((x - mean_x) * (y - mean_y) for x, y in points) / variance
+
+
+class SizeSeries:
+    '''
+    Sizes of one variable over the iterations of a loop, as compact arrays.
+    '''
+
+    __slots__ = ('iterations', 'sizes', 'text_size', 'flagged')
+
+    def __init__(self):
+        self.iterations = array('q')
+        self.sizes = array('q')
+        self.text_size = 0
+        self.flagged = False
+
+    def __len__(self) -> int:
+        return len(self.iterations)
+
+    def add(self, iteration: int, size: int, text_size: int):
+        '''
+        Add the size at an iteration. The last stop of an iteration counts,
+        an iteration lower than the last one means the loop started again.
+        '''
+        self.text_size = text_size
+        if self.iterations and iteration < self.iterations[-1]:
+            self.iterations = array('q')
+            self.sizes = array('q')
+            self.flagged = False
+
+        if self.iterations and iteration == self.iterations[-1]:
+            self.sizes[-1] = size
+            return
+
+        if len(self.iterations) >= MAX_POINTS:
+            # Keep the first point, growth is measured relative to it
+            self.iterations = self.iterations[::2]
+            self.sizes = self.sizes[::2]
+
+        self.iterations.append(iteration)
+        self.sizes.append(size)
+
+    def exponent(self) -> Optional[float]:
+        return growth_exponent(self.iterations, self.sizes)
+
+    def superlinear(self) -> bool:
+        if len(self) < MIN_POINTS or self.sizes[-1] - self.sizes[0] < MIN_GROWTH:
+            return False
+
+        exponent = self.exponent()
+        return exponent is not None and exponent > SUPERLINEAR
+
+
+def text_size(value: Optional[str]) -> int:
+    return 0 if value is None else len(value.encode())
+
+
+def server_sizes(inspector, variables) -> Dict[str, int]:
+    '''
+    `pg_column_size` of the large variables as their own type, in a single
+    query. Variables of unknown types and huge ones are left out.
+    '''
+    large = [variable for variable in variables
+             if SERVER_SIZE_MIN <= text_size(variable.value) <= SERVER_SIZE_MAX]
+    types = inspector.get_types(variable.dtype for variable in large)
+    large = [variable for variable in large if variable.dtype in types]
+    if not large:
+        return {}
+
+    columns = ', '.join(
+        "pg_column_size(('{}')::{})".format(variable.value.replace("'", "''"),
+                                            types[variable.dtype].name)
+        for variable in large)
+    try:
+        result = inspector.proxy.database.run_sql(f'SELECT {columns}', fetch_result=True)
+    except psycopg2.Error as error:
+        logger.debug(f'Measuring variables failed: {error}')
+        return {}
+
+    if not result:
+        return {}
+
+    return {variable.name: size for variable, size in zip(large, result[0])
+            if size is not None}
+
+
+class GrowthTracker:
+    '''
+    Records the sizes of the variables of the selected frame at every stop.
+    Only stops inside loops are kept, since growth is judged per iteration.
+    '''
+
+    def __init__(self):
+        self.series: Dict[Tuple[int, str, Loop], SizeSeries] = {}
+        self._funcs: Dict[int, str] = {}
+
+    def record(self, inspector, oid: int, func: str,
+               state: Optional[LoopState]) -> List[GrowthEntry]:
+        '''
+        Record the sizes at the current stop. Returns the variables which
+        started to grow super-linearly.
+        '''
+        if state is None or not state.iteration or state.loop.oid != oid:
+            return []
+
+        variables = list(inspector.get_variables().values())
+        sizes = {variable.name: text_size(variable.value) for variable in variables}
+
+        # A value of the same text size is measured as before, e.g. an
+        # array whose elements change but do not grow
+        previous = {}
+        for variable in variables:
+            series = self.series.get((oid, variable.name, state.loop))
+            if series is not None and series.sizes and series.text_size == sizes[variable.name]:
+                previous[variable.name] = series.sizes[-1]
+
+        measured = server_sizes(inspector, [variable for variable in variables
+                                            if variable.name not in previous])
+        self._funcs[oid] = func
+
+        flagged = []
+        for variable in variables:
+            key = (oid, variable.name, state.loop)
+            series = self.series.setdefault(key, SizeSeries())
+            size = sizes[variable.name]
+            series.add(state.iteration,
+                       measured.get(variable.name, previous.get(variable.name, size)), size)
+
+            if not series.flagged and series.superlinear():
+                series.flagged = True
+                flagged.append(self._entry(key, series))
+
+        return flagged
+
+    def _entry(self, key: Tuple[int, str, Loop], series: SizeSeries) -> GrowthEntry:
+        oid, name, loop = key
+        return GrowthEntry(oid, self._funcs.get(oid), name, loop, series.iterations[-1],
+                           series.sizes[0], series.sizes[-1], series.text_size,
+                           series.exponent(), series.flagged)
+
+    def entries(self) -> List[GrowthEntry]:
+        '''
+        All variables which grew, flagged and largest first.
+        '''
+        entries = [self._entry(key, series) for key, series in self.series.items()
+                   if series.sizes and series.sizes[-1] > series.sizes[0]]
+        return sorted(entries, key=lambda entry: (not entry.flagged, -entry.last))
+
+    def reset(self):
+        self.series = {}
+        self._funcs = {}
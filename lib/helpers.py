@@ -1,6 +1,9 @@
 
+import ipaddress
+
 from collections import namedtuple
-from typing import List, Optional
+from functools import reduce as f_reduce
+from typing import Dict, Iterable, List, Optional
 
 from loguru import logger
 
@@ -8,6 +11,29 @@ from lib.db import DB
 
 
 SQLFunction = namedtuple('SQLFunction', ['name', 'oid'])
+TypeInfo = namedtuple('TypeInfo', ['name', 'category', 'element', 'fields', 'field_types'])
+
+
+def rgetattr(obj, attr, *args):
+    '''
+    Get an attribute recursively. For instance `self.foo.bar` returns `bar`.
+    '''
+    def _getattr(obj, attr):
+        return getattr(obj, attr, *args)
+    return f_reduce(_getattr, [obj] + attr.split('.'))
+
+
+def is_loopback(host: Optional[str]) -> bool:
+    '''
+    Whether an address to listen on is only reachable from this machine.
+    '''
+    if host == 'localhost':
+        return True
+
+    try:
+        return ipaddress.ip_address(host or '').is_loopback
+    except ValueError:
+        return False
 
 
 def get_all_functions(database: DB) -> List[SQLFunction]:
@@ -39,3 +65,123 @@ def get_func_oid_by_name(database, func_name) -> Optional[int]:
             return item.oid
 
     return None
+
+
+def get_type_infos(database: DB, oids: Iterable[int]) -> Dict[int, TypeInfo]:
+    '''
+    Look up name, category, element type and composite fields of the given
+    type OIDs in a single query.
+    '''
+    oids = ','.join(str(int(oid)) for oid in oids)
+    if not oids:
+        return {}
+
+    rows = database.run_sql(f'''
+        SELECT
+            t.oid
+          , t.typname
+          , t.typcategory
+          , t.typelem
+          , COALESCE(array_agg(a.attname::text ORDER BY a.attnum)
+                FILTER (WHERE a.attnum > 0 AND NOT a.attisdropped), '{{}}')
+          , COALESCE(array_agg(a.atttypid::int ORDER BY a.attnum)
+                FILTER (WHERE a.attnum > 0 AND NOT a.attisdropped), '{{}}')
+        FROM pg_type t
+        LEFT JOIN pg_attribute a ON a.attrelid = t.typrelid
+        WHERE t.oid IN ({oids})
+        GROUP BY t.oid
+    ''', fetch_result=True)
+    return {row[0]: TypeInfo(*row[1:]) for row in rows}
+
+
+# Cheap fingerprint of the PL/pgSQL functions of a database. Creating,
+# replacing or dropping a function changes the number of functions or the sum
+# of the transaction IDs which last wrote them. `xmins` holds the transaction
+# ID of the requested functions only.
+CatalogState = namedtuple('CatalogState', ['database', 'functions', 'xmin_sum', 'xmins'])
+
+
+def get_catalog_state(database: DB, oids: Iterable[int] = ()) -> CatalogState:
+    '''
+    Fingerprint the PL/pgSQL functions and look up the `xmin` of the given
+    function OIDs, all in a single query returning a single row.
+    '''
+    oids = ','.join(str(int(oid)) for oid in oids) or 'NULL'
+    rows = database.run_sql(f'''
+        SELECT
+            current_database()::text
+          , count(*)
+          , COALESCE(sum(p.xmin::text::bigint), 0)::text
+          , COALESCE(json_object_agg(p.oid, p.xmin::text)
+                FILTER (WHERE p.oid IN ({oids})), '{{}}'::json)
+        FROM pg_proc p
+        JOIN pg_language l ON p.prolang = l.oid
+        WHERE l.lanname = 'plpgsql'
+    ''', fetch_result=True)
+    name, functions, xmin_sum, xmins = rows[0]
+    return CatalogState(name, functions, xmin_sum, {int(oid): xmin for oid, xmin in xmins.items()})
+
+
+class FunctionCatalog:
+    '''
+    The PL/pgSQL functions of a database, fetched once. Remembers the
+    fingerprint of the catalog at that time, such that a saved copy can be
+    validated later on. `version` is bumped whenever the functions change,
+    such that indexes built from them can be rebuilt.
+    '''
+
+    def __init__(self, database: DB):
+        self.database = database
+        self.fingerprint = None
+        self.version = 0
+        self._functions = None
+        self._by_name: Dict[str, int] = {}
+
+    @property
+    def loaded(self) -> bool:
+        return self._functions is not None
+
+    def functions(self) -> List[SQLFunction]:
+        if self._functions is None:
+            state = get_catalog_state(self.database)
+            self.set(get_all_functions(self.database), (state.functions, state.xmin_sum))
+
+        return self._functions
+
+    def set(self, functions: List[SQLFunction], fingerprint: tuple):
+        self._functions = functions
+        self.fingerprint = fingerprint
+        self.version += 1
+        # The first of overloaded functions wins, like `get_func_oid_by_name`
+        self._by_name = {}
+        for function in functions:
+            self._by_name.setdefault(function.name.partition('(')[0], function.oid)
+
+    def invalidate(self):
+        self._functions = None
+        self.fingerprint = None
+        self.version += 1
+        self._by_name = {}
+
+    def validate(self) -> bool:
+        '''
+        Drop the functions if the catalog changed since they were fetched.
+        Costs a single-row query instead of fetching all functions again.
+        '''
+        if self._functions is None:
+            return False
+
+        state = get_catalog_state(self.database)
+        if self.fingerprint != (state.functions, state.xmin_sum):
+            logger.debug('Functions changed, fetching them again')
+            self.invalidate()
+            return False
+
+        return True
+
+    def oid(self, func_name: str) -> Optional[int]:
+        '''
+        Like `get_func_oid_by_name`, but from the catalog.
+        '''
+        self.functions()
+        return self._by_name.get(func_name)
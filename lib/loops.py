@@ -0,0 +1,146 @@
+'''
+This module detects loops the target is executing. Loops are found in the
+source (`LOOP` ... `END LOOP`, which covers `FOR`, `FOREACH` and `WHILE`
+loops) and iterations are counted from the stops: every time the first line
+of the body is reached again, the loop started a new iteration. The step
+history is only kept as the last step every line was seen at, so observing a
+stop takes constant time no matter how long the target runs.
+'''
+
+import re
+
+from collections import namedtuple
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from lib.proxy import Breakpoint
+
+
+Loop = namedtuple('Loop', ['oid', 'start', 'end'])
+# Where the target is in a loop. `period` is the number of steps since the
+# current line was seen last, i.e. the length of one iteration.
+LoopState = namedtuple('LoopState', ['loop', 'iteration', 'period'])
+
+LOOP_START = re.compile(r'\bloop\b', re.IGNORECASE)
+LOOP_END = re.compile(r'\bend\s+loop\b', re.IGNORECASE)
+STRINGS = re.compile(r"'(?:[^']|'')*'?")
+
+
+def find_loops(source: List[str]) -> List[Tuple[int, int]]:
+    '''
+    Line ranges of all loops of a function, from the line opening the loop
+    to its `END LOOP`. Nested loops are included.
+    '''
+    opened = []
+    loops = []
+    for number, text in enumerate(source, 1):
+        code = STRINGS.sub("''", text).split('--')[0]
+        if LOOP_END.search(code):
+            if opened:
+                loops.append((opened.pop(), number))
+        elif LOOP_START.search(code):
+            opened.append(number)
+
+    return sorted(loops)
+
+
+class LoopTracker:
+    '''
+    Observes the stops of the target and tracks the iterations of the loops
+    it is in. Sources are fetched by OID through `get_source`.
+    '''
+
+    def __init__(self, get_source: Callable[[int], List[str]]):
+        self.get_source = get_source
+        self.stop = None
+        self.state: Optional[LoopState] = None
+        self._structures: Dict[int, List[Tuple[int, int]]] = {}
+        self._steps = 0
+        self._last_seen: Dict[Tuple[int, int], int] = {}
+        self._iterations: Dict[Loop, int] = {}
+        self._first_lines: Dict[Loop, int] = {}
+
+    def loops(self, oid: int) -> List[Tuple[int, int]]:
+        if oid not in self._structures:
+            self._structures[oid] = find_loops(self.get_source(oid))
+
+        return self._structures[oid]
+
+    def innermost(self, oid: int, line: int) -> Optional[Loop]:
+        '''
+        The innermost loop containing a line.
+        '''
+        containing = [(start, end) for start, end in self.loops(oid) if start <= line <= end]
+        if not containing:
+            return None
+
+        start, end = max(containing)
+        return Loop(oid, start, end)
+
+    def iteration(self, loop: Loop) -> int:
+        return self._iterations.get(loop, 0)
+
+    def first_line(self, loop: Loop) -> Optional[int]:
+        '''
+        The first line of the body seen, reaching it starts an iteration.
+        '''
+        return self._first_lines.get(loop)
+
+    def _observe(self, position: Breakpoint) -> Optional[LoopState]:
+        self._steps += 1
+        key = (position.oid, position.line)
+        previous = self._last_seen.get(key)
+        self._last_seen[key] = self._steps
+
+        # Loops of this function which the target left start from scratch
+        for loop in [loop for loop in self._iterations if loop.oid == position.oid]:
+            if not loop.start <= position.line <= loop.end:
+                del self._iterations[loop]
+                self._first_lines.pop(loop, None)
+
+        loop = self.innermost(position.oid, position.line)
+        if loop is None:
+            return None
+
+        iteration = self._iterations.setdefault(loop, 0)
+        if position.line > loop.start:
+            first = self._first_lines.setdefault(loop, position.line)
+            if position.line == first:
+                iteration += 1
+                self._iterations[loop] = iteration
+
+        return LoopState(loop, iteration, self._steps - previous if previous else None)
+
+    def observe(self, position: Optional[Breakpoint], stop: int) -> Optional[LoopState]:
+        '''
+        Observe where the target stopped. `stop` numbers the stops of the
+        proxy, every stop is only counted once.
+        '''
+        if stop != self.stop:
+            self.stop = stop
+            self.state = self._observe(position) if position else None
+
+        return self.state
+
+    def observe_steps(self, positions: Iterable[Breakpoint], stopped: Optional[Breakpoint],
+                      stop: int) -> Optional[LoopState]:
+        '''
+        Observe many stops at once, e.g. after stepping many times. `stopped`
+        is where the target is now, None if it finished.
+        '''
+        for position in positions:
+            self.state = self._observe(position)
+
+        if stopped is None:
+            self.state = None
+
+        self.stop = stop
+        return self.state
+
+    def reset(self):
+        self.stop = None
+        self.state = None
+        self._structures = {}
+        self._steps = 0
+        self._last_seen = {}
+        self._iterations = {}
+        self._first_lines = {}
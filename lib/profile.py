@@ -0,0 +1,297 @@
+'''
+This module builds profiles of PL/pgSQL functions and exports them for
+standard viewers: callgrind for KCachegrind, speedscope JSON and pprof.
+
+A profile maps call stacks to the number of steps and the time spent there.
+A stack is a tuple of (OID, line) pairs from the outermost call to the line
+that was executed. Profiles are recorded by stepping the target with stacks,
+or loaded from trace files, which only know the line and hence give stacks
+of a single frame. The time of a step is attributed to the stack the target
+was resumed from, i.e. the line which was executed.
+
+Viewers show source files, hence the source of every function is written
+next to the exported profile, one file per function.
+'''
+
+import gzip
+import json
+import os
+import re
+
+from collections import namedtuple
+from typing import Dict, Iterable, List, Optional, TextIO, Tuple
+
+from loguru import logger
+
+from lib.db import DB
+from lib.stepper import STEP_BATCH
+
+
+FORMATS = ('callgrind', 'speedscope', 'pprof')
+
+Position = Tuple[int, int]
+Stack = Tuple[Position, ...]
+ProfileSummary = namedtuple('ProfileSummary', ['steps', 'elapsed_us', 'stacks', 'functions'])
+FunctionSymbol = namedtuple('FunctionSymbol', ['name', 'source', 'path'])
+
+
+def stack_key(frames) -> Stack:
+    '''
+    The stack of `Frame` rows as (OID, line) pairs, outermost call first.
+    '''
+    return tuple((frame.oid, frame.line) for frame in reversed(frames))
+
+
+class Profile:
+    '''
+    Steps and time in microseconds per call stack.
+    '''
+
+    def __init__(self):
+        self.stacks: Dict[Stack, List[int]] = {}
+
+    def __len__(self) -> int:
+        return len(self.stacks)
+
+    def add(self, stack: Stack, elapsed_us: int, steps: int = 1):
+        costs = self.stacks.setdefault(stack, [0, 0])
+        costs[0] += steps
+        costs[1] += int(elapsed_us)
+
+    def add_lines(self, hits: Dict[Position, int], elapsed: Dict[Position, int]):
+        '''
+        Add per-line counts without stacks, e.g. of an analysed trace.
+        '''
+        for position, count in hits.items():
+            self.add((position,), elapsed.get(position, 0), count)
+
+    def oids(self) -> List[int]:
+        return sorted({oid for stack in self.stacks for oid, _ in stack})
+
+    def summary(self) -> ProfileSummary:
+        return ProfileSummary(sum(steps for steps, _ in self.stacks.values()),
+                              sum(elapsed for _, elapsed in self.stacks.values()),
+                              len(self.stacks), len(self.oids()))
+
+    def reset(self):
+        self.stacks = {}
+
+
+def record_profile(proxy, profile: Profile, max_steps: Optional[int] = None,
+                   step_into: bool = True) -> int:
+    '''
+    Step the target with stacks until it finishes or took `max_steps` steps
+    and add every step to the profile. Returns the number of steps.
+    '''
+    previous = stack_key(proxy.get_stack())
+    steps = 0
+    while max_steps is None or steps < max_steps:
+        count = STEP_BATCH if max_steps is None else min(STEP_BATCH, max_steps - steps)
+        stops = proxy.step_many(count, step_into, with_stack=True)
+        for stop in stops:
+            if previous:
+                profile.add(previous, stop.elapsed_us)
+            previous = stack_key(stop.stack) if stop.stack else ((stop.oid, stop.line),)
+
+        steps += len(stops)
+        if proxy.position is None or not stops:
+            break
+
+    return steps
+
+
+def get_function_symbols(database: DB, oids: Iterable[int]) -> Dict[int, Tuple[str, str]]:
+    '''
+    Name as `regprocedure` and source of the given functions, in a single
+    query.
+    '''
+    oids = ','.join(str(int(oid)) for oid in oids)
+    if not oids:
+        return {}
+
+    rows = database.run_sql(
+        f'SELECT oid, oid::regprocedure::text, prosrc FROM pg_proc WHERE oid IN ({oids})',
+        fetch_result=True)
+    return {oid: (name, source) for oid, name, source in rows}
+
+
+def source_file_name(oid: int, name: str) -> str:
+    return f'{oid}_{re.sub(r"[^A-Za-z0-9_.]+", "_", name.partition("(")[0])}.sql'
+
+
+def write_sources(symbols: Dict[int, FunctionSymbol]):
+    '''
+    Write the source of every function to the path of its symbol.
+    '''
+    for symbol in symbols.values():
+        os.makedirs(os.path.dirname(symbol.path) or '.', exist_ok=True)
+        with open(symbol.path, 'w') as source_file:
+            source_file.write(symbol.source or '')
+
+
+def write_callgrind(profile: Profile, symbols: Dict[int, FunctionSymbol], out: TextIO):
+    '''
+    Self cost per line and inclusive cost per call site. A call site is the
+    line of the caller, calls are counted in steps.
+    '''
+    self_costs: Dict[Position, List[int]] = {}
+    calls: Dict[Tuple[Position, int], List[int]] = {}
+    for stack, (steps, elapsed) in profile.stacks.items():
+        costs = self_costs.setdefault(stack[-1], [0, 0])
+        costs[0] += steps
+        costs[1] += elapsed
+
+        # Recursive calls are only counted once per stack
+        for edge in {(caller, callee[0]) for caller, callee in zip(stack, stack[1:])}:
+            costs = calls.setdefault(edge, [0, 0])
+            costs[0] += steps
+            costs[1] += elapsed
+
+    out.write('# callgrind format\nversion: 1\ncreator: plpgsql-pydebug\n'
+              'positions: line\nevents: Steps Microseconds\n\n')
+    for oid in profile.oids():
+        symbol = symbols[oid]
+        out.write(f'fl={symbol.path}\nfn={symbol.name}\n')
+        for (line_oid, line), (steps, elapsed) in sorted(self_costs.items()):
+            if line_oid == oid:
+                out.write(f'{line} {steps} {elapsed}\n')
+
+        for ((caller_oid, line), callee), (steps, elapsed) in sorted(calls.items()):
+            if caller_oid == oid:
+                out.write(f'cfl={symbols[callee].path}\ncfn={symbols[callee].name}\n'
+                          f'calls={steps} 1\n{line} {steps} {elapsed}\n')
+        out.write('\n')
+
+
+def speedscope_document(profile: Profile, symbols: Dict[int, FunctionSymbol],
+                        name: str = 'plpgsql-pydebug') -> dict:
+    '''
+    A sampled speedscope profile, one frame per line and one sample per
+    distinct stack weighted by its time.
+    '''
+    frames = []
+    indexes: Dict[Position, int] = {}
+    samples = []
+    weights = []
+    for stack, (_, elapsed) in sorted(profile.stacks.items()):
+        sample = []
+        for oid, line in stack:
+            if (oid, line) not in indexes:
+                indexes[(oid, line)] = len(frames)
+                frames.append({'name': f'{symbols[oid].name}:{line}',
+                               'file': symbols[oid].path, 'line': line})
+            sample.append(indexes[(oid, line)])
+        samples.append(sample)
+        weights.append(elapsed)
+
+    return {
+        '$schema': 'https://www.speedscope.app/file-format-schema.json',
+        'name': name,
+        'exporter': 'plpgsql-pydebug',
+        'shared': {'frames': frames},
+        'profiles': [{'type': 'sampled', 'name': name, 'unit': 'microseconds',
+                      'startValue': 0, 'endValue': sum(weights),
+                      'samples': samples, 'weights': weights}],
+    }
+
+
+def _varint(value: int) -> bytes:
+    data = bytearray()
+    while True:
+        byte = value & 0x7f
+        value >>= 7
+        if value:
+            data.append(byte | 0x80)
+        else:
+            data.append(byte)
+            return bytes(data)
+
+
+def _field(number: int, value: int) -> bytes:
+    return _varint(number << 3) + _varint(value)
+
+
+def _message(number: int, data: bytes) -> bytes:
+    return _varint(number << 3 | 2) + _varint(len(data)) + data
+
+
+def _packed(number: int, values: Iterable[int]) -> bytes:
+    return _message(number, b''.join(_varint(value) for value in values))
+
+
+def pprof_profile(profile: Profile, symbols: Dict[int, FunctionSymbol]) -> bytes:
+    '''
+    The profile as gzipped `profile.proto` message, one location per line.
+    Only the fields used by pprof are written.
+    '''
+    strings = {'': 0}
+
+    def _string(text: str) -> int:
+        return strings.setdefault(text, len(strings))
+
+    # Profile.sample_type: ValueType{type, unit}
+    data = bytearray()
+    for kind, unit in (('steps', 'count'), ('time', 'microseconds')):
+        data += _message(1, _field(1, _string(kind)) + _field(2, _string(unit)))
+
+    locations: Dict[Position, int] = {}
+    for stack, costs in sorted(profile.stacks.items()):
+        for position in stack:
+            locations.setdefault(position, len(locations) + 1)
+        # Profile.sample: Sample{location_id (leaf first), value}
+        ids = [locations[position] for position in reversed(stack)]
+        data += _message(2, _packed(1, ids) + _packed(2, costs))
+
+    functions = {oid: number for number, oid in enumerate(profile.oids(), 1)}
+    for (oid, line), number in locations.items():
+        # Profile.location: Location{id, line: Line{function_id, line}}
+        data += _message(4, _field(1, number) + _message(4, _field(1, functions[oid])
+                                                         + _field(2, line)))
+
+    for oid, number in functions.items():
+        # Profile.function: Function{id, name, system_name, filename, start_line}
+        symbol = symbols[oid]
+        data += _message(5, _field(1, number) + _field(2, _string(symbol.name))
+                         + _field(3, _string(symbol.name)) + _field(4, _string(symbol.path))
+                         + _field(5, 1))
+
+    # Profile.period_type and period: one step
+    data += _message(11, _field(1, _string('steps')) + _field(2, _string('count')))
+    data += _field(12, 1)
+
+    # Profile.string_table, the empty string comes first
+    for text in strings:
+        data += _message(6, text.encode())
+
+    return gzip.compress(bytes(data))
+
+
+def export_profile(profile: Profile, symbols: Dict[int, Tuple[str, str]], fmt: str,
+                   path: str) -> str:
+    '''
+    Write the profile in the given format to `path`, and the sources of its
+    functions to the directory `<path>.sources`. Returns the directory.
+    '''
+    if fmt not in FORMATS:
+        raise ValueError(f'Unknown format {fmt}, use {", ".join(FORMATS)}')
+
+    directory = f'{path}.sources'
+    resolved = {}
+    for oid in profile.oids():
+        name, source = symbols.get(oid, (str(oid), None))
+        resolved[oid] = FunctionSymbol(name, source,
+                                       os.path.join(directory, source_file_name(oid, name)))
+    write_sources(resolved)
+
+    if fmt == 'callgrind':
+        with open(path, 'w') as out:
+            write_callgrind(profile, resolved, out)
+    elif fmt == 'speedscope':
+        with open(path, 'w') as out:
+            json.dump(speedscope_document(profile, resolved, os.path.basename(path)), out)
+    else:
+        with open(path, 'wb') as out:
+            out.write(pprof_profile(profile, resolved))
+
+    logger.debug(f'Wrote {fmt} profile to {path}')
+    return directory
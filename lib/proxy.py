@@ -4,15 +4,19 @@ debugger proxy which eventually controls target execution.
 '''
 
 from collections import namedtuple
-from typing import Tuple, Any, List
+from time import perf_counter
+from typing import Tuple, Any, Callable, Iterable, List, Optional
 
 from loguru import logger
 
 from lib.db import DB
+from lib.stepper import STEPPER_FUNCTION
 
 
 Breakpoint = namedtuple('Breakpoint', ['oid', 'line', 'func'])
 Frame = namedtuple('Frame', ['call_count', 'target_name', 'oid', 'line', 'args'])
+# A stop while stepping many times: where and how long the step took
+Step = namedtuple('Step', ['oid', 'line', 'func', 'elapsed_us', 'stack'])
 Variable = namedtuple('Variable', ['name', 'var_class', 'line', 'unique', 'const',
                                    'not_null', 'dtype', 'value'])
 
@@ -25,11 +29,58 @@ class Proxy:
     def __init__(self, dsn: str):
         self.database = DB(dsn)
         self.session_id = None
+        self.position = None
+        # Bumped whenever the target stopped, results of read-only calls are
+        # only valid for one epoch
+        self.epoch = 0
+        # Bumped whenever a variable was changed while the target stayed put
+        self.deposits = 0
+        # Selected frame, 0 is the frame the target stopped in
+        self.frame = 0
+        # Number of times the target stopped
+        self.stops = 0
+        self._memo = {}
+        self._memo_epoch = 0
+        # Whether the helper stepping many times on the server is installed
+        self.stepper = False
+        # Collectors notified before and after the target is resumed
+        self.collectors = []
+
+    def cleanup(self):
+        '''
+        Cleanup routine for the proxy.
+        '''
+        self.database.cleanup()
 
     def _run_cmd(self, cmd: str, args: List) -> List:
         args = ','.join([str(arg) for arg in args])
         return self.database.run_sql(f'SELECT * FROM {cmd}({args})', fetch_result=True)
 
+    def _memoized(self, key: tuple, fetch: Callable[[], Any]) -> Any:
+        '''
+        Return the result of a read-only call, only calling the server once
+        per epoch for the same key.
+        '''
+        if self._memo_epoch != self.epoch:
+            self._memo = {}
+            self._memo_epoch = self.epoch
+
+        if key not in self._memo:
+            self._memo[key] = fetch()
+
+        return self._memo[key]
+
+    def _forget(self, kind: str):
+        '''
+        Drop the memoized results of one kind of call, e.g. after changing the
+        breakpoints, without ending the epoch.
+        '''
+        self._memo = {key: value for key, value in self._memo.items() if key[0] != kind}
+
+    @classmethod
+    def _literal(cls, value: str) -> str:
+        return "'" + str(value).replace("'", "''") + "'"
+
     def attach(self, port: int) -> int:
         '''
         Attach to an opened debugger port.
@@ -37,12 +88,38 @@ class Proxy:
         result = self._run_cmd('pldbg_attach_to_port', [port])
         self.session_id = result[0][0]
 
-    def cont(self):
+    def _stopped_at(self, result: List) -> Optional[Breakpoint]:
+        '''
+        Remember where the target stopped after it was resumed.
+        '''
+        self.position = Breakpoint(*result[0]) if result else None
+        self.epoch += 1
+        self.stops += 1
+        self.frame = 0
+        return self.position
+
+    def _resume(self, cmd: str) -> Optional[Breakpoint]:
+        '''
+        Resume the target and wait until it stops again.
+        '''
+        previous = self.position
+        for collector in self.collectors:
+            collector.before()
+
+        result = self._run_cmd(cmd, [self.session_id])
+        logger.debug(f'{cmd} result: {result}')
+        position = self._stopped_at(result)
+
+        for collector in self.collectors:
+            collector.after(previous)
+
+        return position
+
+    def cont(self) -> Optional[Breakpoint]:
         '''
         Continue execution until the next breakpoint.
         '''
-        result = self._run_cmd('pldbg_continue', [self.session_id])
-        logger.debug(f'Continue result: {result}')
+        return self._resume('pldbg_continue')
 
     def abort(self):
         '''
@@ -55,47 +132,169 @@ class Proxy:
         '''
         Get variables of the currently active frame in the active session.
         '''
-        result = self._run_cmd('pldbg_get_variables', [self.session_id])
-        return [Variable(*row) for row in result]
+        def _fetch():
+            result = self._run_cmd('pldbg_get_variables', [self.session_id])
+            return [Variable(*row) for row in result]
+
+        return self._memoized(('variables', self.frame), _fetch)
 
     def step_over(self) -> Breakpoint:
         '''
         Step over a call until next blocking statement.
         '''
-        result = self._run_cmd('pldbg_step_over', [self.session_id])
-        return Breakpoint(*result[0])
+        return self._resume('pldbg_step_over')
 
     def step_into(self) -> Breakpoint:
         '''
         Step into a call, stop at next blocking statement.
         '''
-        result = self._run_cmd('pldbg_step_into', [self.session_id])
-        return Breakpoint(*result[0])
+        return self._resume('pldbg_step_into')
+
+    def step_many(self, steps: int, step_into: bool = True,
+                  stop_at: Iterable[Tuple[int, int]] = (), until: Optional[str] = None,
+                  with_stack: bool = False) -> List[Step]:
+        '''
+        Step up to `steps` times and return every stop. Stops early when the
+        target finishes, at one of the (OID, line) positions in `stop_at` or
+        when the SQL predicate `until` over `oid` and `line` is true. With the
+        stepper helper installed, this takes a single round trip, unless
+        collectors have to see every step.
+        '''
+        stop_at = list(stop_at)
+        if not self.stepper or self.collectors:
+            return self._step_many_client(steps, step_into, stop_at, until, with_stack)
+
+        oids = ','.join(str(oid) for oid, _ in stop_at)
+        lines = ','.join(str(line) for _, line in stop_at)
+        result = self.database.run_sql(
+            f'SELECT func, line, targetname, elapsed_us, stack FROM {STEPPER_FUNCTION}('
+            f'{self.session_id}, {int(steps)}, {step_into}, ARRAY[{oids}]::oid[], '
+            f'ARRAY[{lines}]::int[], {Proxy._literal(until) if until else "NULL"}, '
+            f'{with_stack})', fetch_result=True)
+
+        stops = [Step(oid, line, func, elapsed_us,
+                      [Frame(*frame) for frame in stack] if stack else None)
+                 for oid, line, func, elapsed_us, stack in result]
+
+        # An empty stop at the end means the target finished
+        if stops and stops[-1].oid is None:
+            stops.pop()
+            self._stopped_at([])
+        elif stops:
+            self._stopped_at([stops[-1][:3]])
+
+        return stops
+
+    def _step_many_client(self, steps: int, step_into: bool, stop_at: List[Tuple[int, int]],
+                          until: Optional[str], with_stack: bool) -> List[Step]:
+        step = self.step_into if step_into else self.step_over
+        stops = []
+        for _ in range(steps):
+            started = perf_counter()
+            position = step()
+            elapsed_us = int((perf_counter() - started) * 1e6)
+            if position is None:
+                break
+
+            stops.append(Step(position.oid, position.line, position.func, elapsed_us,
+                              self.get_stack() if with_stack else None))
+
+            if (position.oid, position.line) in stop_at:
+                break
+
+            if until and self.database.run_sql(
+                    f'SELECT ({until}) FROM (SELECT {position.oid}::oid AS oid, '
+                    f'{position.line} AS line) AS position', fetch_result=True)[0][0]:
+                break
+
+        return stops
 
     def get_source(self, oid) -> str:
         '''
         Get source of the provided OID.
         '''
-        result = self._run_cmd('pldbg_get_source', [self.session_id, oid])
-        return result[0][0]
+        return self._memoized(
+            ('source', oid),
+            lambda: self._run_cmd('pldbg_get_source', [self.session_id, oid])[0][0])
 
     def get_stack(self) -> List[Frame]:
         '''
         Get current stack of the active session.
         '''
-        result = self._run_cmd('pldbg_get_stack', [self.session_id])
-        return [Frame(*row) for row in result]
+        def _fetch():
+            result = self._run_cmd('pldbg_get_stack', [self.session_id])
+            return [Frame(*row) for row in result]
+
+        return self._memoized(('stack',), _fetch)
+
+    def select_frame(self, frame: int) -> Optional[Breakpoint]:
+        '''
+        Select a frame of the stack, variables are then read from this frame.
+        '''
+        result = self._run_cmd('pldbg_select_frame', [self.session_id, frame])
+        self.frame = frame
+        return Breakpoint(*result[0]) if result else None
 
     def get_breakpoints(self) -> List[Breakpoint]:
         '''
         Get all breakpoints of the current session.
         '''
-        result = self._run_cmd('pldbg_get_breakpoints', [self.session_id])
-        return [Breakpoint(*row) for row in result]
+        def _fetch():
+            result = self._run_cmd('pldbg_get_breakpoints', [self.session_id])
+            return [Breakpoint(*row) for row in result]
+
+        return self._memoized(('breakpoints',), _fetch)
 
     def set_breakpoint(self, oid, line_number):
         '''
         Set a breakpoint for the provided OID at given line number.
         '''
         result = self._run_cmd('pldbg_set_breakpoint', [self.session_id, oid, line_number])
+        self._forget('breakpoints')
         logger.debug(f'Set breakpoint result: {result}')
+
+    def drop_breakpoint(self, oid, line_number):
+        '''
+        Drop the breakpoint for the provided OID at given line number.
+        '''
+        result = self._run_cmd('pldbg_drop_breakpoint', [self.session_id, oid, line_number])
+        self._forget('breakpoints')
+        logger.debug(f'Drop breakpoint result: {result}')
+
+    def _bulk_breakpoints(self, func: str, breakpoints: List[Tuple[int, int]]):
+        if not breakpoints:
+            return
+
+        oids = ','.join(str(oid) for oid, _ in breakpoints)
+        lines = ','.join(str(line) for _, line in breakpoints)
+        result = self.database.run_sql(
+            f'SELECT {func}({self.session_id}, b.oid, b.line) '
+            f'FROM unnest(ARRAY[{oids}]::oid[], ARRAY[{lines}]::int[]) AS b(oid, line)',
+            fetch_result=True)
+        self._forget('breakpoints')
+        logger.debug(f'{func} result: {result}')
+
+    def set_breakpoints(self, breakpoints: List[Tuple[int, int]]):
+        '''
+        Set many breakpoints, given as (OID, line number), in one round trip.
+        '''
+        self._bulk_breakpoints('pldbg_set_breakpoint', breakpoints)
+
+    def drop_breakpoints(self, breakpoints: List[Tuple[int, int]]):
+        '''
+        Drop many breakpoints, given as (OID, line number), in one round trip.
+        '''
+        self._bulk_breakpoints('pldbg_drop_breakpoint', breakpoints)
+
+    def deposit(self, name: str, value: str, line_number: int = -1) -> bool:
+        '''
+        Change the value of a variable in the selected frame.
+        '''
+        result = self._run_cmd('pldbg_deposit_value', [
+            self.session_id, Proxy._literal(name), line_number, Proxy._literal(value)])
+        self.deposits += 1
+        # The stack shows the arguments of each frame, which may have changed
+        self._forget('variables')
+        self._forget('stack')
+        logger.debug(f'Deposit result: {result}')
+        return bool(result and result[0][0])
@@ -0,0 +1,92 @@
+'''
+This module keeps track of resources the debugger creates on the server, like
+connections, listening targets and breakpoints. Every resource is registered
+with the function releasing it, such that everything can be torn down in
+reverse order of creation, no matter how the debugger stops.
+'''
+
+from collections import namedtuple, OrderedDict
+from itertools import count
+from threading import Lock
+from typing import Callable, List, Optional
+
+from loguru import logger
+
+
+# Scopes: session resources live until the debugging session stops, debugger
+# resources until the debugger exits.
+SESSION = 'session'
+DEBUGGER = 'debugger'
+
+Resource = namedtuple('Resource', ['handle', 'kind', 'name', 'scope', 'close'])
+
+
+class ResourceTracker:
+    '''
+    Registry of live resources. Can be used as context manager, which closes
+    all resources on exit.
+    '''
+
+    def __init__(self):
+        self._resources = OrderedDict()
+        self._handles = count(1)
+        self._lock = Lock()
+
+    def track(self, kind: str, name: str, close: Optional[Callable[[], None]],
+              scope: str = SESSION) -> int:
+        '''
+        Register a resource. `close` releases it, it may be None for
+        resources which are released implicitly (e.g. with their session).
+        Returns a handle to release the resource individually.
+        '''
+        with self._lock:
+            handle = next(self._handles)
+            self._resources[handle] = Resource(handle, kind, name, scope, close)
+
+        logger.debug(f'Tracking {kind} {name}')
+        return handle
+
+    def release(self, handle: int, close: bool = True):
+        '''
+        Stop tracking a resource, closing it unless told otherwise.
+        '''
+        with self._lock:
+            resource = self._resources.pop(handle, None)
+
+        if resource and close:
+            ResourceTracker._close(resource)
+
+    @classmethod
+    def _close(cls, resource: Resource):
+        if resource.close is None:
+            return
+
+        try:
+            logger.debug(f'Releasing {resource.kind} {resource.name}')
+            resource.close()
+        except Exception:
+            logger.exception(f'Could not release {resource.kind} {resource.name}')
+
+    def close_all(self, scope: Optional[str] = None):
+        '''
+        Close all resources (of a scope) in reverse order of creation. Errors
+        are logged, the remaining resources are still closed.
+        '''
+        with self._lock:
+            resources = [resource for resource in self._resources.values()
+                         if scope is None or resource.scope == scope]
+            for resource in resources:
+                del self._resources[resource.handle]
+
+        for resource in reversed(resources):
+            ResourceTracker._close(resource)
+
+    def live(self) -> List[Resource]:
+        with self._lock:
+            return list(self._resources.values())
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close_all()
@@ -0,0 +1,178 @@
+'''
+This module streams the result of the target function. The call runs through
+a server-side cursor and rows are fetched in batches, such that set-returning
+functions with millions of rows never have to fit into client memory. Batches
+go to a sink: logged, written to a file or discarded. Discarding skips over
+the rows on the server without transferring them.
+
+Asynchronous connections cannot use named cursors of psycopg2, hence the
+cursor is declared and fetched from with plain SQL inside a transaction.
+'''
+
+import csv
+import sys
+
+from collections import namedtuple
+from queue import Queue
+from time import perf_counter
+from typing import List, Optional
+
+import psycopg2
+
+from loguru import logger
+
+
+# Rows fetched per round trip
+FETCH_SIZE = 1000
+
+RESULT_CURSOR = 'pydebug_target_result'
+
+ResultStats = namedtuple('ResultStats', ['rows', 'batches', 'bytes', 'peak_batch_bytes',
+                                         'elapsed'])
+
+
+def batch_size(rows: List[tuple]) -> int:
+    '''
+    Approximate memory taken by a batch of rows in bytes.
+    '''
+    return sys.getsizeof(rows) + sum(
+        sys.getsizeof(row) + sum(sys.getsizeof(value) for value in row) for row in rows)
+
+
+class ResultSink:
+    '''
+    Receives the batches of a result and keeps the statistics of the last one.
+    '''
+
+    name = 'log'
+    # Whether rows can be skipped on the server instead of being fetched
+    discard = False
+
+    def __init__(self):
+        self.stats: Optional[ResultStats] = None
+        self._rows = 0
+        self._batches = 0
+        self._bytes = 0
+        self._peak = 0
+        self._started = 0.0
+
+    def begin(self):
+        self._rows, self._batches, self._bytes, self._peak = 0, 0, 0, 0
+        self._started = perf_counter()
+
+    def write(self, rows: List[tuple]):
+        size = batch_size(rows)
+        self._rows += len(rows)
+        self._batches += 1
+        self._bytes += size
+        self._peak = max(self._peak, size)
+
+    def skipped(self, rows: int):
+        self._rows += rows
+
+    def end(self) -> ResultStats:
+        self.stats = ResultStats(self._rows, self._batches, self._bytes, self._peak,
+                                 perf_counter() - self._started)
+        return self.stats
+
+    def close(self):
+        pass
+
+    def __str__(self) -> str:
+        return self.name
+
+
+class LogSink(ResultSink):
+    '''
+    Logs every batch at debug level, the default.
+    '''
+
+    def write(self, rows: List[tuple]):
+        super().write(rows)
+        logger.debug(f'Target result: {rows}')
+
+
+class DiscardSink(ResultSink):
+    '''
+    Only counts the rows, which are skipped on the server.
+    '''
+
+    name = 'discard'
+    discard = True
+
+
+class FileSink(ResultSink):
+    '''
+    Writes rows tab-separated to a file. Every run of the target overwrites
+    the file.
+    '''
+
+    name = 'file'
+
+    def __init__(self, path: str):
+        super().__init__()
+        self.path = path
+        self._file = None
+        self._writer = None
+
+    def begin(self):
+        super().begin()
+        self.close()
+        self._file = open(self.path, 'w', newline='')
+        self._writer = csv.writer(self._file, delimiter='\t', lineterminator='\n')
+
+    def write(self, rows: List[tuple]):
+        super().write(rows)
+        self._writer.writerows(rows)
+
+    def end(self) -> ResultStats:
+        self.close()
+        return super().end()
+
+    def close(self):
+        if self._file:
+            self._file.close()
+            self._file = None
+            self._writer = None
+
+    def __str__(self) -> str:
+        return f'file {self.path}'
+
+
+def stream_result(database, query: str, sink: ResultSink, fetch_size: int = FETCH_SIZE,
+                  notice_queue: Optional[Queue] = None) -> ResultStats:
+    '''
+    Run a query through a server-side cursor and pass its rows to the sink
+    in batches of `fetch_size` rows. The transaction is rolled back if the
+    query fails or gets cancelled.
+    '''
+    sink.begin()
+    try:
+        database.run_sql('BEGIN', notice_queue=notice_queue)
+        database.run_sql(f'DECLARE {RESULT_CURSOR} NO SCROLL CURSOR FOR {query}',
+                         notice_queue=notice_queue)
+
+        if sink.discard:
+            sink.skipped(database.count_rows(f'MOVE FORWARD ALL FROM {RESULT_CURSOR}',
+                                             notice_queue=notice_queue))
+        else:
+            while True:
+                rows = database.run_sql(f'FETCH FORWARD {fetch_size} FROM {RESULT_CURSOR}',
+                                        fetch_result=True, notice_queue=notice_queue)
+                if rows:
+                    sink.write(rows)
+                if len(rows or []) < fetch_size:
+                    break
+
+        database.run_sql(f'CLOSE {RESULT_CURSOR}', notice_queue=notice_queue)
+        database.run_sql('COMMIT', notice_queue=notice_queue)
+
+    except (psycopg2.Error, KeyboardInterrupt):
+        try:
+            database.run_sql('ROLLBACK')
+        except psycopg2.Error:
+            logger.debug('Could not roll back the target transaction')
+        sink.end()
+        raise
+
+    return sink.end()
@@ -0,0 +1,79 @@
+'''
+This module hunts slow statements. The target is stepped over statement by
+statement and the wall time of every step is attributed to the line it
+stepped over, i.e. the line the target stopped at before the step. Stepping
+stops the first time a step takes longer than a threshold. The slowest lines
+seen so far are kept across runs.
+'''
+
+import heapq
+
+from collections import namedtuple
+from time import perf_counter
+from typing import Dict, List, Optional, Tuple
+
+from lib.proxy import Breakpoint, Proxy
+
+
+SlowLine = namedtuple('SlowLine', ['oid', 'line', 'func', 'hits', 'max_ms', 'total_ms'])
+SlowStep = namedtuple('SlowStep', ['line', 'elapsed_ms', 'position'])
+SlowReport = namedtuple('SlowReport', ['threshold_ms', 'slow', 'stack', 'variables', 'top'])
+
+
+class SlowLineTracker:
+    '''
+    Keeps the time spent per line and ranks lines by their slowest step.
+    '''
+
+    def __init__(self):
+        self._lines: Dict[Tuple[int, int], SlowLine] = {}
+
+    def __len__(self) -> int:
+        return len(self._lines)
+
+    def record(self, position: Breakpoint, elapsed_ms: float) -> SlowLine:
+        key = (position.oid, position.line)
+        line = self._lines.get(key, SlowLine(position.oid, position.line, position.func,
+                                             0, 0.0, 0.0))
+        line = line._replace(hits=line.hits + 1, max_ms=max(line.max_ms, elapsed_ms),
+                             total_ms=line.total_ms + elapsed_ms)
+        self._lines[key] = line
+        return line
+
+    def top(self, count: int = 10) -> List[SlowLine]:
+        '''
+        The `count` lines with the slowest single step.
+        '''
+        return heapq.nlargest(count, self._lines.values(),
+                              key=lambda line: (line.max_ms, line.total_ms))
+
+    def reset(self):
+        self._lines = {}
+
+
+def step_until_slow(proxy: Proxy, tracker: SlowLineTracker, threshold_ms: float,
+                    max_steps: Optional[int] = None) -> Optional[SlowStep]:
+    '''
+    Step over statements until one takes longer than `threshold_ms`. Returns
+    the slow step or None if the target finished (or `max_steps` were taken)
+    before.
+    '''
+    previous = proxy.position
+    steps = 0
+    while max_steps is None or steps < max_steps:
+        started = perf_counter()
+        position = proxy.step_over()
+        elapsed_ms = (perf_counter() - started) * 1000
+        steps += 1
+
+        if previous is not None:
+            tracker.record(previous, elapsed_ms)
+            if elapsed_ms > threshold_ms:
+                return SlowStep(previous, elapsed_ms, position)
+
+        if position is None:
+            return None
+
+        previous = position
+
+    return None
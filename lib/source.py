@@ -0,0 +1,167 @@
+'''
+This module renders the source of PL/pgSQL functions. Sources are fetched and
+highlighted once per OID, only the requested window is formatted on display.
+'''
+
+import re
+
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from prompt_toolkit.formatted_text import FormattedText
+
+
+KEYWORDS = {
+    'alias', 'and', 'as', 'begin', 'by', 'case', 'close', 'constant', 'continue',
+    'declare', 'default', 'delete', 'diagnostics', 'else', 'elsif', 'end',
+    'exception', 'execute', 'exit', 'fetch', 'for', 'foreach', 'found', 'from',
+    'get', 'if', 'in', 'insert', 'into', 'is', 'loop', 'move', 'not', 'notice',
+    'null', 'open', 'or', 'perform', 'query', 'raise', 'return', 'reverse',
+    'select', 'set', 'slice', 'strict', 'then', 'update', 'using', 'values',
+    'when', 'where', 'while',
+}
+
+TOKENS = re.compile(r'''
+    (?P<comment>--.*$)
+  | (?P<string>'(?:[^']|'')*'?)
+  | (?P<number>\b\d+(?:\.\d+)?\b)
+  | (?P<word>[A-Za-z_][A-Za-z_0-9$]*)
+''', re.VERBOSE)
+
+STYLES = {
+    'comment': 'ansibrightblack',
+    'string': 'ansigreen',
+    'number': 'ansimagenta',
+    'keyword': 'ansiblue bold',
+}
+
+Fragment = Tuple[str, str]
+
+
+def highlight_line(line: str) -> List[Fragment]:
+    '''
+    Split a line of PL/pgSQL into styled fragments.
+    '''
+    fragments = []
+    position = 0
+    for match in TOKENS.finditer(line):
+        if match.start() > position:
+            fragments.append(('', line[position:match.start()]))
+
+        kind = match.lastgroup
+        text = match.group()
+        if kind == 'word':
+            kind = 'keyword' if text.lower() in KEYWORDS else ''
+
+        fragments.append((STYLES.get(kind, ''), text))
+        position = match.end()
+
+    if position < len(line):
+        fragments.append(('', line[position:]))
+
+    return fragments
+
+
+class SourceView:
+    '''
+    A window over the source of a function. Keeps the highlighted source of
+    every function seen and remembers the window position for paging.
+    '''
+
+    def __init__(self, window: int = 10):
+        self.window = window
+        self.oid = None
+        self.start = 1
+        self._sources = {}
+        self._highlighted = {}
+
+    def get_lines(self, proxy, oid: int) -> List[str]:
+        '''
+        Return the source lines of the given OID, fetching them only once.
+        '''
+        if oid not in self._sources:
+            self._sources[oid] = proxy.get_source(oid).split('\n')
+
+        return self._sources[oid]
+
+    def cached_lines(self, oid: int) -> Optional[List[str]]:
+        '''
+        The source lines of the given OID if they were fetched already.
+        '''
+        return self._sources.get(oid)
+
+    def sources(self) -> Dict[int, List[str]]:
+        '''
+        The source lines of all functions fetched so far.
+        '''
+        return dict(self._sources)
+
+    def remember(self, oid: int, lines: List[str]):
+        '''
+        Add source lines fetched earlier, e.g. restored from a checkpoint.
+        '''
+        self._sources[oid] = lines
+        self._highlighted.pop(oid, None)
+
+    def _get_highlighted(self, proxy, oid: int) -> List[List[Fragment]]:
+        if oid not in self._highlighted:
+            self._highlighted[oid] = [highlight_line(line) for line in self.get_lines(proxy, oid)]
+
+        return self._highlighted[oid]
+
+    def move(self, oid: int, position: Optional[str], current_line: Optional[int],
+             line_count: int):
+        '''
+        Position the window. `position` is either `+` or `-` to page, a line
+        number to center on, or None to center on the current line.
+        '''
+        if position == '+' and oid == self.oid:
+            start = self.start + 2 * self.window + 1
+        elif position == '-' and oid == self.oid:
+            start = self.start - 2 * self.window - 1
+        elif position and position.isdigit():
+            start = int(position) - self.window
+        elif current_line:
+            start = current_line - self.window
+        else:
+            start = 1
+
+        self.oid = oid
+        self.start = max(1, min(start, line_count - 2 * self.window))
+
+    def render(self, proxy, oid: int, position: Optional[str] = None,
+               current_line: Optional[int] = None,
+               breakpoints: Iterable[int] = (),
+               annotations: Optional[Dict[int, str]] = None) -> List[FormattedText]:
+        '''
+        Render the window of the source of the given OID. Lines with
+        breakpoints are marked with `*`, the current line with `>`.
+        Annotations are shown at the end of their line.
+        '''
+        highlighted = self._get_highlighted(proxy, oid)
+        self.move(oid, position, current_line, len(highlighted))
+
+        breakpoints = set(breakpoints)
+        annotations = annotations or {}
+        end = min(len(highlighted), self.start + 2 * self.window)
+
+        rendered = []
+        for line_number in range(self.start, end + 1):
+            is_current = line_number == current_line
+            marker = ('*' if line_number in breakpoints else ' ') + ('>' if is_current else ' ')
+            gutter = ('bold' if is_current else 'ansibrightblack', f'{marker} {line_number:4}  ')
+            fragments = [gutter] + highlighted[line_number - 1]
+            if line_number in annotations:
+                fragments.append(('ansibrightblack', f'  -- {annotations[line_number]}'))
+            rendered.append(FormattedText(fragments))
+
+        return rendered
+
+    def forget(self, oid: Optional[int] = None):
+        '''
+        Drop cached sources, either of one OID or all.
+        '''
+        for sources in (self._sources, self._highlighted):
+            if oid is None:
+                sources.clear()
+            else:
+                sources.pop(oid, None)
@@ -0,0 +1,85 @@
+'''
+This module navigates the stack of the target. The stack is fetched once per
+stop; sources and variables are only fetched for frames which are visited and
+are reused when visiting a frame again during the same stop.
+'''
+
+from collections import namedtuple
+from typing import List, Optional
+
+from lib.proxy import Frame, Proxy
+from lib.variables import truncate
+
+
+StackEntry = namedtuple('StackEntry', ['level', 'name', 'oid', 'line', 'args', 'selected'])
+
+
+class StackNavigator:
+    '''
+    Keeps the stack of the current stop and the selected frame.
+    '''
+
+    def __init__(self, proxy: Proxy, width: int = 40):
+        self.proxy = proxy
+        self.width = width
+        self._epoch = None
+        self._frames = None
+
+    def frames(self) -> List[Frame]:
+        '''
+        The stack of the current stop, innermost frame first. Deposits
+        change the arguments shown, hence also invalidate it.
+        '''
+        version = (self.proxy.epoch, self.proxy.deposits)
+        if self._epoch != version or self._frames is None:
+            self._frames = self.proxy.get_stack()
+            self._epoch = version
+
+        return self._frames
+
+    def entries(self) -> List[StackEntry]:
+        '''
+        The stack for display, arguments are truncated.
+        '''
+        return [StackEntry(level, frame.target_name, frame.oid, frame.line,
+                           truncate(frame.args, self.width), level == self.proxy.frame)
+                for level, frame in enumerate(self.frames())]
+
+    def location(self) -> Optional[Frame]:
+        '''
+        The selected frame. Does not fetch the stack if the innermost frame is
+        selected, since that is where the target stopped.
+        '''
+        if self.proxy.frame == 0:
+            position = self.proxy.position
+            if position is None:
+                return None
+            return Frame(0, position.func, position.oid, position.line, None)
+
+        return self.frames()[self.proxy.frame]
+
+    def select(self, level: int) -> Frame:
+        '''
+        Select a frame by level. Only talks to the server if the selection
+        actually changes.
+        '''
+        frames = self.frames()
+        if not 0 <= level < len(frames):
+            raise IndexError(f'No frame {level}, the stack has {len(frames)} frames')
+
+        if level != self.proxy.frame:
+            self.proxy.select_frame(level)
+
+        return frames[level]
+
+    def up(self) -> Frame:
+        '''
+        Select the caller of the selected frame.
+        '''
+        return self.select(self.proxy.frame + 1)
+
+    def down(self) -> Frame:
+        '''
+        Select the frame called by the selected frame.
+        '''
+        return self.select(self.proxy.frame - 1)
@@ -0,0 +1,138 @@
+'''
+This module attributes the cost of SQL statements to source lines. It
+snapshots `pg_stat_statements` on a side connection before and after the
+target is resumed and adds the difference in calls, rows, shared blocks and
+execution time to the line the target was resumed from. Statements inside
+functions are only tracked with `pg_stat_statements.track = all`.
+
+The snapshot covers all statements of the database and user, hence other
+sessions of the same user add noise. Statements of the debugger itself are
+excluded.
+'''
+
+from collections import namedtuple
+from typing import Dict, List, Optional, Tuple
+
+from loguru import logger
+
+from lib.db import DB
+from lib.proxy import Breakpoint
+
+
+LineStats = namedtuple('LineStats', ['calls', 'rows', 'shared_blks_hit', 'shared_blks_read',
+                                     'time_ms'])
+LineStatsEntry = namedtuple('LineStatsEntry', ['oid', 'line', 'func', 'stats'])
+
+EMPTY_STATS = LineStats(0, 0, 0, 0, 0.0)
+
+# The execution time column was renamed in PostgreSQL 13
+TIME_COLUMNS = ('total_exec_time', 'total_time')
+
+
+def add_stats(first: LineStats, second: LineStats) -> LineStats:
+    return LineStats(*(a + b for a, b in zip(first, second)))
+
+
+def stats_delta(before: LineStats, after: LineStats) -> LineStats:
+    '''
+    Difference of two snapshots. Statements evicted in between can make
+    counters go backwards, which is clamped to zero.
+    '''
+    return LineStats(*(max(b - a, 0) for a, b in zip(before, after)))
+
+
+class StatementCollector:
+    '''
+    Collects the statement statistics per (OID, line) on its own connection.
+    '''
+
+    def __init__(self, database: DB):
+        self.database = database
+        self.lines: Dict[Tuple[int, int], LineStats] = {}
+        self._funcs: Dict[Tuple[int, int], str] = {}
+        self._time_column: Optional[str] = None
+        self._before: Optional[LineStats] = None
+
+    def available(self) -> bool:
+        '''
+        Whether `pg_stat_statements` can be queried. Warns if statements
+        inside functions are not tracked.
+        '''
+        result = self.database.run_sql(
+            "SELECT attname, current_setting('pg_stat_statements.track', true) "
+            "FROM pg_attribute WHERE attrelid = to_regclass('pg_stat_statements') "
+            f"AND attname IN ({', '.join(repr(column) for column in TIME_COLUMNS)})",
+            fetch_result=True)
+        if not result:
+            logger.error('pg_stat_statements is not installed')
+            return False
+
+        self._time_column = result[0][0]
+        if result[0][1] != 'all':
+            logger.warning('pg_stat_statements.track is not "all", statements inside '
+                           'functions are not tracked')
+
+        return True
+
+    def snapshot(self) -> LineStats:
+        '''
+        Totals over all statements of the database and user, in one row.
+        '''
+        result = self.database.run_sql(
+            'SELECT coalesce(sum(calls), 0), coalesce(sum(rows), 0), '
+            'coalesce(sum(shared_blks_hit), 0), coalesce(sum(shared_blks_read), 0), '
+            f'coalesce(sum({self._time_column}), 0) FROM pg_stat_statements '
+            'WHERE dbid = (SELECT oid FROM pg_database WHERE datname = current_database()) '
+            'AND userid = (SELECT oid FROM pg_roles WHERE rolname = current_user) '
+            "AND query NOT LIKE '%pg_stat_statements%' AND query NOT LIKE '%pldbg\\_%'",
+            fetch_result=True)
+        if not result:
+            return EMPTY_STATS
+
+        calls, rows, hit, read, time_ms = result[0]
+        return LineStats(int(calls), int(rows), int(hit), int(read), float(time_ms))
+
+    def before(self):
+        '''
+        Called right before the target is resumed.
+        '''
+        self._before = self.snapshot()
+
+    def after(self, position: Optional[Breakpoint]):
+        '''
+        Called once the target stopped again. The cost is attributed to the
+        position the target was resumed from.
+        '''
+        before, self._before = self._before, None
+        if before is None or position is None:
+            return
+
+        delta = stats_delta(before, self.snapshot())
+        if delta == EMPTY_STATS:
+            return
+
+        key = (position.oid, position.line)
+        self.lines[key] = add_stats(self.lines.get(key, EMPTY_STATS), delta)
+        self._funcs[key] = position.func
+
+    def annotations(self, oid: int) -> Dict[int, str]:
+        '''
+        Short per-line summaries of a function, to be shown next to the source.
+        '''
+        return {line: (f'{stats.calls} calls, {stats.rows} rows, '
+                       f'{stats.shared_blks_hit + stats.shared_blks_read} blks, '
+                       f'{stats.time_ms:.2f} ms')
+                for (line_oid, line), stats in self.lines.items() if line_oid == oid}
+
+    def entries(self) -> List[LineStatsEntry]:
+        '''
+        All lines with statistics, most expensive first.
+        '''
+        return [LineStatsEntry(oid, line, self._funcs.get((oid, line)), stats)
+                for (oid, line), stats in sorted(self.lines.items(),
+                                                 key=lambda item: item[1].time_ms,
+                                                 reverse=True)]
+
+    def reset(self):
+        self.lines = {}
+        self._funcs = {}
@@ -0,0 +1,116 @@
+'''
+This module installs a helper function which steps the target many times in
+a single round trip. It runs on the proxy backend and calls `pldbg_step_into`
+or `pldbg_step_over` in a loop, returning every stop (and optionally the
+stack at every stop). It stops early when the target finishes, hits one of
+the given breakpoints or a line predicate becomes true.
+
+The helper is optional and creates objects in the database, hence it is only
+installed on request (`stepper install` or `--install-stepper`) into a scratch
+schema. Without it stepping falls back to one round trip per step.
+'''
+
+import psycopg2
+
+from loguru import logger
+
+
+STEPPER_SCHEMA = 'pydebug'
+STEPPER_FUNCTION = f'{STEPPER_SCHEMA}.step_many'
+STEPPER_SIGNATURE = f'{STEPPER_FUNCTION}(integer,integer,boolean,oid[],integer[],text,boolean)'
+
+# Number of steps per round trip when stepping automatically
+STEP_BATCH = 1000
+
+STEPPER_SQL = f'''
+CREATE SCHEMA IF NOT EXISTS {STEPPER_SCHEMA};
+
+CREATE OR REPLACE FUNCTION {STEPPER_FUNCTION}(
+    session integer,
+    steps integer,
+    step_into boolean DEFAULT true,
+    stop_oids oid[] DEFAULT '{{}}',
+    stop_lines integer[] DEFAULT '{{}}',
+    until text DEFAULT NULL,
+    with_stack boolean DEFAULT false)
+RETURNS TABLE(step integer, func oid, line integer, targetname text, elapsed_us bigint,
+              stack json)
+LANGUAGE plpgsql AS $stepper$
+DECLARE
+    bp record;
+    started timestamptz;
+    stop boolean;
+BEGIN
+    FOR i IN 1..steps LOOP
+        started := clock_timestamp();
+        IF step_into THEN
+            SELECT * INTO bp FROM pldbg_step_into(session);
+        ELSE
+            SELECT * INTO bp FROM pldbg_step_over(session);
+        END IF;
+
+        step := i;
+        elapsed_us := (extract(epoch FROM clock_timestamp() - started) * 1000000)::bigint;
+        stack := NULL;
+
+        -- The target finished, report it with an empty stop
+        IF NOT FOUND OR bp.func IS NULL THEN
+            func := NULL;
+            line := NULL;
+            targetname := NULL;
+            RETURN NEXT;
+            RETURN;
+        END IF;
+
+        func := bp.func;
+        line := bp.linenumber;
+        targetname := bp.targetname;
+        IF with_stack THEN
+            SELECT json_agg(json_build_array(s.level, s.targetname, s.func, s.linenumber, s.args))
+            INTO stack
+            FROM pldbg_get_stack(session) s;
+        END IF;
+        RETURN NEXT;
+
+        IF EXISTS (SELECT 1 FROM unnest(stop_oids, stop_lines) AS b(oid, line)
+                   WHERE b.oid = bp.func AND b.line = bp.linenumber) THEN
+            RETURN;
+        END IF;
+
+        IF until IS NOT NULL THEN
+            EXECUTE format('SELECT (%s) FROM (SELECT $1 AS oid, $2 AS line) AS position', until)
+            INTO stop
+            USING bp.func, bp.linenumber;
+            IF stop THEN
+                RETURN;
+            END IF;
+        END IF;
+    END LOOP;
+END
+$stepper$;
+'''
+
+
+def has_stepper(database) -> bool:
+    result = database.run_sql(f"SELECT to_regprocedure('{STEPPER_SIGNATURE}') IS NOT NULL",
+                              fetch_result=True)
+    return bool(result and result[0][0])
+
+
+def install_stepper(database) -> bool:
+    '''
+    Install the helper function unless it exists. Returns whether it can be
+    used, installing requires the privilege to create a schema.
+    '''
+    try:
+        if has_stepper(database):
+            return True
+
+        logger.info(f'Installing {STEPPER_FUNCTION} for batched stepping')
+        database.run_sql(STEPPER_SQL)
+        return has_stepper(database)
+
+    except psycopg2.Error as error:
+        logger.warning(f'Cannot install {STEPPER_FUNCTION}, stepping one by one: '
+                       f'{str(error).strip()}')
+        return False
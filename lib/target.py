@@ -6,16 +6,30 @@ initial breakpoint and starting the function to be debugged.
 import re
 
 from collections import namedtuple
-from queue import Queue
-from threading import Thread
+from queue import Empty, Queue
+from threading import Event, Thread
+from time import monotonic
 from typing import List, Optional, Tuple
 
 from loguru import logger
+import psycopg2
+
 from psycopg2.errors import QueryCanceled
 
 from lib.db import DB
 from lib.helpers import get_func_oid_by_name
+from lib.results import FETCH_SIZE, LogSink, ResultSink, stream_result
+
+
+# The target announces the port to attach to with a notice like
+# `PLDBGBREAK:54321`.
+PORT_NOTICE_PREFIX = 'PLDBGBREAK:'
+
+# Seconds to wait for the target to announce its port
+HANDSHAKE_TIMEOUT = 10.0
 
+# Seconds to wait for the target to finish after the session was aborted
+SHUTDOWN_TIMEOUT = 5.0
 
 
 class Target:
@@ -25,9 +39,19 @@ class Target:
     def __init__(self, dsn: str):
         self.database = DB(dsn, is_async=True)
         self.notice_queue = Queue()
+        # Notices read while waiting for the port, they come before the queue
+        self.pending_notices: List[str] = []
         self.oid = None
         self.executor = None
         self.port = None
+        # Run the function only once instead of restarting it when it finishes
+        self.once = False
+        self.error = None
+        self.attach_time = None
+        self.cancelled = Event()
+        # Where the rows returned by the function go, fetched in batches
+        self.sink: ResultSink = LogSink()
+        self.fetch_size = FETCH_SIZE
 
     def cleanup(self):
         '''
@@ -40,21 +64,82 @@ class Target:
         Get all notices the target might have. Reads from an internal queue,
         does not use the DB itself since it is likely blocked.
         '''
-        notices = []
+        notices, self.pending_notices = self.pending_notices, []
         while not self.notice_queue.empty():
             notices.append(self.notice_queue.get())
         logger.debug(f'Target notices: {notices}')
         return notices
 
     @classmethod
-    def _parse_port(cls, port_raw: str) -> int:
-        return int(port_raw.split(':')[-1])
+    def _parse_port(cls, notice: str) -> Optional[int]:
+        '''
+        Return the port announced by a notice, None if it is any other notice.
+        '''
+        _, prefix, port = notice.partition(PORT_NOTICE_PREFIX)
+        if not prefix:
+            return None
+
+        try:
+            return int(port.strip())
+        except ValueError:
+            return None
+
+    def _wait_for_port(self, timeout: float) -> Optional[int]:
+        '''
+        Wait for the notice announcing the debugger port. Gives up after the
+        timeout, if the start was cancelled or the executor died. All other
+        notices are kept for `get_notices`.
+        '''
+        deadline = monotonic() + timeout
+        while not self.cancelled.is_set():
+            remaining = deadline - monotonic()
+            if remaining <= 0:
+                logger.error(f'Target did not announce a port within {timeout} s')
+                return None
+
+            try:
+                notice = self.notice_queue.get(timeout=min(remaining, 0.1))
+            except Empty:
+                if self.executor is not None and not self.executor.is_alive():
+                    logger.error('Target stopped before announcing a port')
+                    return None
+                continue
+
+            port = Target._parse_port(notice)
+            if port is not None:
+                return port
+
+            # The queue is still filled by the target, skipped notices cannot
+            # be put back without overtaking the ones after them
+            self.pending_notices.append(notice)
+
+        return None
 
-    def wait_for_shutdown(self):
+    def cancel(self):
         '''
-        Wait until the target completed fully.
+        Cancel starting the target and the query it is running.
         '''
-        self.executor.join()
+        self.cancelled.set()
+        self.database.cancel()
+        if self.executor is not None:
+            self.executor.join(timeout=1.0)
+
+    def wait_for_shutdown(self, timeout: Optional[float] = None) -> bool:
+        '''
+        Wait until the target completed fully. If it does not complete within
+        the timeout, its query gets cancelled. Returns whether it completed in
+        time.
+        '''
+        if self.executor is None:
+            return True
+
+        self.executor.join(timeout)
+        if timeout is not None and self.executor.is_alive():
+            logger.warning('Target did not stop, cancelling it')
+            self.cancel()
+            return False
+
+        return True
 
     def _run_executor_thread(self, func_call, func_oid):
         self.executor = Thread(target=self._run, args=(func_call, func_oid))
@@ -65,19 +150,25 @@ class Target:
     def assert_valid_function_call(cls, func_call: str) -> bool:
         return re.match(r'[_a-zA-Z0-9]+\([^\)]*\)(\.[^\)]*\))?', func_call) is not None
 
-    def start(self, func_call: str) -> bool:
+    def start(self, func_call: str, once: bool = False, func_oid: Optional[int] = None,
+              timeout: float = HANDSHAKE_TIMEOUT) -> bool:
         '''
         Start target debugging. Resolve the function to be debugged, find its
-        OID and eventually start a thread calling it.
+        OID and eventually start a thread calling it. The OID can be passed if
+        it is already known. Fails if the target does not announce its port
+        within `timeout` seconds.
         '''
 
-        print(func_call)
+        logger.debug(f'Starting target: {func_call}')
         if not Target.assert_valid_function_call(func_call):
             logger.error(f'Function call seems incomplete: {func_call}')
             return False
 
-        func_name, func_args = Target._parse_func_call(func_call)
-        func_oid = get_func_oid_by_name(self.database, func_name)
+        self.once = once
+        if not func_oid:
+            func_name, func_args = Target._parse_func_call(func_call)
+            func_oid = get_func_oid_by_name(self.database, func_name)
+
         if not func_oid:
             logger.error('Function OID not found. Either function is not '
                          'defined or there are multiple with the same name '
@@ -85,12 +176,23 @@ class Target:
             return False
 
         logger.debug(f'Function OID is: {func_oid}')
+        started = monotonic()
         self._run_executor_thread(func_call, func_oid)
 
         # Wait here until the executor started
         logger.debug('Waiting for port')
-        self.port = Target._parse_port(self.notice_queue.get())
-        logger.debug(f'Port is: {self.port}')
+        try:
+            self.port = self._wait_for_port(timeout)
+        except KeyboardInterrupt:
+            logger.info('Cancelled starting the target')
+            self.port = None
+
+        if self.port is None:
+            self.cancel()
+            return False
+
+        self.attach_time = monotonic() - started
+        logger.debug(f'Port is: {self.port}, announced after {self.attach_time * 1000:.1f} ms')
 
         return True
 
@@ -106,20 +208,27 @@ class Target:
             logger.debug('Starting target function')
 
             try:
-                result = self.database.run_sql(f'SELECT * FROM {func_call}',
-                                         fetch_result=True,
-                                         notice_queue=self.notice_queue)
+                stats = stream_result(self.database, f'SELECT * FROM {func_call}', self.sink,
+                                      self.fetch_size, self.notice_queue)
 
                 # This will now wait here until the function finishes. It will
                 # eventually restart immediately. Otherwise, the proxy process
                 # hangs until it hits a timeout.
 
-                logger.debug(f'Target result: {result}')
+                logger.debug(f'Target returned {stats.rows} rows in {stats.batches} batches')
 
             except QueryCanceled:
                 logger.info('Stopped target query')
                 break
 
+            except psycopg2.Error as error:
+                logger.error(f'Target failed: {error}')
+                self.error = error
+                break
+
+            if self.once:
+                break
+
 
     @classmethod
     def _parse_func_call(cls, func_call: str) -> Tuple[str, List[str]]:
@@ -0,0 +1,104 @@
+'''
+This module records execution traces. A trace is the sequence of lines the
+target stopped at while being stepped automatically, together with the time
+each step took. Traces can be kept in memory or written to a file, one step
+per line. Optionally, a JSON object with the variables at each step is
+appended to the line.
+'''
+
+import json
+
+from collections import Counter
+from time import perf_counter
+from typing import Dict, Generator, Optional, TextIO, Tuple
+
+from loguru import logger
+
+from lib.proxy import Breakpoint, Proxy
+
+
+TRACE_HEADER = '# plpgsql-pydebug trace v1: step, oid, line, elapsed_us[, variables]\n'
+
+
+def auto_step(proxy: Proxy, step_into: bool = True, max_steps: Optional[int] = None,
+              batch: int = 1) -> Generator[Tuple[Breakpoint, float], None, None]:
+    '''
+    Step the target until it finishes and yield every position it stopped at
+    together with the time the step took in seconds. Stops after `max_steps`
+    steps if given. With a `batch` above one, that many steps are taken per
+    round trip.
+    '''
+    if batch > 1:
+        yield from _auto_step_batched(proxy, step_into, max_steps, batch)
+        return
+
+    step = proxy.step_into if step_into else proxy.step_over
+    steps = 0
+    while max_steps is None or steps < max_steps:
+        started = perf_counter()
+        position = step()
+        elapsed = perf_counter() - started
+
+        if position is None:
+            return
+
+        steps += 1
+        yield position, elapsed
+
+    logger.warning(f'Stopped stepping after {steps} steps')
+
+
+def _auto_step_batched(proxy: Proxy, step_into: bool, max_steps: Optional[int],
+                       batch: int) -> Generator[Tuple[Breakpoint, float], None, None]:
+    steps = 0
+    while max_steps is None or steps < max_steps:
+        count = batch if max_steps is None else min(batch, max_steps - steps)
+        for stop in proxy.step_many(count, step_into):
+            steps += 1
+            yield Breakpoint(stop.oid, stop.line, stop.func), stop.elapsed_us / 1e6
+
+        if proxy.position is None:
+            return
+
+    logger.warning(f'Stopped stepping after {steps} steps')
+
+
+class TraceRecorder:
+    '''
+    Records the steps of a target. Keeps the line coverage in memory and
+    optionally writes every step to a trace file.
+    '''
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        self.steps = 0
+        self.elapsed = 0.0
+        self.coverage = Counter()
+        self._file: Optional[TextIO] = None
+
+        if path:
+            self._file = open(path, 'w')
+            self._file.write(TRACE_HEADER)
+
+    def record(self, position: Breakpoint, elapsed: float,
+               variables: Optional[Dict[str, Optional[str]]] = None):
+        self.steps += 1
+        self.elapsed += elapsed
+        self.coverage[(position.oid, position.line)] += 1
+
+        if self._file:
+            line = f'{self.steps}\t{position.oid}\t{position.line}\t{int(elapsed * 1e6)}'
+            if variables is not None:
+                line = f'{line}\t{json.dumps(variables)}'
+            self._file.write(f'{line}\n')
+
+    def close(self):
+        if self._file:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -0,0 +1,405 @@
+'''
+This module inspects variables of the current frame. Values are truncated for
+overviews, single variables can be expanded along a path like
+`var[3].field`. Parsed structures are cached until the target moves on.
+'''
+
+import json
+import re
+
+from collections import namedtuple, OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from lib.decoding import Decoder
+from lib.helpers import TypeInfo, get_type_infos
+
+
+# A resolved value along a path. `value` is either the text representation of
+# a value of type `type_oid`, or already decoded (JSON) if `type_oid` is None.
+Node = namedtuple('Node', ['value', 'type_oid'])
+
+VariableSummary = namedtuple('VariableSummary', ['name', 'type_name', 'value'])
+
+PATH_STEP = re.compile(r'''
+    \[\s*(?P<index>-?\d+)\s*\]
+  | \[\s*"(?P<key>[^"]*)"\s*\]
+  | \.(?P<field>[A-Za-z_][A-Za-z_0-9$]*)
+''', re.VERBOSE)
+
+JSON_TYPES = ('json', 'jsonb')
+
+
+def parse_path(path: str) -> Tuple[str, List[Any]]:
+    '''
+    Split a path like `var[3].field["key"]` into the variable name and its
+    steps. Indices become ints, fields and keys strings.
+    '''
+    path = path.strip()
+    name = re.match(r'[A-Za-z_][A-Za-z_0-9$]*', path)
+    if not name:
+        raise ValueError(f'Invalid variable path: {path}')
+
+    steps = []
+    position = name.end()
+    while position < len(path):
+        match = PATH_STEP.match(path, position)
+        if not match:
+            raise ValueError(f'Invalid variable path: {path}')
+
+        if match.group('index') is not None:
+            steps.append(int(match.group('index')))
+        else:
+            steps.append(match.group('key') if match.group('key') is not None
+                         else match.group('field'))
+
+        position = match.end()
+
+    return name.group(), steps
+
+
+def _parse_quoted(text: str, position: int) -> Tuple[str, int]:
+    '''
+    Parse a double quoted element starting at `position`. Supports backslash
+    escapes and doubled quotes. Returns the element and the position after it.
+    '''
+    chars = []
+    position += 1
+    while True:
+        char = text[position]
+        if char == '\\':
+            chars.append(text[position + 1])
+            position += 2
+        elif char == '"':
+            if text[position + 1:position + 2] == '"':
+                chars.append('"')
+                position += 2
+            else:
+                return ''.join(chars), position + 1
+        else:
+            chars.append(char)
+            position += 1
+
+
+def parse_array(text: str) -> Tuple[list, int]:
+    '''
+    Parse a PostgreSQL array literal into (nested) lists of element strings,
+    NULL becomes None. Returns the list and the lower bound of the array.
+    '''
+    lower_bound = 1
+    if text.startswith('['):
+        dimensions, _, text = text.partition('=')
+        lower_bound = int(dimensions[1:].partition(':')[0])
+
+    def _parse(position: int) -> Tuple[list, int]:
+        elements = []
+        position += 1
+        while text[position] != '}':
+            if text[position] == '{':
+                element, position = _parse(position)
+            elif text[position] == '"':
+                element, position = _parse_quoted(text, position)
+            else:
+                end = position
+                while text[end] not in ',}':
+                    end += 1
+                element = text[position:end].strip()
+                element = None if element.upper() == 'NULL' else element
+                position = end
+
+            elements.append(element)
+            if text[position] == ',':
+                position += 1
+
+        return elements, position + 1
+
+    return _parse(0)[0], lower_bound
+
+
+def parse_record(text: str) -> List[Optional[str]]:
+    '''
+    Parse a PostgreSQL record literal like `(1,"a b",)` into a list of field
+    strings. Empty unquoted fields are NULL and become None.
+    '''
+    fields = []
+    position = 1
+    while position < len(text):
+        if text[position] == '"':
+            field, position = _parse_quoted(text, position)
+        else:
+            end = position
+            while text[end] not in ',)':
+                end += 1
+            field = text[position:end] or None
+            position = end
+
+        fields.append(field)
+        position += 1
+
+    return fields
+
+
+def truncate(value: Optional[str], width: int) -> str:
+    if value is None:
+        return 'NULL'
+
+    if len(value) <= width:
+        return value
+
+    return f'{value[:width - 3]}... ({len(value)} chars)'
+
+
+class VariableInspector:
+    '''
+    Gives access to the variables of the selected frame. Caches everything it
+    fetches or parses per stop of the target and frame, until a variable is
+    deposited.
+    '''
+
+    def __init__(self, proxy, width: int = 60):
+        self.proxy = proxy
+        self.width = width
+        self._types: Dict[int, TypeInfo] = {}
+        self._epoch = None
+        self._variables = {}
+        self._nodes = {}
+        self._structures = {}
+        self._typed = {}
+        self._decoder = None
+
+    @property
+    def decoder(self) -> Decoder:
+        if self._decoder is None:
+            self._decoder = Decoder(self.proxy.database)
+
+        return self._decoder
+
+    def _version(self) -> tuple:
+        return self.proxy.epoch, self.proxy.deposits
+
+    def _check_epoch(self):
+        '''
+        Drop everything cached for a previous stop or before a deposit.
+        '''
+        if self._epoch != self._version():
+            self._epoch = self._version()
+            self._variables = {}
+            self._nodes = {}
+            self._structures = {}
+            self._typed = {}
+
+    def get_variables(self) -> 'OrderedDict':
+        self._check_epoch()
+        frame = self.proxy.frame
+        if frame not in self._variables:
+            self._variables[frame] = OrderedDict(
+                (variable.name, variable) for variable in self.proxy.get_variables())
+
+        return self._variables[frame]
+
+    def cached(self) -> Optional['OrderedDict']:
+        '''
+        The variables of the selected frame if they were fetched for this
+        stop already, None otherwise. Never talks to the server.
+        '''
+        if self._epoch != self._version():
+            return None
+
+        return self._variables.get(self.proxy.frame)
+
+    def get_types(self, oids) -> Dict[int, TypeInfo]:
+        '''
+        Return type information, fetching unknown types in one query.
+        '''
+        missing = {oid for oid in oids if oid is not None and oid not in self._types}
+        if missing:
+            self._types.update(get_type_infos(self.proxy.database, missing))
+
+        return self._types
+
+    def summary(self) -> List[VariableSummary]:
+        '''
+        All variables of the current frame with truncated values.
+        '''
+        variables = self.get_variables()
+        types = self.get_types(variable.dtype for variable in variables.values())
+        return [
+            VariableSummary(name, types[var.dtype].name if var.dtype in types else '?',
+                            truncate(var.value, self.width))
+            for name, var in variables.items()
+        ]
+
+    def _structure(self, key: tuple, node: Node) -> Tuple[Any, Any]:
+        '''
+        Parse a node into a structure which can be indexed. Returns the
+        structure and the type(s) of its elements.
+        '''
+        if key in self._structures:
+            return self._structures[key]
+
+        if node.type_oid is None:
+            structure = (node.value, None)
+
+        elif isinstance(node.value, list):
+            # Sub-array of a multidimensional array, elements keep their type
+            info = self.get_types([node.type_oid])[node.type_oid]
+            structure = ((node.value, 1), info.element)
+
+        else:
+            info = self.get_types([node.type_oid])[node.type_oid]
+            if node.value is None:
+                raise ValueError('Value is NULL')
+
+            if info.name in JSON_TYPES:
+                structure = (json.loads(node.value), None)
+
+            elif info.category == 'A':
+                elements, lower_bound = parse_array(node.value)
+                structure = ((elements, lower_bound), info.element)
+
+            elif info.category == 'C':
+                fields = dict(zip(info.fields, parse_record(node.value)))
+                structure = (fields, dict(zip(info.fields, info.field_types)))
+
+            else:
+                raise ValueError(f'Cannot expand values of type {info.name}')
+
+        self._structures[key] = structure
+        return structure
+
+    def _child(self, key: tuple, node: Node, step: Any) -> Node:
+        structure, element_types = self._structure(key, node)
+
+        if element_types is None:
+            # Already decoded JSON, index as is
+            return Node(structure[step], None)
+
+        if isinstance(element_types, dict):
+            if step not in structure:
+                raise KeyError(f'No field "{step}"')
+            return Node(structure[step], element_types[step])
+
+        if not isinstance(step, int):
+            raise TypeError(f'Cannot get field "{step}" of an array, use an index')
+
+        elements, lower_bound = structure
+        index = step - lower_bound
+        if not 0 <= index < len(elements):
+            raise IndexError(f'Index {step} out of bounds')
+
+        element = elements[index]
+        if isinstance(element, list):
+            return Node(element, node.type_oid)
+
+        return Node(element, element_types)
+
+    def resolve(self, name: str, steps: List[Any]) -> Node:
+        '''
+        Resolve a variable and a path into it. Every intermediate node is
+        cached, such that repeated expansion of large values is cheap.
+        '''
+        self._check_epoch()
+        key = (self.proxy.frame, name) + tuple(steps)
+        if key in self._nodes:
+            return self._nodes[key]
+
+        if not steps:
+            variables = self.get_variables()
+            if name not in variables:
+                raise KeyError(f'No variable "{name}"')
+            node = Node(variables[name].value, variables[name].dtype)
+
+        else:
+            parent = self.resolve(name, steps[:-1])
+            node = self._child(key[:-1], parent, steps[-1])
+
+        self._nodes[key] = node
+        return node
+
+    def expand(self, path: str) -> Any:
+        '''
+        Return the full value at the given path. Composite values are returned
+        as dictionaries, arrays as lists and JSON values decoded.
+        '''
+        name, steps = parse_path(path)
+        node = self.resolve(name, steps)
+
+        if node.type_oid is None or node.value is None:
+            return node.value
+
+        try:
+            structure, _ = self._structure((self.proxy.frame, name) + tuple(steps), node)
+        except ValueError:
+            return node.value
+
+        if isinstance(structure, tuple):
+            return structure[0]
+
+        return structure
+
+    def typed(self, path: str) -> Any:
+        '''
+        Return the value at the given path as Python type, e.g. `Decimal` for
+        numeric values. Decoded when accessed first, then cached for the stop.
+        '''
+        name, steps = parse_path(path)
+        node = self.resolve(name, steps)
+        key = (self.proxy.frame, name) + tuple(steps)
+
+        if key not in self._typed:
+            if node.type_oid is None or not isinstance(node.value, str):
+                self._typed[key] = self.expand(path)
+            else:
+                self._typed[key] = self.decoder.decode(node.type_oid, node.value)
+
+        return self._typed[key]
+
+    def is_expandable(self, type_oid: Optional[int], value: Any) -> bool:
+        '''
+        Whether a value has children, judged by its type without parsing it.
+        '''
+        if value is None:
+            return False
+
+        if type_oid is None or isinstance(value, list):
+            return isinstance(value, (list, dict))
+
+        info = self.get_types([type_oid]).get(type_oid)
+        return info is not None and (info.category in ('A', 'C') or info.name in JSON_TYPES)
+
+    def children(self, path: str) -> List[Tuple[str, str, Any, bool]]:
+        '''
+        The direct children of an expandable value as (label, path, value,
+        expandable). Children are not parsed until they are expanded.
+        '''
+        name, steps = parse_path(path)
+        node = self.resolve(name, steps)
+        structure, element_types = self._structure((self.proxy.frame, name) + tuple(steps), node)
+
+        if element_types is None:
+            if isinstance(structure, dict):
+                items = [(key, value, None) for key, value in structure.items()]
+            elif isinstance(structure, list):
+                items = [(index, value, None) for index, value in enumerate(structure)]
+            else:
+                items = []
+
+        elif isinstance(element_types, dict):
+            items = [(field, value, element_types[field]) for field, value in structure.items()]
+
+        else:
+            elements, lower_bound = structure
+            items = [(lower_bound + index, value, node.type_oid if isinstance(value, list)
+                      else element_types) for index, value in enumerate(elements)]
+
+        children = []
+        for step, value, type_oid in items:
+            if isinstance(step, int):
+                child_path = f'{path}[{step}]'
+            elif re.fullmatch(r'[A-Za-z_][A-Za-z_0-9$]*', step):
+                child_path = f'{path}.{step}'
+            else:
+                child_path = f'{path}["{step}"]'
+
+            children.append((str(step), child_path, value, self.is_expandable(type_oid, value)))
+
+        return children
@@ -0,0 +1,123 @@
+'''
+This module samples what the target backend is waiting for while it runs.
+While the target is resumed, a background thread polls `pg_stat_activity` and
+`pg_locks` for the PID of the target on its own connection. Samples are
+counted per wait event and attributed to the line the target was resumed
+from, so slow lines can be told apart into computing, waiting on locks and
+waiting on I/O.
+'''
+
+from collections import Counter, namedtuple
+from threading import Event, Thread
+from typing import Dict, List, Optional, Tuple
+
+import psycopg2
+
+from loguru import logger
+
+from lib.db import DB
+from lib.proxy import Breakpoint
+
+
+# Seconds between two samples
+SAMPLE_INTERVAL = 0.01
+
+WaitSample = namedtuple('WaitSample', ['state', 'wait_event_type', 'wait_event', 'locks'])
+WaitEntry = namedtuple('WaitEntry', ['oid', 'line', 'func', 'events'])
+
+
+def wait_label(sample: WaitSample) -> str:
+    '''
+    One label per sample: the lock waited for, the wait event, or `CPU` if
+    the backend is active without waiting.
+    '''
+    if sample.locks:
+        return f'Lock: {sample.locks}'
+
+    if sample.wait_event_type:
+        return f'{sample.wait_event_type}: {sample.wait_event}'
+
+    return 'CPU' if sample.state == 'active' else (sample.state or 'unknown')
+
+
+class WaitSampler:
+    '''
+    Samples the wait events of one backend while the target runs. Notified
+    by the proxy before and after the target is resumed.
+    '''
+
+    def __init__(self, database: DB, interval: float = SAMPLE_INTERVAL):
+        self.database = database
+        self.interval = interval
+        self.pid: Optional[int] = None
+        self.lines: Dict[Tuple[int, int], Counter] = {}
+        self.last = Counter()
+        self._funcs: Dict[Tuple[int, int], str] = {}
+        self._samples = Counter()
+        self._stop = Event()
+        self._thread: Optional[Thread] = None
+
+    def sample(self) -> Optional[WaitSample]:
+        '''
+        What the backend is doing right now, including locks it waits for.
+        '''
+        result = self.database.run_sql(
+            'SELECT a.state, a.wait_event_type, a.wait_event, '
+            "(SELECT string_agg(l.locktype || ' ' || l.mode, ', ') FROM pg_locks l "
+            'WHERE l.pid = a.pid AND NOT l.granted) '
+            f'FROM pg_stat_activity a WHERE a.pid = {self.pid}', fetch_result=True)
+        return WaitSample(*result[0]) if result else None
+
+    def _run(self):
+        try:
+            while not self._stop.is_set():
+                sample = self.sample()
+                if sample:
+                    self._samples[wait_label(sample)] += 1
+                self._stop.wait(self.interval)
+
+        except psycopg2.Error:
+            logger.exception('Sampling wait events failed')
+
+    def before(self):
+        '''
+        Start sampling, called right before the target is resumed.
+        '''
+        if self.pid is None or self._thread:
+            return
+
+        self._samples = Counter()
+        self._stop.clear()
+        self._thread = Thread(target=self._run, name='wait-sampler', daemon=True)
+        self._thread.start()
+
+    def after(self, position: Optional[Breakpoint]):
+        '''
+        Stop sampling once the target stopped again. The samples are
+        attributed to the position the target was resumed from.
+        '''
+        if self._thread is None:
+            return
+
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+        self.last = self._samples
+
+        if position is not None and self.last:
+            key = (position.oid, position.line)
+            self.lines.setdefault(key, Counter()).update(self.last)
+            self._funcs[key] = position.func
+
+    def entries(self) -> List[WaitEntry]:
+        '''
+        All lines with samples, most samples first.
+        '''
+        lines = sorted(self.lines.items(), key=lambda item: sum(item[1].values()), reverse=True)
+        return [WaitEntry(oid, line, self._funcs.get((oid, line)), events.most_common())
+                for (oid, line), events in lines]
+
+    def reset(self):
+        self.lines = {}
+        self._funcs = {}
+        self.last = Counter()
@@ -0,0 +1,166 @@
+'''
+This module keeps track of watch expressions. A watch is either a path into a
+variable (like `var[3].field`), which is resolved client-side, or a SQL
+expression over variables, which is evaluated on the proxy connection. All
+watches are evaluated together once per stop.
+'''
+
+import re
+
+from collections import namedtuple, OrderedDict
+from typing import Dict, List, Optional
+
+import psycopg2
+
+from loguru import logger
+
+from lib.variables import VariableInspector, parse_path
+
+
+WatchResult = namedtuple('WatchResult', ['expression', 'value', 'changed'])
+
+# Value of watches which were not evaluated yet
+UNSET = object()
+
+WORDS = re.compile(r"""'(?:[^']|'')*'|"[^"]*"|[A-Za-z_][A-Za-z_0-9$]*""")
+
+
+def substitute_variables(expression: str, variables: Dict, type_names: Dict[int, str]) -> str:
+    '''
+    Replace all references to variables in a SQL expression with their
+    current values as typed literals. Quoted strings and identifiers are kept,
+    as are function calls like `count(x)` and qualified names like `t.x`.
+    '''
+    def _replace(match):
+        word = match.group()
+        variable = variables.get(word.lower())
+        if variable is None:
+            return word
+
+        before = expression[:match.start()].rstrip()
+        after = expression[match.end():].lstrip()
+        if before.endswith('.') or after.startswith('('):
+            return word
+
+        if variable.value is None:
+            literal = 'NULL'
+        else:
+            literal = "'{}'".format(variable.value.replace("'", "''"))
+
+        type_name = type_names.get(variable.dtype)
+        return f'({literal}::{type_name})' if type_name else literal
+
+    return WORDS.sub(_replace, expression)
+
+
+class WatchList:
+    '''
+    An ordered set of watch expressions with their (decoded) values at the
+    last stop.
+    '''
+
+    def __init__(self):
+        self._watches = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._watches)
+
+    def __iter__(self):
+        return iter(self._watches)
+
+    def add(self, expression: str):
+        expression = expression.strip()
+        if expression and expression not in self._watches:
+            self._watches[expression] = UNSET
+
+    def remove(self, expression: str) -> bool:
+        '''
+        Remove a watch by expression or by its (1-based) number.
+        '''
+        expression = expression.strip()
+        if expression.isdigit() and 0 < int(expression) <= len(self._watches):
+            expression = list(self._watches)[int(expression) - 1]
+
+        if expression not in self._watches:
+            return False
+
+        del self._watches[expression]
+        return True
+
+    def clear(self):
+        self._watches.clear()
+
+    @classmethod
+    def _is_path(cls, expression: str) -> bool:
+        try:
+            parse_path(expression)
+            return True
+        except ValueError:
+            return False
+
+    @classmethod
+    def _evaluate_sql(cls, database, expressions: List[str]) -> Optional[List[str]]:
+        columns = ', '.join(f'({expression})::text' for expression in expressions)
+        try:
+            result = database.run_sql(f'SELECT {columns}', fetch_result=True)
+        except psycopg2.Error as error:
+            logger.debug(f'Evaluating watches failed: {error}')
+            return None
+
+        return list(result[0]) if result else None
+
+    def _evaluate_expressions(self, inspector: VariableInspector,
+                              expressions: List[str]) -> Dict[str, str]:
+        '''
+        Evaluate SQL expressions in a single query. Only if that fails, they
+        are evaluated one by one to find the broken ones.
+        '''
+        if not expressions:
+            return {}
+
+        variables = inspector.get_variables()
+        types = inspector.get_types(variable.dtype for variable in variables.values())
+        type_names = {oid: info.name for oid, info in types.items()}
+        lowered = {name.lower(): variable for name, variable in variables.items()}
+        queries = [substitute_variables(expression, lowered, type_names)
+                   for expression in expressions]
+
+        database = inspector.proxy.database
+        values = WatchList._evaluate_sql(database, queries)
+        if values is not None:
+            return dict(zip(expressions, values))
+
+        results = {}
+        for expression, query in zip(expressions, queries):
+            value = WatchList._evaluate_sql(database, [query])
+            results[expression] = value[0] if value else '<error>'
+
+        return results
+
+    def evaluate(self, inspector: VariableInspector) -> List[WatchResult]:
+        '''
+        Evaluate all watches for the current stop and compare them to their
+        values at the previous evaluation.
+        '''
+        paths = [expression for expression in self._watches if WatchList._is_path(expression)]
+        expressions = [expression for expression in self._watches if expression not in paths]
+
+        values = self._evaluate_expressions(inspector, expressions)
+        # Changes of variables are detected on their decoded values, such that
+        # e.g. 1.50 and 1.5 are the same numeric value
+        typed = dict(values)
+        for path in paths:
+            try:
+                values[path] = inspector.expand(path)
+                typed[path] = inspector.typed(path)
+            except (KeyError, IndexError, TypeError, ValueError):
+                values[path] = typed[path] = '<not available>'
+
+        results = []
+        for expression, previous in self._watches.items():
+            value = typed[expression]
+            results.append(WatchResult(expression, values[expression],
+                                       previous is not UNSET and previous != value))
+            self._watches[expression] = value
+
+        return results
@@ -1,25 +1,173 @@
 #!/usr/bin/env python3
 
+from time import perf_counter
+
+STARTED = perf_counter()
+
+import atexit
+
 from argparse import ArgumentParser, Namespace
-from sys import stdout
+from concurrent.futures import ThreadPoolExecutor
+from importlib import import_module
+from os import environ
+from sys import stderr, stdout
 
 from loguru import logger
-from prompt_toolkit import PromptSession
-from prompt_toolkit.auto_suggest import AutoSuggestFromHistory
-
-from lib.debugger import Debugger
-from lib.commands import COMMANDS, CommandCompleter, parse_command
-from lib.formatters import print_help
 
 
 PROMPT='(pldbg) '
 
+# Cold start budget in milliseconds, measured from process start until the
+# first prompt is shown.
+STARTUP_BUDGET = 500
 
-def main(args: Namespace):
+
+def connect(dsn: str, checkpoint: bool = True, stepper: bool = False):
+    '''
+    Import the debugger (and thereby psycopg2), connect, check for the
+    extension, install the stepper helper if asked to and restore the state
+    of the last run. Runs in the background while the prompt is initialized.
+    '''
+    from lib.checkpoint import Checkpoint
+    from lib.debugger import Debugger
+
+    debugger = Debugger(dsn)
+    debugger.ensure_extension()
+    if stepper:
+        debugger.install_stepper()
+    if checkpoint:
+        debugger.restore(Checkpoint.for_dsn(dsn))
+    return debugger
+
+
+def check_startup_budget(budget: int):
+    elapsed = (perf_counter() - STARTED) * 1000
+    logger.debug(f'Startup took {elapsed:.1f} ms')
+
+    if elapsed > budget:
+        logger.warning(f'Startup took {elapsed:.1f} ms, budget is {budget} ms')
+
+
+def serve_dap(args: Namespace):
+    '''
+    Serve the Debug Adapter Protocol instead of the prompt, over stdio or on
+    a TCP port.
+    '''
+    from lib.dap import check_address, serve_stdio, serve_tcp
+
+    if args.dap_port:
+        try:
+            check_address(args.dap_host)
+        except ValueError as error:
+            logger.error(error)
+            return
+
+    debugger = connect(args.dsn, args.checkpoint, args.install_stepper)
+    atexit.register(debugger.close)
+
+    if args.dap_port:
+        serve_tcp(debugger, args.dap_host, args.dap_port)
+    else:
+        serve_stdio(debugger)
+
+
+def serve_agent(args: Namespace):
+    '''
+    Run the debugger as an agent next to the database, driven by thin clients.
+    '''
+    from lib.agent import TOKEN_ENV, check_address, serve_agent as _serve_agent
+
+    token = environ.get(TOKEN_ENV)
+    try:
+        check_address(args.agent_host, token)
+    except ValueError as error:
+        logger.error(error)
+        return
+
+    debugger = connect(args.dsn, args.checkpoint, args.install_stepper)
+    atexit.register(debugger.close)
+    _serve_agent(debugger, args.agent_host, args.agent_port, token)
+
+
+def remote(args: Namespace):
+    '''
+    Thin client: show the prompt locally and execute every command on an
+    agent.
+    '''
+    from prompt_toolkit import PromptSession
+    from prompt_toolkit.auto_suggest import AutoSuggestFromHistory
+
+    from lib.agent import TOKEN_ENV, AgentClient, replay
+    from lib.commands import COMMANDS, parse_command
+    from lib.completion import CommandCompleter
+    from lib.formatters import print_help
+
+    host, _, port = args.remote.rpartition(':')
     completer = CommandCompleter()
-    debugger = Debugger(args.dsn)
     session = PromptSession()
 
+    with AgentClient(host or '127.0.0.1', int(port), token=environ.get(TOKEN_ENV)) as client:
+        check_startup_budget(args.startup_budget)
+
+        while True:
+            try:
+                text = session.prompt(PROMPT, completer=completer,
+                                      auto_suggest=AutoSuggestFromHistory())
+
+                if text in ('exit', 'quit'):
+                    break
+
+                elif text in ('help', 'h', '?'):
+                    print_help(COMMANDS.help)
+
+                else:
+                    replay(client.execute(*parse_command(text)))
+
+            except KeyboardInterrupt:
+                print('To exit type "exit", "quit", or hit Ctrl-D\n')
+                continue
+
+            except EOFError:
+                logger.info('Exiting.')
+                replay(client.execute('abort', []))
+                break
+
+            except ConnectionError:
+                logger.exception('Lost the connection to the agent.')
+                break
+
+
+def main(args: Namespace):
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        pending = pool.submit(connect, args.dsn, args.checkpoint, args.install_stepper)
+
+        from prompt_toolkit import PromptSession
+        from prompt_toolkit.auto_suggest import AutoSuggestFromHistory
+        from prompt_toolkit.history import FileHistory, InMemoryHistory
+
+        from lib.checkpoint import Checkpoint
+        from lib.commands import COMMANDS, parse_command
+        from lib.completion import CommandCompleter
+        from lib.formatters import print_help
+
+        # Plugins register their commands via `lib.commands.register_command`
+        for plugin in args.plugin:
+            import_module(plugin)
+
+        completer = CommandCompleter()
+        history = InMemoryHistory()
+        if args.checkpoint:
+            history = FileHistory(Checkpoint.for_dsn(args.dsn).history_file())
+        session = PromptSession(history=history)
+
+        debugger = pending.result()
+        completer.debugger = debugger
+
+    check_startup_budget(args.startup_budget)
+
+    # Release all connections when exiting, no matter how
+    atexit.register(debugger.close)
+
     while True:
         try:
             text = session.prompt(PROMPT, completer=completer,
@@ -34,7 +182,7 @@ def main(args: Namespace):
             else:
                 command, args = parse_command(text)
 
-                if command not in completer.command_keys:
+                if COMMANDS.resolve(command) not in COMMANDS:
                     logger.error(f'Command {text} not found.')
                     continue
 
@@ -46,7 +194,7 @@ def main(args: Namespace):
 
         except EOFError:
             logger.info('Exiting.')
-            debugger.execute_command('abort')
+            debugger.execute_command('abort', [])
             break
 
         except Exception:
@@ -55,13 +203,46 @@ def main(args: Namespace):
 
 if __name__ == '__main__':
     args_to_parse = ArgumentParser()
-    args_to_parse.add_argument('--dsn', required=True, help=(
+    args_to_parse.add_argument('--dsn', help=(
         'The DSN of the PostgreSQL database to connect to'))
     args_to_parse.add_argument('--debug', action='store_true', help=(
         'Show debug messages'))
+    args_to_parse.add_argument('--startup-budget', type=int, default=STARTUP_BUDGET, help=(
+        'Warn if starting the debugger takes longer than this many milliseconds'))
+    args_to_parse.add_argument('--plugin', action='append', default=[], help=(
+        'Import a module which registers additional commands, can be repeated'))
+    args_to_parse.add_argument('--no-checkpoint', dest='checkpoint', action='store_false', help=(
+        'Neither restore nor save breakpoints, watches and caches of the last run'))
+    args_to_parse.add_argument('--install-stepper', action='store_true', help=(
+        'Install the helper function pydebug.step_many to take many steps in one round trip'))
+    args_to_parse.add_argument('--dap', action='store_true', help=(
+        'Serve the Debug Adapter Protocol on stdio instead of showing a prompt'))
+    args_to_parse.add_argument('--dap-port', type=int, help=(
+        'Serve the Debug Adapter Protocol on this TCP port instead of stdio'))
+    args_to_parse.add_argument('--dap-host', default='127.0.0.1', help=(
+        'The loopback address to serve the Debug Adapter Protocol on'))
+    args_to_parse.add_argument('--agent-port', type=int, help=(
+        'Run as agent next to the database, serving thin clients on this port'))
+    args_to_parse.add_argument('--agent-host', default='127.0.0.1', help=(
+        'The address to serve thin clients on, other than loopback only with a token '
+        'in PYDEBUG_AGENT_TOKEN'))
+    args_to_parse.add_argument('--remote', metavar='HOST:PORT', help=(
+        'Thin client mode, execute all commands on the agent at HOST:PORT'))
     args = args_to_parse.parse_args()
 
-    logger.remove()
-    logger.add(stdout, level='DEBUG' if args.debug else 'INFO')
+    if not args.dsn and not args.remote:
+        args_to_parse.error('--dsn is required unless --remote is given')
 
-    main(args)
+    # With DAP on stdio, stdout belongs to the protocol
+    dap = args.dap or args.dap_port
+    logger.remove()
+    logger.add(stderr if dap else stdout, level='DEBUG' if args.debug else 'INFO')
+
+    if dap:
+        serve_dap(args)
+    elif args.agent_port:
+        serve_agent(args)
+    elif args.remote:
+        remote(args)
+    else:
+        main(args)
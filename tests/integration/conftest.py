@@ -48,6 +48,7 @@ def debugger_instance():
             _execute_sql(dsn, sql)
 
     debugger = DebuggerWrapper(dsn)
+    debugger.ensure_extension()
     logger.configure(**{
         'handlers': [
             {'sink': debugger.log_sink, 'serialize': True}
@@ -0,0 +1,237 @@
+import asyncio
+import socket
+import threading
+
+import pytest
+
+from loguru import logger
+from prompt_toolkit import print_formatted_text
+
+from lib.agent import (HEADER, AgentClient, AgentSession, check_address, decode_length,
+                       encode_frame, read_frame, replay, run_captured, serve_agent)
+
+
+class Writer:
+    def __init__(self):
+        self.data = b''
+
+    def write(self, data):
+        self.data += data
+
+    async def drain(self):
+        pass
+
+
+def _read_all(data):
+    async def _read():
+        reader = asyncio.StreamReader()
+        reader.feed_data(data)
+        reader.feed_eof()
+        messages = []
+        message = await read_frame(reader)
+        while message is not None:
+            messages.append(message)
+            message = await read_frame(reader)
+        return messages
+
+    return asyncio.run(_read())
+
+
+def test_framing():
+    frame = encode_frame({'id': 1, 'command': 'si'})
+    assert HEADER.unpack(frame[:4])[0] == len(frame) - 4
+    assert _read_all(frame * 2) == [{'id': 1, 'command': 'si'}] * 2
+
+
+def test_decode_length_too_large():
+    with pytest.raises(ValueError):
+        decode_length(HEADER.pack(2 ** 31))
+
+
+def test_run_captured(mocker):
+    debugger = mocker.MagicMock()
+
+    def _execute(command, args):
+        logger.info(f'{command} {args}')
+        print_formatted_text('some text')
+        logger.debug('not captured')
+
+    debugger.execute_command.side_effect = _execute
+
+    events = run_captured(debugger, 'si', ['10'])
+
+    assert events[0] == ['log', 'INFO', "si ['10']"]
+    assert ''.join(text for kind, text in events[1:] if kind == 'text').find('some text') >= 0
+    assert all(event[0] != 'log' or event[1] != 'DEBUG' for event in events)
+
+
+def test_session(mocker):
+    debugger = mocker.MagicMock()
+    debugger.execute_command.side_effect = lambda command, args: logger.info('stepped')
+    writer = Writer()
+
+    async def _run():
+        reader = asyncio.StreamReader()
+        reader.feed_data(encode_frame({'id': 1, 'command': 'si', 'args': [10]}))
+        reader.feed_data(encode_frame({'id': 2, 'command': 'nonsense'}))
+        reader.feed_eof()
+        await AgentSession(debugger, reader, writer).serve()
+
+    asyncio.run(_run())
+    responses = _read_all(writer.data)
+
+    debugger.execute_command.assert_called_once_with('si', ['10'])
+    assert responses[0] == {'id': 1, 'output': [['log', 'INFO', 'stepped']]}
+    assert responses[1]['id'] == 2 and 'error' in responses[1]
+
+
+def test_client(mocker):
+    server, client_socket = socket.socketpair()
+    mocker.patch('socket.create_connection', return_value=client_socket)
+
+    def _serve():
+        request = server.recv(1024)
+        assert request == encode_frame({'id': 1, 'command': 'stack', 'args': []})
+        server.sendall(encode_frame({'id': 1, 'output': [['text', 'frame\\n']]}))
+
+    thread = threading.Thread(target=_serve)
+    thread.start()
+    with AgentClient('agent', 4242) as client:
+        response = client.execute('stack', [])
+    thread.join()
+    server.close()
+
+    written = []
+    replay(response, written.append)
+    assert written == ['frame\\n']
+
+
+def test_replay_error(mocker):
+    log_mock = mocker.patch('loguru.logger.error')
+    replay({'id': 1, 'error': 'Command x not found.'})
+    log_mock.assert_called_once_with('Command x not found.')
+
+
+def test_session_cancel(mocker):
+    debugger = mocker.MagicMock()
+    started = threading.Event()
+    interrupted = threading.Event()
+
+    def _execute(command, args):
+        started.set()
+        interrupted.wait(5)
+        logger.info('cancelled')
+
+    debugger.execute_command.side_effect = _execute
+    debugger.interrupt.side_effect = interrupted.set
+    writer = Writer()
+
+    async def _run():
+        reader = asyncio.StreamReader()
+        reader.feed_data(encode_frame({'id': 1, 'command': 'continue'}))
+        reader.feed_data(encode_frame({'id': 2, 'command': 'stack'}))
+        session = AgentSession(debugger, reader, writer)
+        serving = asyncio.ensure_future(session.serve())
+
+        await asyncio.get_running_loop().run_in_executor(None, started.wait, 5)
+        # Cancels the running command and drops the queued one
+        reader.feed_data(encode_frame({'cancel': 1}))
+        reader.feed_data(encode_frame({'cancel': 2}))
+        reader.feed_eof()
+        await serving
+
+    asyncio.run(_run())
+    responses = _read_all(writer.data)
+
+    debugger.interrupt.assert_called_once()
+    debugger.execute_command.assert_called_once()
+    assert responses[0] == {'id': 1, 'output': [['log', 'INFO', 'cancelled']]}
+    assert responses[1]['id'] == 2 and 'cancelled' in responses[1]['error']
+
+
+def test_client_drops_stale_responses(mocker):
+    server, client_socket = socket.socketpair()
+    mocker.patch('socket.create_connection', return_value=client_socket)
+
+    # The response to an interrupted request arrives split over two reads
+    stale = encode_frame({'id': 0, 'output': [['text', 'old']]})
+    server.sendall(stale[:3])
+    client = AgentClient('agent', 4242)
+    client._ids = 0
+
+    def _serve():
+        server.recv(1024)
+        server.sendall(stale[3:] + encode_frame({'id': 1, 'output': [['text', 'new']]}))
+
+    thread = threading.Thread(target=_serve)
+    thread.start()
+    response = client.execute('stack', [])
+    thread.join()
+    client.close()
+    server.close()
+
+    assert response == {'id': 1, 'output': [['text', 'new']]}
+
+
+def test_client_cancel(mocker):
+    server, client_socket = socket.socketpair()
+    mocker.patch('socket.create_connection', return_value=client_socket)
+    client = AgentClient('agent', 4242)
+    responses = [KeyboardInterrupt(), {'id': 1, 'output': []}]
+
+    def _response(request_id):
+        response = responses.pop(0)
+        if isinstance(response, BaseException):
+            raise response
+        return response
+
+    mocker.patch.object(client, '_response', side_effect=_response)
+
+    assert client.execute('continue', []) == {'id': 1, 'output': []}
+    assert _read_all(server.recv(1024)) == [{'id': 1, 'command': 'continue', 'args': []},
+                                            {'cancel': 1}]
+    client.close()
+    server.close()
+
+
+@pytest.mark.parametrize('token, executed', [('secret', True), ('wrong', False)])
+def test_session_token(mocker, token, executed):
+    debugger = mocker.MagicMock()
+    writer = Writer()
+
+    async def _run():
+        reader = asyncio.StreamReader()
+        reader.feed_data(encode_frame({'token': token}))
+        reader.feed_data(encode_frame({'id': 1, 'command': 'si', 'args': []}))
+        reader.feed_eof()
+        await AgentSession(debugger, reader, writer, token='secret').serve()
+
+    asyncio.run(_run())
+    responses = _read_all(writer.data)
+
+    assert debugger.execute_command.called == executed
+    if executed:
+        assert responses[0] == {'authenticated': True}
+    else:
+        assert responses == [{'error': 'Invalid token.'}]
+
+
+def test_client_token(mocker):
+    server, client_socket = socket.socketpair()
+    mocker.patch('socket.create_connection', return_value=client_socket)
+    server.sendall(encode_frame({'error': 'Invalid token.'}))
+
+    with pytest.raises(ConnectionError, match='Invalid token'):
+        AgentClient('agent', 4242, token='wrong')
+
+    assert _read_all(server.recv(1024)) == [{'token': 'wrong'}]
+    server.close()
+
+
+def test_check_address():
+    check_address('127.0.0.1', None)
+    check_address('0.0.0.0', 'secret')
+    with pytest.raises(ValueError):
+        check_address('0.0.0.0', None)
+    with pytest.raises(ValueError):
+        serve_agent(None, '192.0.2.1', 4242, '')
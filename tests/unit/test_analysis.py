@@ -0,0 +1,61 @@
+
+import json
+
+import pytest
+
+from lib.analysis import HotLine, analyze_traces, aggregate_shard, shard_trace
+from lib.proxy import Breakpoint
+from lib.trace import TraceRecorder
+
+
+def _write_trace(path, steps):
+    with TraceRecorder(str(path)) as recorder:
+        for index in range(steps):
+            line = 5 + index % 3
+            recorder.record(Breakpoint(1, line, 'f'), line / 1e6, {'i': str(index // 3)})
+    return str(path)
+
+
+@pytest.fixture
+def trace(tmp_path):
+    return _write_trace(tmp_path / 'a.trace', 300)
+
+
+def test_shard_trace(trace):
+    shards = shard_trace(trace, shard_size=1000)
+    assert len(shards) > 1
+    assert shards[0].start == 0
+    for previous, shard in zip(shards, shards[1:]):
+        assert previous.end == shard.start
+
+    with open(trace, 'rb') as trace_file:
+        content = trace_file.read()
+    for shard in shards[1:]:
+        assert content[shard.start - 1:shard.start] == b'\n'
+
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_analyze_traces(trace, workers):
+    aggregate = analyze_traces([trace], variable='i', workers=workers, shard_size=1000)
+    unsharded = aggregate_shard(shard_trace(trace)[0], variable='i')
+
+    assert aggregate.steps == unsharded.steps == 300
+    assert aggregate.hits == unsharded.hits == {(1, 5): 100, (1, 6): 100, (1, 7): 100}
+    assert aggregate.elapsed == unsharded.elapsed
+    assert aggregate.history == unsharded.history
+    assert aggregate.history[trace] == [(step * 3 + 1, str(step)) for step in range(100)]
+
+
+def test_analyze_multiple_traces(tmp_path, trace):
+    other = _write_trace(tmp_path / 'b.trace', 30)
+    aggregate = analyze_traces([trace, other], workers=1)
+
+    assert aggregate.steps == 330
+    assert aggregate.hot_lines(2) == [HotLine(1, 7, 110, 770), HotLine(1, 6, 110, 660)]
+
+    report = aggregate.report(top=1)
+    assert (report.steps, report.lines, len(report.hot_lines)) == (330, 3, 1)
+
+
+def test_analyze_no_traces():
+    assert analyze_traces([]).steps == 0
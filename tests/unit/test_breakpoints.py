@@ -0,0 +1,136 @@
+import pytest
+
+from lib.breakpoints import BreakpointEntry, BreakpointRegistry, is_executable
+from lib.proxy import Breakpoint
+from lib.resources import ResourceTracker
+
+
+SOURCE = ['', 'DECLARE', '  i int := 0;', 'BEGIN', '  -- count', '  i := i + 1;', 'END;']
+
+
+BLOCKS = ['', 'BEGIN', '  <<outer>>', '  FOR i IN 1..10', '  LOOP',
+          "    IF i = 1 THEN  -- first", "      RAISE NOTICE 'x %',", '        i;',
+          '    ELSIF i = 2 THEN', '      NULL;', '    ELSE', '      x := 1;', '    END IF;',
+          '  END LOOP outer;', '  LOOP', '    EXIT;', '  END LOOP;', "  x := 'END;';",
+          'END', '$function$']
+
+
+@pytest.mark.parametrize('line, expected', [
+    (0, False), (1, False), (2, False), (3, True), (4, False), (5, False), (6, True),
+    (7, False), (8, False),
+])
+def test_is_executable(line, expected):
+    assert is_executable(SOURCE, line) == expected
+
+
+def test_is_executable_blocks():
+    executable = [line for line in range(1, len(BLOCKS) + 1) if is_executable(BLOCKS, line)]
+    # The LOOP of the FOR loop continues its statement, a bare LOOP is one
+    assert executable == [4, 6, 7, 10, 12, 15, 16, 18]
+
+
+@pytest.fixture
+def registry(mocker):
+    registry = BreakpointRegistry(ResourceTracker())
+    registry.add(1, [3, 6])
+    proxy = mocker.MagicMock()
+    on_server = set()
+    proxy.set_breakpoints.side_effect = on_server.update
+    proxy.drop_breakpoints.side_effect = on_server.difference_update
+    proxy.get_breakpoints.side_effect = lambda: [Breakpoint(oid, line, 'f()')
+                                                 for oid, line in on_server]
+    registry.attach(proxy)
+    return registry
+
+
+def test_attach_sets_all_at_once(registry):
+    registry.proxy.set_breakpoints.assert_called_once_with([(1, 3), (1, 6)])
+
+
+def test_add(registry):
+    added = registry.add(2, [5, 6, 5])
+
+    assert added == [BreakpointEntry(3, 2, 5, None, True), BreakpointEntry(4, 2, 6, None, True)]
+    registry.proxy.set_breakpoints.assert_called_with([(2, 5), (2, 6)])
+    assert registry.get(2, 5).number == 3
+    assert registry.add(2, [5]) == []
+
+
+def test_enable_disable(registry):
+    registry.disable([1, 2])
+    registry.proxy.drop_breakpoints.assert_called_once_with([(1, 3), (1, 6)])
+    assert registry.lines(1) == []
+
+    registry.disable([1])
+    registry.proxy.drop_breakpoints.assert_called_with([])
+
+    registry.enable([2])
+    registry.proxy.set_breakpoints.assert_called_with([(1, 6)])
+    assert registry.lines(1) == [6]
+
+
+def test_delete(registry):
+    registry.disable([2])
+    registry.delete([1, 2])
+
+    # Disabled breakpoints are not set on the server anymore
+    registry.proxy.drop_breakpoints.assert_called_with([(1, 3)])
+    assert len(registry) == 0
+
+    with pytest.raises(KeyError):
+        registry.delete([1])
+
+
+def test_replace(registry):
+    entries = registry.replace(1, [6, 8])
+
+    assert [entry.line for entry in entries] == [6, 8]
+    registry.proxy.drop_breakpoints.assert_called_once_with([(1, 3)])
+    registry.proxy.set_breakpoints.assert_called_with([(1, 8)])
+
+
+def test_tracked_as_resources(registry):
+    def _tracked():
+        return sorted(resource.name for resource in registry.resources.live()
+                      if resource.kind == 'breakpoint')
+
+    assert _tracked() == ['1:3', '1:6']
+    registry.disable([1])
+    assert _tracked() == ['1:6']
+    registry.enable([1])
+    assert _tracked() == ['1:3', '1:6']
+
+
+def test_failed_set_reported(mocker, registry):
+    log_mock = mocker.patch('loguru.logger.warning')
+    registry.proxy.set_breakpoints.side_effect = None
+    registry.add(1, [99])
+
+    log_mock.assert_called_once()
+    assert '1:99' not in [resource.name for resource in registry.resources.live()]
+
+
+def test_detached(registry):
+    registry.detach()
+    registry.clear()
+    assert registry.proxy is None
+    assert len(registry) == 0
+
+
+def test_save_load(registry, tmp_path, mocker):
+    path = str(tmp_path / 'breakpoints.json')
+    registry.disable([2])
+    registry.add(2, [4])
+    registry.save(path, {1: 'foo()', 2: 'gone()'})
+
+    loaded = BreakpointRegistry()
+    loaded.attach(mocker.MagicMock())
+    entries = loaded.load(path, {'foo()': 10})
+
+    # Breakpoints of unknown functions are skipped
+    assert entries == [BreakpointEntry(1, 10, 3, 'foo()', True),
+                       BreakpointEntry(2, 10, 6, 'foo()', False)]
+    assert loaded.proxy.set_breakpoints.call_args_list[-1][0] == ([(10, 3)],)
+
+    loaded = BreakpointRegistry()
+    assert [(entry.oid, entry.line) for entry in loaded.load(path)] == [(1, 3), (1, 6), (2, 4)]
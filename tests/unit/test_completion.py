@@ -0,0 +1,146 @@
+from collections import OrderedDict
+from time import perf_counter
+
+import pytest
+
+from prompt_toolkit.completion import CompleteEvent
+from prompt_toolkit.document import Document
+
+from lib.completion import CommandCompleter, PrefixTrie
+from lib.helpers import SQLFunction
+from lib.proxy import Variable
+from lib.stack import Frame
+
+
+def _texts(completer, text, explicit=False):
+    event = CompleteEvent(completion_requested=explicit)
+    return [completion.text for completion in completer.get_completions(Document(text), event)]
+
+
+def test_trie_prefix():
+    words = ['brset', 'brshow', 'brdelete', 'break', 'b', 'continue']
+    trie = PrefixTrie((word, index) for index, word in enumerate(words))
+
+    assert len(trie) == 6
+    assert [word for word, _ in trie.prefix('br')] == ['brdelete', 'break', 'brset', 'brshow']
+    assert trie.prefix('co') == [('continue', 5)]
+    assert [word for word, _ in trie.prefix('')] == sorted(words)
+    assert trie.prefix('x') == []
+
+
+def test_trie_burst():
+    names = [f'func_{number}' for number in range(5000)] + ['func_', 'func_1']
+    trie = PrefixTrie()
+    for name in reversed(names):
+        trie.insert(name, name.upper())
+
+    assert len(trie) == 5002
+    assert trie.prefix('func_4999') == [('func_4999', 'FUNC_4999')]
+    assert [word for word, _ in trie.prefix('func_12', limit=1000)] == sorted(
+        name for name in names if name.startswith('func_12'))
+    assert [word for word, _ in trie.prefix('func_1', limit=3)] == ['func_1', 'func_1', 'func_10']
+    assert len(trie.prefix('func', limit=250)) == 250
+
+
+def test_trie_prefix_is_fast():
+    trie = PrefixTrie((f'schema_{number % 7}.function_{number}', number)
+                      for number in range(60000))
+    prefixes = ['s', 'schema_3.', 'schema_3.function_1', 'schema_6.function_59999', 'x']
+
+    started = perf_counter()
+    for _ in range(100):
+        for prefix in prefixes:
+            trie.prefix(prefix)
+    elapsed = (perf_counter() - started) / (100 * len(prefixes))
+
+    assert elapsed < 0.001
+
+
+def test_complete_commands():
+    completer = CommandCompleter()
+
+    assert _texts(completer, 'brs') == ['brsave', 'brset', 'brshow']
+    assert 'brdel' in _texts(completer, 'brd')
+    # Without a debugger, arguments are not completed
+    assert _texts(completer, 'run fo') == []
+
+
+@pytest.fixture
+def debugger(mocker):
+    debugger = mocker.MagicMock()
+    debugger.catalog.loaded = True
+    debugger.catalog.version = 1
+    debugger.catalog.functions.return_value = [
+        SQLFunction('foo(integer)', 1), SQLFunction('foo(text)', 2),
+        SQLFunction('foobar()', 3), SQLFunction('bar()', 4)]
+    debugger.variables.cached.return_value = OrderedDict([
+        ('counter', Variable('counter', 'L', 2, True, False, False, 23, '42')),
+        ('cursor', Variable('cursor', 'L', 3, True, False, False, 25, 'x' * 1000)),
+    ])
+    debugger.stack.location.return_value = Frame(0, 'foo(integer)', 1, 3, None)
+    debugger.source_view.cached_lines.return_value = [
+        'DECLARE', '', '  -- comment', 'BEGIN', '  x := 1;'] + ['  x := x + 1;'] * 10
+    return debugger
+
+
+def test_complete_functions(debugger):
+    completer = CommandCompleter(debugger)
+
+    assert _texts(completer, 'run fo') == ['foo(', 'foobar(']
+    assert _texts(completer, 'run b') == ['bar(']
+    # Only the first argument is a function
+    assert _texts(completer, 'run foo(1) fo') == []
+
+    # The trie is only rebuilt once the catalog changed
+    _texts(completer, 'fanout fo')
+    debugger.catalog.functions.assert_called_once()
+    debugger.catalog.version = 2
+    _texts(completer, 'run fo')
+    assert debugger.catalog.functions.call_count == 2
+
+
+def test_complete_functions_not_loaded(debugger):
+    debugger.catalog.loaded = False
+    completer = CommandCompleter(debugger)
+
+    assert _texts(completer, 'run fo') == []
+    debugger.catalog.functions.assert_not_called()
+    assert _texts(completer, 'run fo', explicit=True) == ['foo(', 'foobar(']
+
+
+def test_complete_variables(debugger):
+    completer = CommandCompleter(debugger)
+
+    assert _texts(completer, 'print c') == ['counter', 'cursor']
+    assert _texts(completer, 'print cou') == ['counter']
+    assert _texts(completer, 'print cursor[1].') == []
+    completion = list(completer.get_completions(Document('deposit cur'), CompleteEvent()))[0]
+    assert len(completion.display_meta_text) < 60
+
+
+def test_complete_variables_not_cached(debugger):
+    debugger.variables.cached.return_value = None
+    debugger.variables.get_variables.return_value = OrderedDict([('a', Variable(
+        'a', 'L', 2, True, False, False, 23, '1'))])
+    completer = CommandCompleter(debugger)
+
+    assert _texts(completer, 'watch ') == []
+    debugger.variables.get_variables.assert_not_called()
+    assert _texts(completer, 'watch ', explicit=True) == ['a']
+
+
+def test_complete_lines(debugger):
+    completer = CommandCompleter(debugger)
+
+    assert _texts(completer, 'brset ') == [str(number) for number in [1, 4] + list(range(5, 16))]
+    assert _texts(completer, 'brset 5 1') == ['1'] + [str(number) for number in range(10, 16)]
+    assert _texts(completer, 'source x') == []
+    debugger.source_view.cached_lines.assert_called_with(1)
+
+
+def test_complete_without_session(debugger):
+    debugger.active_session.return_value = None
+    completer = CommandCompleter(debugger)
+
+    assert _texts(completer, 'print c') == []
+    assert _texts(completer, 'brset ') == []
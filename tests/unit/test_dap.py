@@ -0,0 +1,211 @@
+import asyncio
+
+from queue import Queue
+from threading import Thread
+
+import pytest
+
+from lib.dap import DapSession, encode_message, read_message, serve_tcp
+from lib.stack import StackEntry
+
+
+class Writer:
+    def __init__(self):
+        self.data = b''
+
+    def write(self, data):
+        self.data += data
+
+    async def drain(self):
+        pass
+
+    def messages(self):
+        async def _read():
+            reader = asyncio.StreamReader()
+            reader.feed_data(self.data)
+            reader.feed_eof()
+            messages = []
+            message = await read_message(reader)
+            while message is not None:
+                messages.append(message)
+                message = await read_message(reader)
+            return messages
+
+        return asyncio.run(_read())
+
+
+def run_session(debugger, requests):
+    '''
+    Feed requests to a session and return everything it sent.
+    '''
+    writer = Writer()
+
+    async def _run():
+        reader = asyncio.StreamReader()
+        for seq, (command, arguments) in enumerate(requests, 1):
+            reader.feed_data(encode_message(
+                {'seq': seq, 'type': 'request', 'command': command, 'arguments': arguments}))
+        reader.feed_eof()
+        await DapSession(debugger, reader, writer).serve()
+
+    asyncio.run(_run())
+    return writer.messages()
+
+
+@pytest.fixture
+def debugger(mocker):
+    debugger = mocker.MagicMock()
+    debugger.active_session.return_value = True
+    debugger.proxy.epoch = 1
+    debugger.stack.entries.return_value = [StackEntry(0, 'foo(integer)', 42, 3, 'i=1', True)]
+    return debugger
+
+
+def test_framing():
+    message = {'seq': 1, 'type': 'request', 'command': 'threads'}
+    encoded = encode_message(message)
+    assert encoded.startswith(b'Content-Length: 51\r\n\r\n')
+
+    async def _read():
+        reader = asyncio.StreamReader()
+        reader.feed_data(encoded * 2)
+        reader.feed_eof()
+        return [await read_message(reader) for _ in range(3)]
+
+    assert asyncio.run(_read()) == [message, message, None]
+
+
+def test_initialize(debugger):
+    messages = run_session(debugger, [('initialize', {})])
+
+    assert messages[0]['type'] == 'response'
+    assert messages[0]['body']['supportsConfigurationDoneRequest']
+    assert messages[1]['event'] == 'initialized'
+
+
+def test_stack_trace_coalesced(debugger):
+    messages = run_session(debugger, [('stackTrace', {'threadId': 1})] * 3)
+
+    debugger.stack.entries.assert_called_once()
+    assert len(messages) == 3
+    frame = messages[0]['body']['stackFrames'][0]
+    assert frame['id'] == 0
+    assert frame['line'] == 3
+    assert frame['source']['sourceReference'] == 42
+    assert all(message['body'] == messages[0]['body'] for message in messages)
+
+
+def test_step_forgets_responses(debugger):
+    messages = run_session(debugger, [
+        ('stackTrace', {'threadId': 1}),
+        ('next', {'threadId': 1}),
+        ('stackTrace', {'threadId': 1}),
+    ])
+
+    debugger.proxy.step_over.assert_called_once()
+    assert debugger.stack.entries.call_count == 2
+    stopped = [message for message in messages if message.get('event') == 'stopped']
+    assert stopped[0]['body']['reason'] == 'step'
+
+
+def test_finished_target_terminates(debugger):
+    debugger.proxy.cont.return_value = None
+    messages = run_session(debugger, [('continue', {'threadId': 1})])
+
+    assert messages[0]['body'] == {'allThreadsContinued': True}
+    assert messages[1]['event'] == 'terminated'
+    debugger.stop_debug_session.assert_called()
+
+
+def test_breakpoints_set_on_launch(debugger):
+    debugger.active_session.return_value = False
+
+    def _start(call):
+        debugger.active_session.return_value = True
+    debugger._start_debug_session_wrapper.side_effect = _start
+    debugger.target.notice_queue = Queue()
+
+    messages = run_session(debugger, [
+        ('setBreakpoints', {'source': {'sourceReference': 42}, 'breakpoints': [{'line': 5}]}),
+        ('launch', {'call': 'foo(1)'}),
+        ('disconnect', {}),
+    ])
+
+    assert messages[0]['body']['breakpoints'] == [{'verified': False, 'line': 5}]
+    assert messages[1]['success']
+    debugger.breakpoints.replace.assert_called_once_with(42, [5])
+
+
+def test_breakpoints_validated(debugger):
+    debugger.source_view.get_lines.return_value = ['', 'BEGIN', '  x := 1;', 'END;']
+    messages = run_session(debugger, [
+        ('setBreakpoints', {'source': {'sourceReference': 42},
+                            'breakpoints': [{'line': 2}, {'line': 3}]}),
+    ])
+
+    assert messages[0]['body']['breakpoints'] == [
+        {'verified': False, 'line': 2}, {'verified': True, 'line': 3}]
+    debugger.breakpoints.replace.assert_called_once_with(42, [3])
+
+
+def test_variables(debugger, mocker):
+    variable = mocker.MagicMock(dtype=1007, value='{1,2}')
+    inspector = debugger.variables
+    inspector.get_variables.return_value = {'arr': variable}
+    inspector.get_types.return_value = {1007: mocker.MagicMock()}
+    inspector.get_types.return_value[1007].name = '_int4'
+    inspector.is_expandable.return_value = True
+    inspector.children.return_value = [('1', 'arr[1]', '1', False), ('2', 'arr[2]', None, False)]
+
+    messages = run_session(debugger, [('scopes', {'frameId': 0})])
+    reference = messages[0]['body']['scopes'][0]['variablesReference']
+
+    async def _run():
+        session = DapSession(debugger, None, Writer())
+        session._loop = asyncio.get_running_loop()
+        session._reference(0, None)
+        top = session.variables({'variablesReference': reference})['variables']
+        children = session.variables({'variablesReference': top[0]['variablesReference']})
+        return top, children['variables']
+
+    top, children = asyncio.run(_run())
+    assert top == [{'name': 'arr', 'value': '{1,2}', 'type': '_int4', 'variablesReference': 2}]
+    assert children == [
+        {'name': '1', 'value': '1', 'variablesReference': 0},
+        {'name': '2', 'value': 'NULL', 'variablesReference': 0},
+    ]
+    inspector.children.assert_called_once_with('arr')
+    debugger.stack.select.assert_called_with(0)
+
+
+def test_unsupported(debugger):
+    messages = run_session(debugger, [('evaluate', {'expression': '1'})])
+    assert not messages[0]['success']
+    assert 'evaluate' in messages[0]['message']
+
+
+def test_notice_pump(mocker, debugger):
+    session = DapSession(debugger, None, Writer())
+    send_mock = mocker.patch.object(session, '_send_notice')
+    target = debugger.target
+    target.notice_queue = Queue()
+    target.pending_notices = ['NOTICE:  first']
+    target.notice_queue.put_nowait('NOTICE:  second')
+
+    pump = Thread(target=session._pump_notices, args=(target,), daemon=True)
+    pump.start()
+    session._stop_session()
+    pump.join(1.0)
+
+    # The pump blocks on the queue until the session stops
+    assert not pump.is_alive()
+    debugger.stop_debug_session.assert_called_once()
+    assert [call[0][0] for call in send_mock.call_args_list] == ['NOTICE:  first',
+                                                                  'NOTICE:  second']
+
+
+def test_serve_tcp_loopback_only(mocker):
+    run_mock = mocker.patch('asyncio.run')
+    with pytest.raises(ValueError):
+        serve_tcp(mocker.MagicMock(), '0.0.0.0', 4711)
+    run_mock.assert_not_called()
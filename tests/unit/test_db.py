@@ -41,6 +41,17 @@ def test_try_load_extension(mocker, dbmock):
     exit_mock.assert_called_with(1)
 
 
+@pytest.mark.parametrize('result,expected', [
+    ([(1,)], True),
+    ([], False),
+])
+def test_has_extension(mocker, dbmock, result, expected):
+    get_sql_mock = mocker.patch('lib.db.DB.run_sql', return_value=result)
+    assert dbmock.has_extension() == expected
+    get_sql_mock.assert_called_with(
+        "SELECT 1 FROM pg_extension WHERE extname = 'pldbgapi'", fetch_result=True)
+
+
 def test_get_conn_sync(mocker):
     conn_mock = mocker.patch('psycopg2.connect')
     conn = DB._get_conn(TEST_DSN, False)
@@ -68,6 +79,15 @@ def test_cleanup(mocker, dbmock):
     dbmock._conn.close.assert_called()
 
 
+def test_cancel(dbmock):
+    dbmock.cancel()
+    dbmock._conn.cancel.assert_called_once()
+
+
+def test_cursor(dbmock):
+    assert dbmock.cursor() is dbmock._conn.cursor.return_value
+
+
 def test_run_sql(dbmock, cursor_mock):
     cursor_mock = cursor_mock(dbmock)
     dbmock.run_sql('SELECT 1')
@@ -140,3 +160,10 @@ def test_async_conn_wait_err(mocker):
     async_conn.poll.return_value = 'GARBAGE'
     with pytest.raises(psycopg2.OperationalError):
         DB._async_conn_wait(async_conn)
+
+
+def test_count_rows(dbmock, cursor_mock):
+    cursor_mock = cursor_mock(dbmock)
+    cursor_mock.rowcount = 42
+    assert dbmock.count_rows('MOVE FORWARD ALL FROM c') == 42
+    cursor_mock.execute.assert_called_with('MOVE FORWARD ALL FROM c')
@@ -1,7 +1,15 @@
 
+import json
+
 import pytest
 
+from prompt_toolkit.formatted_text.utils import fragment_list_to_text
+
+from lib.checkpoint import Checkpoint
 from lib.debugger import Debugger
+from lib.helpers import CatalogState, SQLFunction
+from lib.proxy import Breakpoint, Frame, Step
+from lib.slow import SlowStep
 
 
 @pytest.fixture
@@ -11,14 +19,14 @@ def debugger_fixture(mocker):
         def __init__(self):
             super().__init__('postgresql://postgres@joidqwjo.com/foobardb')
             self.database = mocker.MagicMock()
+            self.catalog = mocker.MagicMock()
 
     return DebuggerFixture()
 
 
 @pytest.fixture
 def debugger_fixture_active(mocker, debugger_fixture):
-    debugger_fixture.target = mocker.MagicMock()
-    debugger_fixture.proxy = mocker.MagicMock()
+    debugger_fixture._start_debug_session('some_func', mocker.MagicMock(), mocker.MagicMock())
     return debugger_fixture
 
 
@@ -32,13 +40,27 @@ def test_active_session(mocker, debugger_fixture):
     assert debugger_fixture.active_session()
 
 
+@pytest.mark.parametrize('installed,loaded', [
+    (True, False),
+    (False, True),
+])
+def test_ensure_extension(debugger_fixture, installed, loaded):
+    debugger_fixture.database.has_extension.return_value = installed
+    debugger_fixture.ensure_extension()
+    assert debugger_fixture.database.try_load_extension.called == loaded
+
+
 def test_start_debug_session(mocker, debugger_fixture):
     target_mock = mocker.MagicMock()
     proxy_mock = mocker.MagicMock()
+    debugger_fixture.catalog.oid.return_value = 42
 
-    debugger_fixture._start_debug_session('some_func', target_mock, proxy_mock)
+    debugger_fixture._start_debug_session('some_func(1)', target_mock, proxy_mock)
 
-    target_mock.start.assert_called_once_with('some_func')
+    # The function is looked up in the (validated) catalog
+    debugger_fixture.catalog.validate.assert_called_once()
+    debugger_fixture.catalog.oid.assert_called_once_with('some_func')
+    target_mock.start.assert_called_once_with('some_func(1)', func_oid=42)
     proxy_mock.attach.assert_called_once_with(target_mock.port)
 
     assert debugger_fixture.target == target_mock
@@ -53,28 +75,121 @@ def test_start_debug_session_failure(mocker, debugger_fixture):
 
     debugger_fixture._start_debug_session('some_func', target_mock, proxy_mock)
 
-    target_mock.start.assert_called_once_with('some_func')
+    target_mock.start.assert_called_once()
     proxy_mock.attach.assert_not_called()
 
     assert not debugger_fixture.target
     assert not debugger_fixture.proxy
     assert not debugger_fixture.active_session()
+    target_mock.cleanup.assert_called_once()
+    proxy_mock.cleanup.assert_called_once()
+    assert [r.kind for r in debugger_fixture.resources.live()] == ['connection']
+
+
+def test_start_debug_session_error(mocker, debugger_fixture):
+    target_mock = mocker.MagicMock()
+    proxy_mock = mocker.MagicMock()
+    proxy_mock.attach.side_effect = RuntimeError
+
+    with pytest.raises(RuntimeError):
+        debugger_fixture._start_debug_session('some_func', target_mock, proxy_mock)
+
+    assert not debugger_fixture.active_session()
+    target_mock.wait_for_shutdown.assert_called_once()
+    target_mock.cleanup.assert_called_once()
+    proxy_mock.cleanup.assert_called_once()
+
+
+def test_start_debug_session_restart(mocker, debugger_fixture_active):
+    old_proxy = debugger_fixture_active.proxy
+    debugger_fixture_active._start_debug_session('some_func', mocker.MagicMock(),
+                                                 mocker.MagicMock())
+    old_proxy.abort.assert_called_once()
+    old_proxy.cleanup.assert_called_once()
 
 
 def test_stop_debug_session(mocker, debugger_fixture_active):
     target_mock = debugger_fixture_active.target
     proxy_mock = debugger_fixture_active.proxy
+
+    calls = mocker.MagicMock()
+    proxy_mock.abort.side_effect = lambda: calls('abort')
+    proxy_mock.cleanup.side_effect = lambda: calls('proxy.cleanup')
+    target_mock.wait_for_shutdown.side_effect = lambda timeout: calls('wait_for_shutdown')
+    target_mock.cleanup.side_effect = lambda: calls('target.cleanup')
+
     debugger_fixture_active.stop_debug_session()
 
-    proxy_mock.abort.assert_called_once()
-    target_mock.wait_for_shutdown.assert_called_once()
-    target_mock.cleanup.assert_called_once()
+    assert [call[0][0] for call in calls.call_args_list] == [
+        'abort', 'wait_for_shutdown', 'proxy.cleanup', 'target.cleanup'
+    ]
+    assert [r.kind for r in debugger_fixture_active.resources.live()] == ['connection']
 
     assert not debugger_fixture_active.target
     assert not debugger_fixture_active.proxy
     assert not debugger_fixture_active.active_session()
 
 
+def test_close(mocker, debugger_fixture_active):
+    proxy_mock = debugger_fixture_active.proxy
+    database_mock = mocker.MagicMock()
+    debugger_fixture_active.resources.track('connection', 'test', database_mock.cleanup)
+
+    with debugger_fixture_active:
+        pass
+
+    proxy_mock.cleanup.assert_called_once()
+    database_mock.cleanup.assert_called_once()
+    assert not debugger_fixture_active.resources.live()
+
+
+def test_checkpoint_restored_and_saved(mocker, debugger_fixture):
+    restore_mock = mocker.patch('lib.debugger.restore_checkpoint', return_value=True)
+    save_mock = mocker.patch('lib.debugger.save_checkpoint')
+    database_mock = mocker.MagicMock()
+    debugger_fixture.resources.track('connection', 'test', database_mock.cleanup)
+    checkpoint = mocker.MagicMock()
+
+    assert debugger_fixture.restore(checkpoint)
+    restore_mock.assert_called_once_with(debugger_fixture, checkpoint)
+
+    # Saved while the connection is still open
+    save_mock.side_effect = lambda *args: database_mock.cleanup.assert_not_called()
+    debugger_fixture.close()
+    save_mock.assert_called_once_with(debugger_fixture, checkpoint)
+    database_mock.cleanup.assert_called_once()
+
+
+def test_checkpoint_keeps_sources(mocker, debugger_fixture_active, tmp_path):
+    mocker.patch('lib.checkpoint.get_catalog_state',
+                 return_value=CatalogState('db', 1, '10', {42: '100'}))
+    debugger_fixture_active.catalog.loaded = False
+    debugger_fixture_active.proxy.get_source.return_value = 'BEGIN\nEND;'
+    debugger_fixture_active._get_source_lines(42)
+    checkpoint = Checkpoint.for_dsn('postgresql://db', str(tmp_path))
+    debugger_fixture_active.checkpoint = checkpoint
+
+    debugger_fixture_active.close()
+
+    with open(checkpoint.path) as checkpoint_file:
+        assert json.load(checkpoint_file)['sources'] == {
+            '42': {'xmin': '100', 'lines': ['BEGIN', 'END;']}}
+
+
+def test_sources_kept_across_sessions(mocker, debugger_fixture_active):
+    debugger_fixture_active.source_view.remember(42, ['BEGIN', 'END;'])
+    debugger_fixture_active.catalog.loaded = True
+    debugger_fixture_active.catalog.validate.return_value = True
+    debugger_fixture_active.stop_debug_session()
+    debugger_fixture_active._start_debug_session('f', mocker.MagicMock(), mocker.MagicMock())
+    assert 42 in debugger_fixture_active.source_view.sources()
+
+    # A function was replaced in the meantime
+    debugger_fixture_active.catalog.validate.return_value = False
+    debugger_fixture_active._start_debug_session('f', mocker.MagicMock(), mocker.MagicMock())
+    assert debugger_fixture_active.source_view.sources() == {}
+
+
 def test_get_source_wrapper(mocker, debugger_fixture_active):
     TEST_SOURCE = '1\n2\n3\n'
 
@@ -87,10 +202,87 @@ def test_get_source_wrapper(mocker, debugger_fixture_active):
     debugger_fixture_active.proxy.get_source.assert_called_once_with(42)
 
 
-def test_set_breakpoint_wrapper(debugger_fixture_active):
+def test_show_source_wrapper(mocker, debugger_fixture_active):
+    proxy = debugger_fixture_active.proxy
+    proxy.frame = 0
+    proxy.position = Breakpoint(42, 2, 'foo')
+    proxy.get_source.return_value = 'a\nb\nc'
+    debugger_fixture_active.breakpoints.add(42, [3])
+    debugger_fixture_active.breakpoints.add(1, [1])
+
+    lines = debugger_fixture_active._show_source_wrapper()
+
+    proxy.get_source.assert_called_once_with(42)
+    assert [fragment_list_to_text(line) for line in lines] == [
+        '      1  a',
+        ' >    2  b',
+        '*     3  c',
+    ]
+
+
+def test_frame_wrappers(mocker, debugger_fixture_active):
+    proxy = debugger_fixture_active.proxy
+    proxy.frame = 0
+    proxy.get_stack.return_value = [Frame(0, 'a', 1, 2, ''), Frame(1, 'b', 3, 4, '')]
+    proxy.select_frame.side_effect = lambda level: setattr(proxy, 'frame', level)
+
+    assert debugger_fixture_active._up_wrapper().name == 'b'
+    assert debugger_fixture_active._down_wrapper().name == 'a'
+    assert debugger_fixture_active._frame_wrapper(1).selected
+
+    log_error_mock = mocker.patch('loguru.logger.error')
+    assert debugger_fixture_active._frame_wrapper(5) is None
+    assert debugger_fixture_active._up_wrapper() is None
+    assert log_error_mock.call_count == 2
+    assert proxy.frame == 1
+
+
+def test_set_breakpoint_wrapper(mocker, debugger_fixture_active):
+    log_error_mock = mocker.patch('loguru.logger.error')
     debugger_fixture_active.target.oid = 42
-    debugger_fixture_active._set_breakpoint_wrapper(100)
-    debugger_fixture_active.proxy.set_breakpoint.assert_called_once_with(42, 100)
+    debugger_fixture_active.proxy.get_source.return_value = '\nBEGIN\n  x := 1;\n  y := 2;\nEND;'
+
+    entries = debugger_fixture_active._set_breakpoint_wrapper('3', '2', '4')
+
+    assert [entry.line for entry in entries] == [3, 4]
+    debugger_fixture_active.proxy.set_breakpoints.assert_called_with([(42, 3), (42, 4)])
+    log_error_mock.assert_called_once()
+
+
+def test_breakpoints_survive_sessions(mocker, debugger_fixture_active):
+    debugger = debugger_fixture_active
+    debugger.target.oid = 42
+    debugger.proxy.get_source.return_value = '\nBEGIN\n  x := 1;\nEND;'
+    debugger._run_command('brset', ['3'])
+    debugger._run_command('brdisable', ['1'])
+    debugger.proxy.drop_breakpoints.assert_called_once_with([(42, 3)])
+
+    debugger._run_command('brenable', ['1'])
+    debugger.stop_debug_session()
+    debugger._start_debug_session('some_func', mocker.MagicMock(), mocker.MagicMock())
+
+    debugger.proxy.set_breakpoints.assert_called_once_with([(42, 3)])
+
+
+def test_change_breakpoints_unknown(mocker, debugger_fixture_active):
+    log_error_mock = mocker.patch('loguru.logger.error')
+    debugger_fixture_active._run_command('brdelete', ['7'])
+    log_error_mock.assert_called_once()
+
+
+def test_save_and_load_breakpoints(mocker, tmp_path, debugger_fixture_active):
+    functions = [SQLFunction('foo(integer)', 42)]
+    debugger_fixture_active.catalog.functions.return_value = functions
+    debugger_fixture_active.breakpoints.add(42, [3, 5])
+    debugger_fixture_active._save_breakpoints_wrapper(str(tmp_path / 'bp.json'))
+
+    # The function was recreated in the meantime
+    functions[0] = SQLFunction('foo(integer)', 43)
+    debugger_fixture_active.breakpoints.clear()
+    entries = debugger_fixture_active._load_breakpoints_wrapper(str(tmp_path / 'bp.json'))
+
+    assert [(entry.oid, entry.line, entry.func) for entry in entries] == [
+        (43, 3, 'foo(integer)'), (43, 5, 'foo(integer)')]
 
 
 def test_set_breakpoint_wrapper_error(mocker, debugger_fixture_active):
@@ -99,6 +291,15 @@ def test_set_breakpoint_wrapper_error(mocker, debugger_fixture_active):
     log_error_mock.assert_called_once()
 
 
+def test_deposit_wrapper(mocker, debugger_fixture_active):
+    log_error_mock = mocker.patch('loguru.logger.error')
+    debugger_fixture_active.proxy.deposit.return_value = False
+    debugger_fixture_active._run_command('deposit', ['s', 'a', 'b'])
+
+    debugger_fixture_active.proxy.deposit.assert_called_once_with('s', 'a b')
+    log_error_mock.assert_called_once()
+
+
 def test_run_command(debugger_fixture_active):
     debugger_fixture_active._run_command('vars', [])
     debugger_fixture_active.proxy.get_variables.assert_called_once()
@@ -128,3 +329,257 @@ def test_execute_command_active(mocker, debugger_fixture_active):
     debugger_fixture_active.execute_command('do', ['something'])
     run_cmd_mock.assert_called_once_with('do', ['something'])
     debugger_fixture_active.target.get_notices.assert_called_once()
+
+
+def test_execute_command_watches(mocker, debugger_fixture_active):
+    print_watches_mock = mocker.patch('lib.debugger.print_watches')
+    evaluate_mock = mocker.patch('lib.watches.WatchList.evaluate')
+    debugger_fixture_active.proxy.epoch = 1
+    debugger_fixture_active.watches.add('i')
+
+    debugger_fixture_active.execute_command('vars', [])
+    evaluate_mock.assert_not_called()
+
+    def _step():
+        debugger_fixture_active.proxy.epoch += 1
+
+    debugger_fixture_active.proxy.step_over.side_effect = _step
+    debugger_fixture_active.execute_command('so', [])
+    evaluate_mock.assert_called_once()
+    print_watches_mock.assert_called_once_with(evaluate_mock.return_value)
+
+
+def test_step_wrapper_single(debugger_fixture_active):
+    debugger_fixture_active._step_into_wrapper()
+    debugger_fixture_active.proxy.step_into.assert_called_once()
+    debugger_fixture_active.proxy.step_many.assert_not_called()
+
+
+def test_step_wrapper_many(debugger_fixture_active):
+    debugger_fixture_active.breakpoints.add(7, [3, 4])
+    debugger_fixture_active.breakpoints.disable([2])
+
+    retval = debugger_fixture_active._step_over_wrapper('50', 'until', 'line', '=', '12')
+
+    debugger_fixture_active.proxy.step_many.assert_called_once_with(
+        50, False, [(7, 3)], 'line = 12')
+    assert retval == debugger_fixture_active.proxy.position
+
+
+@pytest.mark.parametrize('args', [('x',), ('0',), ('1', '2'), ('until',)])
+def test_step_wrapper_invalid(mocker, debugger_fixture_active, args):
+    log_mock = mocker.patch('loguru.logger.error')
+    assert debugger_fixture_active._step_into_wrapper(*args) is None
+    log_mock.assert_called_once()
+    debugger_fixture_active.proxy.step_many.assert_not_called()
+
+
+def test_stepper_installed_once(mocker, debugger_fixture):
+    has_mock = mocker.patch('lib.debugger.has_stepper', return_value=False)
+    install_mock = mocker.patch('lib.debugger.install_stepper')
+    assert not debugger_fixture.stepper_installed()
+    assert not debugger_fixture.stepper_installed()
+    has_mock.assert_called_once_with(debugger_fixture.database)
+    # Nothing is created in the database without asking
+    install_mock.assert_not_called()
+
+
+def test_stepper_wrapper(mocker, debugger_fixture):
+    mocker.patch('lib.debugger.has_stepper', return_value=False)
+    install_mock = mocker.patch('lib.debugger.install_stepper', return_value=True)
+    debugger_fixture._start_debug_session('some_func', mocker.MagicMock(), mocker.MagicMock())
+    assert not debugger_fixture.proxy.stepper
+    assert debugger_fixture._stepper_wrapper() is False
+    install_mock.assert_not_called()
+
+    assert debugger_fixture._stepper_wrapper('install') is True
+    install_mock.assert_called_once_with(debugger_fixture.database)
+    assert debugger_fixture.proxy.stepper
+
+    log_mock = mocker.patch('loguru.logger.error')
+    assert debugger_fixture._stepper_wrapper('remove') is None
+    log_mock.assert_called_once()
+
+
+def test_break_slow_wrapper(mocker, debugger_fixture_active):
+    slow = SlowStep(Breakpoint(1, 5, 'f'), 50.0, Breakpoint(1, 6, 'f'))
+    step_mock = mocker.patch('lib.debugger.step_until_slow', return_value=slow)
+
+    report = debugger_fixture_active._break_slow_wrapper(20.0)
+
+    step_mock.assert_called_once_with(debugger_fixture_active.proxy,
+                                      debugger_fixture_active.slow_lines, 20.0, mocker.ANY)
+    assert report.slow == slow
+    assert report.stack is not None
+    assert report.variables is not None
+
+    # Without threshold, the target is not stepped
+    report = debugger_fixture_active._break_slow_wrapper()
+    assert step_mock.call_count == 1
+    assert report.slow is None
+
+
+def test_sql_stats_wrapper(mocker, debugger_fixture_active):
+    db_mock = mocker.patch('lib.debugger.DB')
+    collector_class = mocker.patch('lib.debugger.StatementCollector')
+    collector = collector_class.return_value
+    collector.available.return_value = True
+
+    debugger_fixture_active._sql_stats_wrapper('on')
+    collector_class.assert_called_once_with(db_mock.return_value)
+    assert debugger_fixture_active.proxy.collectors == [collector]
+
+    debugger_fixture_active._sql_stats_wrapper('reset')
+    collector.reset.assert_called_once()
+
+    debugger_fixture_active._sql_stats_wrapper('off')
+    collector.database.cleanup.assert_called_once()
+    assert debugger_fixture_active.proxy.collectors == []
+    assert debugger_fixture_active._sql_stats_wrapper() is None
+
+
+def test_sql_stats_wrapper_unavailable(mocker, debugger_fixture):
+    mocker.patch('lib.debugger.DB')
+    collector = mocker.patch('lib.debugger.StatementCollector').return_value
+    collector.available.return_value = False
+
+    assert debugger_fixture._sql_stats_wrapper('on') is None
+    assert debugger_fixture.statements is None
+    collector.database.cleanup.assert_called_once()
+
+
+def test_waits_wrapper(mocker, debugger_fixture_active):
+    mocker.patch('lib.debugger.DB')
+    sampler = mocker.patch('lib.debugger.WaitSampler').return_value
+
+    debugger_fixture_active._waits_wrapper('on', 50.0)
+    assert sampler.interval == 0.05
+    assert sampler.pid == debugger_fixture_active.target.database.pid
+    assert debugger_fixture_active.proxy.collectors == [sampler]
+
+    debugger_fixture_active._waits_wrapper('off')
+    sampler.database.cleanup.assert_called_once()
+    assert debugger_fixture_active.proxy.collectors == []
+
+
+def test_results_wrapper(mocker, debugger_fixture, tmp_path):
+    debugger_fixture._results_wrapper('file', str(tmp_path / 'out.tsv'), 500)
+    assert str(debugger_fixture.result_sink) == f'file {tmp_path / "out.tsv"}'
+    assert debugger_fixture.fetch_size == 500
+
+    debugger_fixture._results_wrapper('discard')
+    assert debugger_fixture.result_sink.discard
+
+    log_mock = mocker.patch('loguru.logger.error')
+    debugger_fixture._results_wrapper('pager')
+    log_mock.assert_called_once()
+
+    target = mocker.MagicMock()
+    debugger_fixture._start_debug_session('some_func', target, mocker.MagicMock())
+    assert target.sink is debugger_fixture.result_sink
+    assert target.fetch_size == 500
+
+
+LOOP_SOURCE = 'BEGIN\nFOR i IN 1..9 LOOP\na;\nb;\nEND LOOP;\nRETURN 1;\nEND'
+
+
+def _step_many_lines(proxy, lines):
+    '''
+    Let step_many walk through the given lines, honouring stop_at and the
+    loop exit.
+    '''
+    lines = list(lines)
+
+    def _step_many(count, step_into, stop_at, until):
+        stops = []
+        while lines and len(stops) < count:
+            stop = Step(42, lines.pop(0), 'f', 1, None)
+            stops.append(stop)
+            proxy.stops += 1
+            proxy.position = Breakpoint(42, stop.line, 'f')
+            if (42, stop.line) in stop_at or not 2 <= stop.line <= 5:
+                break
+        return stops
+
+    proxy.step_many.side_effect = _step_many
+
+
+def test_skip_loop_wrapper(debugger_fixture_active):
+    proxy = debugger_fixture_active.proxy
+    proxy.get_source.return_value = LOOP_SOURCE
+    proxy.position = Breakpoint(42, 3, 'f')
+    proxy.stops = 0
+    _step_many_lines(proxy, [4, 3, 4, 3, 4, 6, 7])
+
+    assert debugger_fixture_active._skip_loop_wrapper() == Breakpoint(42, 6, 'f')
+    until = proxy.step_many.call_args[0][3]
+    assert until == 'oid <> 42 OR line < 2 OR line > 5'
+
+
+def test_loop_wrapper(debugger_fixture_active):
+    proxy = debugger_fixture_active.proxy
+    proxy.get_source.return_value = LOOP_SOURCE
+    proxy.position = Breakpoint(42, 2, 'f')
+    proxy.stops = 0
+    proxy.step_over.return_value = Breakpoint(42, 3, 'f')
+    _step_many_lines(proxy, [4, 3, 4, 3, 4, 3, 4, 6])
+
+    assert debugger_fixture_active._loop_wrapper(3) == Breakpoint(42, 3, 'f')
+    assert debugger_fixture_active.loops.iteration((42, 2, 5)) == 3
+    assert proxy.step_many.call_args[0][2] == [(42, 3)]
+
+
+def test_loop_wrapper_not_in_loop(mocker, debugger_fixture_active):
+    proxy = debugger_fixture_active.proxy
+    proxy.get_source.return_value = LOOP_SOURCE
+    proxy.position = Breakpoint(42, 6, 'f')
+    log_mock = mocker.patch('loguru.logger.error')
+
+    assert debugger_fixture_active._loop_wrapper(3) is None
+    assert debugger_fixture_active._skip_loop_wrapper() is None
+    assert log_mock.call_count == 2
+
+
+def test_growth_wrapper(mocker, debugger_fixture_active):
+    assert debugger_fixture_active._growth_wrapper() is None
+    assert debugger_fixture_active._growth_wrapper('on') == []
+
+    record_mock = mocker.patch.object(debugger_fixture_active.growth, 'record', return_value=[])
+
+    def _step():
+        debugger_fixture_active.proxy.epoch += 1
+
+    debugger_fixture_active.proxy.epoch = 1
+    debugger_fixture_active.proxy.step_over.side_effect = _step
+    debugger_fixture_active.execute_command('so', [])
+    record_mock.assert_called_once()
+
+    assert debugger_fixture_active._growth_wrapper('off') is None
+    assert debugger_fixture_active.growth is None
+
+
+def test_profile_wrapper(mocker, debugger_fixture_active):
+    record_mock = mocker.patch('lib.debugger.record_profile', return_value=5)
+    debugger_fixture_active._profile_wrapper('record', 5)
+    record_mock.assert_called_once_with(debugger_fixture_active.proxy,
+                                        debugger_fixture_active.profile, 5)
+
+    debugger_fixture_active.profile.add(((1, 2),), 10)
+    debugger_fixture_active.source_view.remember(1, ['BEGIN', 'END'])
+    mocker.patch('lib.debugger.get_function_symbols', return_value={1: ('f()', 'stale')})
+    export_mock = mocker.patch('lib.debugger.export_profile', return_value='out.sources')
+    summary = debugger_fixture_active._profile_wrapper('export', fmt='pprof', path='out')
+    export_mock.assert_called_once_with(debugger_fixture_active.profile,
+                                        {1: ('f()', 'BEGIN\nEND')}, 'pprof', 'out')
+    assert summary.steps == 1
+
+    log_mock = mocker.patch('loguru.logger.error')
+    assert debugger_fixture_active._profile_wrapper('export', fmt='perf', path='out') is None
+    log_mock.assert_called_once()
+
+    assert debugger_fixture_active._profile_wrapper('reset').steps == 0
+
+
+def test_interrupt(debugger_fixture_active):
+    debugger_fixture_active.interrupt()
+    debugger_fixture_active.proxy.database.cancel.assert_called_once()
@@ -0,0 +1,44 @@
+import datetime
+
+from decimal import Decimal
+
+import pytest
+
+from lib.decoding import Decoder
+
+
+@pytest.mark.parametrize('oid, value, expected', [
+    (23, '42', 42),
+    (1700, '1.50', Decimal('1.50')),
+    (16, 't', True),
+    (1082, '2024-02-29', datetime.date(2024, 2, 29)),
+    (1114, '2024-02-29 12:00:00', datetime.datetime(2024, 2, 29, 12)),
+    (1007, '{1,NULL,3}', [1, None, 3]),
+    (25, 'text', 'text'),
+    (23, None, None),
+    (None, '42', '42'),
+    # No caster for composite types, kept as text
+    (99999, '(1,2)', '(1,2)'),
+    # Broken values are kept as text
+    (23, 'abc', 'abc'),
+])
+def test_decode(oid, value, expected):
+    assert Decoder().decode(oid, value) == expected
+
+
+def test_casters_cached_and_local_first(mocker):
+    database = mocker.MagicMock()
+    cursor = database.cursor.return_value.__enter__.return_value
+    cursor.connection.string_types = {23: lambda value, cursor: 'local'}
+    decoder = Decoder(database)
+
+    assert decoder.decode(23, '1') == 'local'
+    assert decoder.decode(20, '1') == 1
+    cursor.connection.string_types = {}
+    assert decoder.decode(23, '1') == 'local'
+
+    # Every cursor is closed again, types without caster need none
+    assert database.cursor.return_value.__exit__.call_count == 3
+    assert decoder.decode(99999, '(1,2)') == '(1,2)'
+    assert decoder.decode(99999, '(1,2)') == '(1,2)'
+    assert database.cursor.call_count == 4
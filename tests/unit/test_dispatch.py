@@ -0,0 +1,133 @@
+
+import pytest
+
+from lib.commands import Argument, Command, Commands
+from lib.dispatch import Dispatcher
+
+
+@pytest.fixture
+def commands():
+    return Commands({
+        'hello': {
+            'command': Command('greeter.hello', None, None),
+            'help': 'Say hello',
+            'aliases': ['hi'],
+            'args': [Argument('times', int), Argument('name', str, required=False)],
+        },
+        'export': {
+            'command': Command('greeter.export', None, None),
+            'help': 'Takes an action',
+            'args': [Argument('action', str, required=False)],
+            'actions': {
+                'file': [Argument('path', str), Argument('size', int, required=False)],
+                'reset': [],
+            },
+        },
+        'guarded': {
+            'command': Command('greeter.hello', 'is_ready', None),
+            'help': 'Needs a prerequisite',
+        },
+        'exit': {
+            'help': 'Not dispatchable'
+        },
+    })
+
+
+@pytest.fixture
+def owner(mocker):
+    owner = mocker.MagicMock()
+    owner.is_ready.return_value = True
+    return owner
+
+
+def test_dispatch(owner, commands):
+    dispatcher = Dispatcher(owner, commands)
+    dispatcher.dispatch('hello', ['2', 'world'])
+    owner.greeter.hello.assert_called_once_with(2, 'world')
+
+
+def test_dispatch_alias(owner, commands):
+    dispatcher = Dispatcher(owner, commands)
+    dispatcher.dispatch('hi', ['3'])
+    owner.greeter.hello.assert_called_once_with(3)
+
+
+def test_dispatch_compiles_once(mocker, owner, commands):
+    dispatcher = Dispatcher(owner, commands)
+    compile_spy = mocker.spy(dispatcher, 'compile')
+    for _ in range(10):
+        dispatcher.dispatch('hello', ['1'])
+    assert compile_spy.call_count == 1
+
+    dispatcher.invalidate()
+    dispatcher.dispatch('hello', ['1'])
+    assert compile_spy.call_count == 2
+
+
+@pytest.mark.parametrize('args,called,kwargs', [
+    ([], (), {}),
+    (['file', 'out', '5'], ('file',), {'path': 'out', 'size': 5}),
+    (['file', 'out'], ('file',), {'path': 'out'}),
+    (['reset'], ('reset',), {}),
+])
+def test_dispatch_actions(owner, commands, args, called, kwargs):
+    Dispatcher(owner, commands).dispatch('export', args)
+    owner.greeter.export.assert_called_once_with(*called, **kwargs)
+
+
+@pytest.mark.parametrize('name,args', [
+    ('does_not_exist', []),
+    ('exit', []),
+    ('hello', []),
+    ('hello', ['not_a_number']),
+    ('hello', ['1', 'world', 'again']),
+    ('export', ['pager']),
+    ('export', ['file']),
+    ('export', ['file', 'out', 'big']),
+    ('export', ['reset', 'now']),
+])
+def test_dispatch_errors(mocker, owner, commands, name, args):
+    log_error_mock = mocker.patch('loguru.logger.error')
+    Dispatcher(owner, commands).dispatch(name, args)
+    log_error_mock.assert_called_once()
+    owner.greeter.hello.assert_not_called()
+    owner.greeter.export.assert_not_called()
+
+
+def test_dispatch_prereq(mocker, owner, commands):
+    log_error_mock = mocker.patch('loguru.logger.error')
+    owner.is_ready.return_value = False
+    Dispatcher(owner, commands).dispatch('guarded', [])
+    log_error_mock.assert_called_once()
+    owner.greeter.hello.assert_not_called()
+
+
+def test_register(mocker, owner, commands):
+    plugin = mocker.MagicMock(return_value='result')
+    return_func = mocker.MagicMock()
+    dispatcher = Dispatcher(owner, commands)
+    dispatcher.dispatch('hello', ['1'])
+
+    commands.register('plugin', plugin, 'A plugin command', return_func=return_func,
+                      aliases=['pl'], args=[Argument('text', str, rest=True)])
+    assert commands.resolve('pl') == 'plugin'
+    assert 'pl' in commands.names
+
+    dispatcher.dispatch('pl', ['a', 'b'])
+    plugin.assert_called_once_with(owner, 'a b')
+    return_func.assert_called_once_with('result')
+
+
+@pytest.mark.parametrize('schema,args,expected', [
+    ([], ['a', 'b'], ['a', 'b']),
+    ([Argument('a', int)], ['1'], [1]),
+    ([Argument('a', int), Argument('b', str, required=False)], ['1'], [1]),
+    ([Argument('a', str, rest=True)], ['foo(1,', '2)'], ['foo(1, 2)']),
+])
+def test_convert_args(schema, args, expected):
+    assert Dispatcher.convert_args(schema, args) == expected
+
+
+def test_convert_args_too_many():
+    with pytest.raises(ValueError, match='Too many arguments'):
+        Dispatcher.convert_args([Argument('a', int)], ['1', '2'])
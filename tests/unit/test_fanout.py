@@ -0,0 +1,112 @@
+
+from collections import Counter
+
+import pytest
+
+from lib.fanout import Fanout, FanoutRun, read_args_file
+from lib.proxy import Breakpoint, Step
+from lib.stepper import STEP_BATCH
+from lib.target import SHUTDOWN_TIMEOUT
+
+
+def test_read_args_file(tmp_path):
+    path = tmp_path / 'args.txt'
+    path.write_text("1\n\n# comment\n'abc', 2\n")
+    assert read_args_file(str(path)) == ['1', "'abc', 2"]
+
+
+@pytest.mark.parametrize('connections,inputs,cpus,workers', [
+    (16, 100, 8, 8),
+    (16, 3, 8, 3),
+    (100, 100, 2, 8),
+    (1, 100, 8, 1),
+])
+def test_workers(mocker, connections, inputs, cpus, workers):
+    mocker.patch('os.cpu_count', return_value=cpus)
+    assert Fanout('dsn', connections=connections).workers(inputs) == workers
+
+
+def test_run_one(mocker):
+    target = mocker.patch('lib.fanout.Target').return_value
+    target.error = None
+    proxy = mocker.patch('lib.fanout.Proxy').return_value
+    proxy.step_into.side_effect = [Breakpoint(1, 5, 'f'), Breakpoint(1, 6, 'f'), None]
+
+    run, coverage = Fanout('dsn')._run_one(0, 'f', 1, '2')
+
+    target.start.assert_called_once_with('f(2)', once=True, func_oid=1)
+    proxy.attach.assert_called_once_with(target.port)
+    assert (run.args, run.steps, run.lines, run.error) == ('2', 2, 2, None)
+    assert coverage == {(1, 5): 1, (1, 6): 1}
+    proxy.abort.assert_not_called()
+    proxy.cleanup.assert_called_once()
+    target.cleanup.assert_called_once()
+
+
+def test_run_one_max_steps(mocker):
+    target = mocker.patch('lib.fanout.Target').return_value
+    target.error = None
+    proxy = mocker.patch('lib.fanout.Proxy').return_value
+    proxy.step_into.return_value = Breakpoint(1, 5, 'f')
+
+    run, _ = Fanout('dsn', max_steps=10)._run_one(0, 'f', 1, '2')
+
+    assert run.steps == 10
+    assert run.error
+    proxy.abort.assert_called_once()
+
+
+def test_run_one_timeout(mocker):
+    target = mocker.patch('lib.fanout.Target').return_value
+    target.wait_for_shutdown.return_value = False
+    target.error = 'canceling statement due to user request'
+    proxy = mocker.patch('lib.fanout.Proxy').return_value
+    proxy.step_into.return_value = None
+
+    run, _ = Fanout('dsn')._run_one(0, 'f', 1, '2')
+
+    target.wait_for_shutdown.assert_called_once_with(SHUTDOWN_TIMEOUT)
+    assert run.error.startswith('timed out')
+    target.cleanup.assert_called_once()
+
+
+def test_run_one_start_failure(mocker):
+    target = mocker.patch('lib.fanout.Target').return_value
+    target.start.return_value = False
+    proxy_class = mocker.patch('lib.fanout.Proxy')
+
+    run, coverage = Fanout('dsn')._run_one(0, 'f', 1, '2')
+
+    assert run.error
+    assert not coverage
+    proxy_class.assert_not_called()
+    target.cleanup.assert_called_once()
+
+
+def test_run(mocker):
+    def _run_one(index, func_name, func_oid, args):
+        if args == 'bad':
+            raise RuntimeError('boom')
+        return FanoutRun(args, 1, 1, 0.0, None), Counter({(1, int(args)): 1})
+
+    mocker.patch.object(Fanout, '_run_one', side_effect=_run_one)
+    report = Fanout('dsn').run('f', 1, ['5', '6', '5', 'bad'])
+
+    assert [run.args for run in report.runs] == ['5', '6', '5', 'bad']
+    assert report.runs[-1].error == 'boom'
+    assert report.coverage == {(1, 5): 2, (1, 6): 1}
+
+
+def test_run_one_batched(mocker):
+    target = mocker.patch('lib.fanout.Target').return_value
+    target.error = None
+    proxy = mocker.patch('lib.fanout.Proxy').return_value
+    proxy.position = None
+    proxy.step_many.return_value = [Step(1, 5, 'f', 10, None), Step(1, 6, 'f', 10, None)]
+
+    run, coverage = Fanout('dsn', batch_stepping=True)._run_one(0, 'f', 1, '2')
+
+    assert proxy.stepper
+    proxy.step_many.assert_called_once_with(STEP_BATCH, True)
+    proxy.step_into.assert_not_called()
+    assert (run.steps, run.lines) == (2, 2)
@@ -0,0 +1,145 @@
+from collections import OrderedDict
+
+import psycopg2
+import pytest
+
+from lib import growth
+from lib.growth import GrowthTracker, SizeSeries, growth_exponent, server_sizes
+from lib.helpers import TypeInfo
+from lib.loops import Loop, LoopState
+from lib.proxy import Variable
+
+
+LOOP = Loop(7, 2, 5)
+
+
+def _variable(name, value, dtype=25):
+    return Variable(name, 'L', 1, True, False, False, dtype, value)
+
+
+@pytest.mark.parametrize('sizes,expected', [
+    ([100 + 10 * n for n in range(1, 20)], 1.0),
+    ([n ** 2 for n in range(1, 20)], 2.0),
+])
+def test_growth_exponent(sizes, expected):
+    exponent = growth_exponent(list(range(1, 20)), sizes)
+    assert exponent == pytest.approx(expected, abs=0.4)
+
+
+def test_growth_exponent_no_growth():
+    assert growth_exponent([1, 2, 3, 4], [10, 10, 10, 10]) is None
+    assert growth_exponent([1, 2], [10, 20]) is None
+
+
+def test_series():
+    series = SizeSeries()
+    series.add(1, 10, 10)
+    series.add(1, 20, 20)
+    series.add(2, 30, 30)
+    assert list(series.iterations) == [1, 2]
+    assert list(series.sizes) == [20, 30]
+
+    # The loop started again
+    series.add(1, 5, 5)
+    assert list(series.sizes) == [5]
+
+
+def test_series_is_compacted():
+    series = SizeSeries()
+    for iteration in range(1, 2000):
+        series.add(iteration, iteration * 100, iteration)
+
+    assert len(series) <= growth.MAX_POINTS
+    assert series.iterations[0] == 1
+    assert series.iterations[-1] == 1999
+
+
+@pytest.mark.parametrize('size,flagged', [
+    (lambda n: 1000 * n, False),
+    (lambda n: 100 * n ** 2, True),
+    (lambda n: 2 ** n, True),
+    # Grows fast, but stays small
+    (lambda n: n ** 2, False),
+])
+def test_series_superlinear(size, flagged):
+    series = SizeSeries()
+    for iteration in range(1, 21):
+        series.add(iteration, size(iteration), 0)
+
+    assert series.superlinear() == flagged
+
+
+@pytest.fixture
+def inspector(mocker):
+    inspector = mocker.MagicMock()
+    inspector.get_types.return_value = {25: TypeInfo('text', 'S', 0, [], []),
+                                        1007: TypeInfo('_int4', 'A', 23, [], [])}
+    return inspector
+
+
+def test_server_sizes(inspector):
+    inspector.proxy.database.run_sql.return_value = [(300, 1200)]
+    variables = [_variable('small', 'x'), _variable('empty', None),
+                 _variable('big', "it's" * 100), _variable('array', '{1}' * 200, 1007),
+                 _variable('unknown', 'x' * 300, 99)]
+
+    assert server_sizes(inspector, variables) == {'big': 300, 'array': 1200}
+    sql = inspector.proxy.database.run_sql.call_args[0][0]
+    assert "pg_column_size(('it''s" in sql
+    assert '::_int4)' in sql
+    assert sql.count('pg_column_size') == 2
+
+
+def test_server_sizes_huge(inspector, mocker):
+    mocker.patch.object(growth, 'SERVER_SIZE_MAX', 1000)
+    assert server_sizes(inspector, [_variable('huge', 'x' * 1001)]) == {}
+    inspector.proxy.database.run_sql.assert_not_called()
+
+
+def test_server_sizes_error(inspector):
+    inspector.proxy.database.run_sql.side_effect = psycopg2.Error
+    assert server_sizes(inspector, [_variable('big', 'x' * 300)]) == {}
+
+
+def test_tracker(inspector):
+    tracker = GrowthTracker()
+    flagged = []
+    for iteration in range(1, 21):
+        inspector.get_variables.return_value = OrderedDict([
+            ('counter', _variable('counter', str(iteration), 23)),
+            ('text', _variable('text', 'x' * (20 * iteration ** 2))),
+        ])
+        inspector.proxy.database.run_sql.return_value = [(20 * iteration ** 2 + 4,)]
+        flagged += tracker.record(inspector, 7, 'f()', LoopState(LOOP, iteration, 4))
+
+    assert [entry.name for entry in flagged] == ['text']
+    entries = tracker.entries()
+    assert entries[0].name == 'text'
+    assert entries[0].flagged
+    assert entries[0].last == 8004
+    assert entries[0].text_size == 8000
+    assert entries[0].func == 'f()'
+    assert not entries[1].flagged
+
+    tracker.reset()
+    assert tracker.entries() == []
+
+
+def test_tracker_measures_changed_sizes(inspector):
+    tracker = GrowthTracker()
+    inspector.proxy.database.run_sql.return_value = [(310,)]
+    for iteration, value in enumerate(['a' * 300, 'b' * 300, 'c' * 400], 1):
+        inspector.get_variables.return_value = OrderedDict([('text', _variable('text', value))])
+        tracker.record(inspector, 7, 'f()', LoopState(LOOP, iteration, 4))
+
+    # The second value has the same text size, it is not sent again
+    assert inspector.proxy.database.run_sql.call_count == 2
+    assert list(tracker.series[(7, 'text', LOOP)].sizes) == [310, 310, 310]
+
+
+def test_tracker_outside_loop(inspector):
+    tracker = GrowthTracker()
+
+    assert tracker.record(inspector, 7, 'f()', None) == []
+    assert tracker.record(inspector, 8, 'g()', LoopState(LOOP, 3, 4)) == []
+    inspector.get_variables.assert_not_called()
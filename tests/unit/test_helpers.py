@@ -3,7 +3,7 @@ import pytest
 
 import lib.helpers as lib_helpers
 
-from lib.helpers import SQLFunction
+from lib.helpers import SQLFunction, is_loopback
 
 
 @pytest.mark.parametrize('func_name,oid', [
@@ -29,3 +29,43 @@ def test_get_all_functions(mocker):
         SQLFunction('func1', 1),
         SQLFunction('func2', 2)
     ]
+
+
+def test_get_catalog_state(mocker):
+    database = mocker.MagicMock()
+    database.run_sql.return_value = [('db', 3, '1234', {'42': '100'})]
+
+    state = lib_helpers.get_catalog_state(database, [42, 43])
+
+    assert state == lib_helpers.CatalogState('db', 3, '1234', {42: '100'})
+    assert 'p.oid IN (42,43)' in database.run_sql.call_args[0][0]
+
+
+def test_function_catalog(mocker):
+    states = [lib_helpers.CatalogState('db', 2, '10', {})]
+    get_state = mocker.patch.object(lib_helpers, 'get_catalog_state',
+                                    side_effect=lambda database: states[-1])
+    get_all = mocker.patch.object(lib_helpers, 'get_all_functions', return_value=[
+        SQLFunction('foobar(integer)', 1), SQLFunction('match(text)', 42)])
+
+    catalog = lib_helpers.FunctionCatalog(mocker.MagicMock())
+    assert not catalog.validate()
+    assert catalog.oid('match') == 42
+    assert catalog.oid('foobar') == 1
+    assert catalog.validate()
+    get_all.assert_called_once()
+
+    # A function was replaced
+    states.append(lib_helpers.CatalogState('db', 2, '11', {}))
+    assert not catalog.validate()
+    assert catalog.oid('match') == 42
+    assert get_all.call_count == 2
+    assert catalog.fingerprint == (2, '11')
+    assert get_state.call_count == 4
+
+
+@pytest.mark.parametrize('host, loopback', [
+    ('127.0.0.1', True), ('::1', True), ('localhost', True),
+    ('0.0.0.0', False), ('', False), ('example.com', False)])
+def test_is_loopback(host, loopback):
+    assert is_loopback(host) == loopback
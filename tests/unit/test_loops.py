@@ -0,0 +1,69 @@
+
+from lib.loops import Loop, LoopTracker, find_loops
+from lib.proxy import Breakpoint
+
+
+SOURCE = '''
+DECLARE
+    i int;
+BEGIN
+    FOR i IN 1..3 LOOP
+        RAISE NOTICE 'loop %', i;  -- not a loop
+        WHILE x < 2
+        LOOP
+            x := x + 1;
+        END LOOP;
+    END LOOP;
+    RETURN i;
+END
+'''.split('\n')
+
+
+def _tracker():
+    return LoopTracker(lambda oid: SOURCE)
+
+
+def test_find_loops():
+    assert find_loops(SOURCE) == [(5, 11), (8, 10)]
+    assert find_loops(['BEGIN', "RAISE NOTICE 'LOOP';", 'END']) == []
+
+
+def test_innermost():
+    tracker = _tracker()
+    assert tracker.innermost(1, 6) == Loop(1, 5, 11)
+    assert tracker.innermost(1, 9) == Loop(1, 8, 10)
+    assert tracker.innermost(1, 12) is None
+
+
+def test_observe_iterations():
+    tracker = _tracker()
+    lines = [5, 6, 7, 9, 7, 6, 7, 6, 7, 12]
+    states = [tracker.observe(Breakpoint(1, line, 'f'), stop)
+              for stop, line in enumerate(lines)]
+
+    outer = Loop(1, 5, 11)
+    assert [state.iteration if state and state.loop == outer else None
+            for state in states] == [0, 1, 1, None, 1, 2, 2, 3, 3, None]
+    assert states[5].period == 4
+    assert states[-1] is None
+    # The loop was left, it starts from scratch next time
+    assert tracker.iteration(outer) == 0
+
+
+def test_observe_once_per_stop():
+    tracker = _tracker()
+    tracker.observe(Breakpoint(1, 6, 'f'), 1)
+    state = tracker.observe(Breakpoint(1, 6, 'f'), 1)
+    assert state.iteration == 1
+
+
+def test_observe_steps():
+    tracker = _tracker()
+    state = tracker.observe_steps([Breakpoint(1, 6, 'f'), Breakpoint(1, 7, 'f'),
+                                   Breakpoint(1, 6, 'f')], Breakpoint(1, 6, 'f'), 3)
+    assert state.iteration == 2
+    assert tracker.first_line(Loop(1, 5, 11)) == 6
+    assert tracker.observe_steps([], None, 4) is None
+
+    tracker.reset()
+    assert tracker.iteration(Loop(1, 5, 11)) == 0
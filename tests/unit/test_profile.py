@@ -0,0 +1,196 @@
+import gzip
+import json
+
+from io import StringIO
+
+import pytest
+
+from lib.profile import (FunctionSymbol, Profile, export_profile, get_function_symbols,
+                         pprof_profile, record_profile, source_file_name, speedscope_document,
+                         stack_key, write_callgrind)
+from lib.proxy import Frame, Step
+
+
+SYMBOLS = {
+    1: FunctionSymbol('public.outer(integer)', 'BEGIN\nPERFORM inner();\nEND', 'p/1_outer.sql'),
+    2: FunctionSymbol('public.inner()', 'BEGIN\nx := 1;\nEND', 'p/2_inner.sql'),
+}
+
+
+@pytest.fixture
+def profile():
+    profile = Profile()
+    profile.add(((1, 2), (2, 2)), 300)
+    profile.add(((1, 2), (2, 2)), 100)
+    profile.add(((1, 2), (2, 3)), 50)
+    profile.add(((1, 3),), 7)
+    return profile
+
+
+def _read_varint(data, position):
+    value = shift = 0
+    while True:
+        byte = data[position]
+        position += 1
+        value |= (byte & 0x7f) << shift
+        shift += 7
+        if not byte & 0x80:
+            return value, position
+
+
+def _decode(data):
+    '''
+    Decode the fields of a protobuf message as (number, value) pairs.
+    '''
+    fields = []
+    position = 0
+    while position < len(data):
+        key, position = _read_varint(data, position)
+        if key & 7 == 0:
+            value, position = _read_varint(data, position)
+        else:
+            length, position = _read_varint(data, position)
+            value = data[position:position + length]
+            position += length
+        fields.append((key >> 3, value))
+    return fields
+
+
+def test_stack_key():
+    frames = [Frame(0, 'inner()', 2, 5, ''), Frame(1, 'outer(integer)', 1, 9, '')]
+    assert stack_key(frames) == ((1, 9), (2, 5))
+
+
+def test_profile(profile):
+    assert profile.stacks[((1, 2), (2, 2))] == [2, 400]
+    assert profile.oids() == [1, 2]
+    assert profile.summary() == (4, 457, 3, 2)
+
+    profile.add_lines({(3, 1): 5}, {(3, 1): 20})
+    assert profile.stacks[((3, 1),)] == [5, 20]
+
+    profile.reset()
+    assert len(profile) == 0
+
+
+def test_record_profile(mocker):
+    proxy = mocker.MagicMock()
+    proxy.get_stack.return_value = [Frame(0, 'outer(integer)', 1, 2, '')]
+    batches = [
+        [Step(2, 2, 'inner()', 10, [Frame(0, 'inner()', 2, 2, ''),
+                                   Frame(1, 'outer(integer)', 1, 2, '')]),
+         Step(1, 3, 'outer(integer)', 20, None)],
+        [Step(1, 4, 'outer(integer)', 30, None)],
+    ]
+    proxy.step_many.side_effect = batches
+
+    def _position():
+        return None if proxy.step_many.call_count == 2 else True
+    type(proxy).position = mocker.PropertyMock(side_effect=_position)
+
+    profile = Profile()
+    assert record_profile(proxy, profile) == 3
+    assert profile.stacks == {((1, 2),): [1, 10], ((1, 2), (2, 2)): [1, 20], ((1, 3),): [1, 30]}
+    assert proxy.step_many.call_args[1]['with_stack']
+
+
+def test_record_profile_max_steps(mocker):
+    proxy = mocker.MagicMock()
+    proxy.get_stack.return_value = []
+    proxy.step_many.return_value = [Step(1, 3, 'f', 20, None)] * 5
+
+    assert record_profile(proxy, Profile(), max_steps=10) == 10
+    assert proxy.step_many.call_args[0][0] == 5
+
+
+def test_get_function_symbols(mocker):
+    database = mocker.MagicMock()
+    database.run_sql.return_value = [(1, 'public.outer(integer)', 'BEGIN END')]
+
+    assert get_function_symbols(database, [1]) == {1: ('public.outer(integer)', 'BEGIN END')}
+    assert 'regprocedure' in database.run_sql.call_args[0][0]
+    assert get_function_symbols(database, []) == {}
+
+
+def test_source_file_name():
+    assert source_file_name(42, 'my schema.foo(integer, text)') == '42_my_schema.foo.sql'
+
+
+def test_callgrind(profile):
+    out = StringIO()
+    write_callgrind(profile, SYMBOLS, out)
+    header, outer, inner = out.getvalue().strip().split('\n\n')
+
+    assert 'events: Steps Microseconds' in header
+    assert outer == ('fl=p/1_outer.sql\nfn=public.outer(integer)\n3 1 7\n'
+                     'cfl=p/2_inner.sql\ncfn=public.inner()\ncalls=3 1\n2 3 450')
+    assert inner == 'fl=p/2_inner.sql\nfn=public.inner()\n2 2 400\n3 1 50'
+
+
+def test_callgrind_recursion():
+    profile = Profile()
+    profile.add(((1, 2), (1, 2), (1, 3)), 10)
+    out = StringIO()
+    write_callgrind(profile, SYMBOLS, out)
+    assert 'calls=1 1\n2 1 10\n' in out.getvalue()
+
+
+def test_speedscope(profile):
+    document = speedscope_document(profile, SYMBOLS)
+    frames = document['shared']['frames']
+    sampled = document['profiles'][0]
+
+    assert frames[0] == {'name': 'public.outer(integer):2', 'file': 'p/1_outer.sql', 'line': 2}
+    assert [[frames[index]['name'] for index in sample] for sample in sampled['samples']] == [
+        ['public.outer(integer):2', 'public.inner():2'],
+        ['public.outer(integer):2', 'public.inner():3'],
+        ['public.outer(integer):3']]
+    assert sampled['weights'] == [400, 50, 7]
+    assert sampled['endValue'] == 457
+
+
+def test_pprof(profile):
+    fields = _decode(gzip.decompress(pprof_profile(profile, SYMBOLS)))
+    strings = [value.decode() for number, value in fields if number == 6]
+    samples = [dict(_decode(value)) for number, value in fields if number == 2]
+    locations = [_decode(value) for number, value in fields if number == 4]
+    functions = [dict(_decode(value)) for number, value in fields if number == 5]
+
+    assert strings[0] == ''
+    assert {'steps', 'time', 'microseconds', 'public.inner()', 'p/2_inner.sql'} <= set(strings)
+    assert len(samples) == 3
+    assert len(locations) == 4
+    assert [strings[function[2]] for function in functions] == ['public.outer(integer)',
+                                                                'public.inner()']
+
+    # Leaf location first, values are steps and time
+    first = samples[0]
+    leaf, caller = [_read_varint(first[1], 0)[0], _read_varint(first[1], 1)[0]]
+    location_lines = {dict(location)[1]: dict(_decode(dict(location)[4]))
+                      for location in locations}
+    assert location_lines[leaf] == {1: 2, 2: 2}
+    assert location_lines[caller] == {1: 1, 2: 2}
+    assert _read_varint(first[2], 0)[0] == 2
+    assert _read_varint(first[2], 1)[0] == 400
+
+
+@pytest.mark.parametrize('fmt', ['callgrind', 'speedscope', 'pprof'])
+def test_export_profile(profile, tmp_path, fmt):
+    path = str(tmp_path / f'profile.{fmt}')
+    symbols = {1: ('public.outer(integer)', 'BEGIN\nPERFORM inner();\nEND')}
+
+    directory = export_profile(profile, symbols, fmt, path)
+
+    assert (tmp_path / f'profile.{fmt}').stat().st_size > 0
+    assert (tmp_path / f'profile.{fmt}.sources' / '1_public.outer.sql').read_text() == \
+        'BEGIN\nPERFORM inner();\nEND'
+    # Functions without symbol are named by their OID
+    assert (tmp_path / f'profile.{fmt}.sources' / '2_2.sql').exists()
+    assert directory == f'{path}.sources'
+    if fmt == 'speedscope':
+        assert json.loads((tmp_path / f'profile.{fmt}').read_text())['shared']['frames']
+
+
+def test_export_profile_unknown_format(profile, tmp_path):
+    with pytest.raises(ValueError):
+        export_profile(profile, {}, 'perf', str(tmp_path / 'profile'))
@@ -47,8 +47,19 @@ def test_attach(proxy_fixture):
 
 
 def test_cont(proxy_fixture):
-    proxy_fixture.cont()
+    BPOINT = [(123, 456, 'blaa')]
+    proxy_fixture._run_cmd.return_value = BPOINT
+    retval = proxy_fixture.cont()
+
     proxy_fixture._run_cmd.assert_called_once_with('pldbg_continue', [SESSION_ID])
+    assert retval == Breakpoint(*BPOINT[0])
+    assert proxy_fixture.position == retval
+
+
+def test_cont_finished(proxy_fixture):
+    proxy_fixture._run_cmd.return_value = []
+    assert proxy_fixture.cont() is None
+    assert proxy_fixture.position is None
 
 
 def test_abort(proxy_fixture):
@@ -69,10 +80,68 @@ def test_get_variables(proxy_fixture):
     ]
     proxy_fixture._run_cmd.return_value = VARS
 
+    # Variables only change when the target stopped again
+    assert proxy_fixture.get_variables() == []
+    proxy_fixture.epoch += 1
+
     retval = proxy_fixture.get_variables()
     assert retval == [Variable(*x) for x in VARS]
 
 
+def test_memoized_per_epoch(proxy_fixture):
+    proxy_fixture._run_cmd.side_effect = lambda cmd, args: {
+        'pldbg_get_stack': [(0, 'f()', 123, 5, '')],
+    }.get(cmd, [(123, 5, 'f()')])
+    for _ in range(3):
+        proxy_fixture.get_stack()
+        proxy_fixture.get_breakpoints()
+    assert proxy_fixture._run_cmd.call_count == 2
+
+    proxy_fixture.step_into()
+    proxy_fixture.get_stack()
+    assert proxy_fixture._run_cmd.call_count == 4
+
+
+def test_memoized_variables_per_frame(proxy_fixture):
+    proxy_fixture._run_cmd.return_value = []
+    proxy_fixture.get_variables()
+    proxy_fixture.select_frame(1)
+    proxy_fixture.get_variables()
+    proxy_fixture.get_variables()
+    assert [call[0][0] for call in proxy_fixture._run_cmd.call_args_list] == [
+        'pldbg_get_variables', 'pldbg_select_frame', 'pldbg_get_variables']
+
+
+def test_changes_forget_memo(proxy_fixture):
+    proxy_fixture._run_cmd.side_effect = lambda cmd, args: {
+        'pldbg_get_breakpoints': [(123, 5, 'f()')],
+        'pldbg_get_stack': [(0, 'f()', 123, 5, '')],
+        'pldbg_get_variables': [],
+    }.get(cmd, [(True,)])
+    proxy_fixture.get_stack()
+    proxy_fixture.get_variables()
+    proxy_fixture.get_breakpoints()
+    proxy_fixture.set_breakpoint(123, 5)
+    proxy_fixture.get_breakpoints()
+    proxy_fixture.drop_breakpoint(123, 5)
+    assert proxy_fixture.deposit('x', "it's")
+
+    # Only stops end an epoch
+    assert proxy_fixture.epoch == 0
+    assert proxy_fixture.deposits == 1
+
+    proxy_fixture.get_breakpoints()
+    proxy_fixture.get_variables()
+    proxy_fixture.get_stack()
+    assert [call[0][0] for call in proxy_fixture._run_cmd.call_args_list] == [
+        'pldbg_get_stack', 'pldbg_get_variables', 'pldbg_get_breakpoints',
+        'pldbg_set_breakpoint', 'pldbg_get_breakpoints', 'pldbg_drop_breakpoint',
+        'pldbg_deposit_value', 'pldbg_get_breakpoints', 'pldbg_get_variables',
+        'pldbg_get_stack']
+    proxy_fixture._run_cmd.assert_any_call(
+        'pldbg_deposit_value', [SESSION_ID, "'x'", -1, "'it''s'"])
+
+
 def test_step_over(proxy_fixture):
     BPOINT = [(123, 456, 'blaa')]
     proxy_fixture._run_cmd.return_value = BPOINT
@@ -112,6 +181,17 @@ def test_get_stack(proxy_fixture):
     assert retval == [Frame(*x) for x in FRAME]
 
 
+def test_select_frame(proxy_fixture):
+    proxy_fixture._run_cmd.return_value = [(123, 5, 'foo')]
+    assert proxy_fixture.select_frame(2) == Breakpoint(123, 5, 'foo')
+    proxy_fixture._run_cmd.assert_called_once_with('pldbg_select_frame', [SESSION_ID, 2])
+    assert proxy_fixture.frame == 2
+
+    proxy_fixture._run_cmd.return_value = [(123, 6, 'foo')]
+    proxy_fixture.step_over()
+    assert proxy_fixture.frame == 0
+
+
 def test_get_breakpoints(proxy_fixture):
     BPOINTS = [
         (123, 456, 'blaa'),
@@ -129,8 +209,85 @@ def test_set_breakpoint(proxy_fixture):
     proxy_fixture._run_cmd.assert_called_once_with('pldbg_set_breakpoint', [SESSION_ID, 123, 456])
 
 
+def test_drop_breakpoint(proxy_fixture):
+    proxy_fixture.drop_breakpoint(123, 456)
+    proxy_fixture._run_cmd.assert_called_once_with('pldbg_drop_breakpoint', [SESSION_ID, 123, 456])
+
+
+def test_set_breakpoints_bulk(proxy_fixture_real_run):
+    proxy_fixture_real_run.set_breakpoints([(123, 4), (124, 5)])
+    proxy_fixture_real_run.database.run_sql.assert_called_once_with(
+        f'SELECT pldbg_set_breakpoint({SESSION_ID}, b.oid, b.line) '
+        'FROM unnest(ARRAY[123,124]::oid[], ARRAY[4,5]::int[]) AS b(oid, line)',
+        fetch_result=True)
+    assert proxy_fixture_real_run.epoch == 0
+
+    proxy_fixture_real_run.drop_breakpoints([])
+    proxy_fixture_real_run.database.run_sql.assert_called_once()
+
+
+def test_cleanup(proxy_fixture_real_run):
+    proxy_fixture_real_run.cleanup()
+    proxy_fixture_real_run.database.cleanup.assert_called_once()
+
+
 def test_run_cmd(mocker, proxy_fixture_real_run):
     ARGS = [1, 2, 3]
     proxy_fixture_real_run._run_cmd('foobar', ARGS)
     proxy_fixture_real_run.database.run_sql.assert_called_once_with(
         f'SELECT * FROM foobar(1,2,3)', fetch_result=True)
+
+
+def test_step_many(proxy_fixture_real_run):
+    proxy_fixture_real_run.stepper = True
+    proxy_fixture_real_run.database.run_sql.return_value = [
+        (123, 4, 'f', 10, None), (123, 5, 'f', 20, [[0, 'f', 123, 5, '']])]
+
+    stops = proxy_fixture_real_run.step_many(100, stop_at=[(123, 5)], until="line = 7")
+
+    sql = proxy_fixture_real_run.database.run_sql.call_args[0][0]
+    assert 'pydebug.step_many(42, 100, True, ARRAY[123]::oid[], ARRAY[5]::int[], ' \
+           "'line = 7', False)" in sql
+    assert [(stop.oid, stop.line, stop.elapsed_us) for stop in stops] == [(123, 4, 10),
+                                                                       (123, 5, 20)]
+    assert stops[1].stack == [Frame(0, 'f', 123, 5, '')]
+    assert proxy_fixture_real_run.position == Breakpoint(123, 5, 'f')
+    assert proxy_fixture_real_run.epoch == 1
+
+
+def test_step_many_finished(proxy_fixture_real_run):
+    proxy_fixture_real_run.stepper = True
+    proxy_fixture_real_run.database.run_sql.return_value = [
+        (123, 4, 'f', 10, None), (None, None, None, 5, None)]
+
+    stops = proxy_fixture_real_run.step_many(100)
+
+    assert len(stops) == 1
+    assert proxy_fixture_real_run.position is None
+
+
+def test_step_many_client(proxy_fixture):
+    proxy_fixture._run_cmd.side_effect = [[(123, 4, 'f')], [(123, 5, 'f')], [(123, 6, 'f')]]
+
+    stops = proxy_fixture.step_many(10, step_into=False, stop_at=[(123, 5)])
+
+    assert [stop.line for stop in stops] == [4, 5]
+    proxy_fixture._run_cmd.assert_called_with('pldbg_step_over', [SESSION_ID])
+    assert proxy_fixture.position == Breakpoint(123, 5, 'f')
+
+
+def test_resume_collector(mocker, proxy_fixture):
+    collector = mocker.MagicMock()
+    proxy_fixture.collectors = [collector]
+    proxy_fixture.position = Breakpoint(123, 4, 'f')
+    proxy_fixture._run_cmd.return_value = [(123, 5, 'f')]
+
+    proxy_fixture.step_over()
+
+    collector.before.assert_called_once()
+    collector.after.assert_called_once_with(Breakpoint(123, 4, 'f'))
+
+    # Batched stepping on the server would hide the steps from the collector
+    proxy_fixture.stepper = True
+    proxy_fixture.step_many(1)
+    assert collector.after.call_count == 2
@@ -0,0 +1,59 @@
+
+import pytest
+
+from lib.resources import DEBUGGER, SESSION, ResourceTracker
+
+
+def test_close_all_reverse_order(mocker):
+    closed = []
+    tracker = ResourceTracker()
+    for name in ['a', 'b', 'c']:
+        tracker.track('connection', name, lambda name=name: closed.append(name))
+
+    tracker.close_all()
+    assert closed == ['c', 'b', 'a']
+    assert not tracker.live()
+
+
+def test_close_all_scope(mocker):
+    session_close = mocker.MagicMock()
+    debugger_close = mocker.MagicMock()
+    tracker = ResourceTracker()
+    tracker.track('connection', 'debugger', debugger_close, DEBUGGER)
+    tracker.track('connection', 'session', session_close, SESSION)
+    tracker.track('breakpoint', '1:2', None)
+
+    tracker.close_all(SESSION)
+    session_close.assert_called_once()
+    debugger_close.assert_not_called()
+    assert [resource.name for resource in tracker.live()] == ['debugger']
+
+
+def test_close_all_errors(mocker):
+    log_exception_mock = mocker.patch('loguru.logger.exception')
+    other_close = mocker.MagicMock()
+    tracker = ResourceTracker()
+    tracker.track('connection', 'other', other_close)
+    tracker.track('connection', 'broken', mocker.MagicMock(side_effect=RuntimeError))
+
+    tracker.close_all()
+    log_exception_mock.assert_called_once()
+    other_close.assert_called_once()
+
+
+@pytest.mark.parametrize('close', [True, False])
+def test_release(mocker, close):
+    close_mock = mocker.MagicMock()
+    tracker = ResourceTracker()
+    handle = tracker.track('connection', 'a', close_mock)
+
+    tracker.release(handle, close=close)
+    assert close_mock.called == close
+    assert not tracker.live()
+
+
+def test_context_manager(mocker):
+    close_mock = mocker.MagicMock()
+    with ResourceTracker() as tracker:
+        tracker.track('connection', 'a', close_mock)
+    close_mock.assert_called_once()
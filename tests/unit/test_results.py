@@ -0,0 +1,68 @@
+
+import psycopg2
+import pytest
+
+from lib.results import DiscardSink, FileSink, LogSink, stream_result
+
+
+@pytest.fixture
+def database(mocker):
+    return mocker.MagicMock()
+
+
+def _statements(database):
+    return [call[0][0] for call in database.run_sql.call_args_list]
+
+
+def test_stream_result_batches(database):
+    batches = [[(1, 'a'), (2, 'b')], [(3, 'c'), (4, 'd')], [(5, 'e')]]
+    database.run_sql.side_effect = lambda sql, **kwargs: \
+        batches.pop(0) if sql.startswith('FETCH') else []
+
+    sink = LogSink()
+    stats = stream_result(database, 'SELECT * FROM f()', sink, fetch_size=2)
+
+    assert (stats.rows, stats.batches) == (5, 3)
+    assert stats.peak_batch_bytes > 0
+    assert sink.stats == stats
+    assert _statements(database)[:2] == [
+        'BEGIN', 'DECLARE pydebug_target_result NO SCROLL CURSOR FOR SELECT * FROM f()']
+    assert _statements(database)[-2:] == ['CLOSE pydebug_target_result', 'COMMIT']
+
+
+def test_stream_result_discard(database):
+    database.count_rows.return_value = 1000000
+    stats = stream_result(database, 'SELECT * FROM f()', DiscardSink())
+
+    database.count_rows.assert_called_once_with('MOVE FORWARD ALL FROM pydebug_target_result',
+                                                notice_queue=None)
+    assert not any(sql.startswith('FETCH') for sql in _statements(database))
+    assert (stats.rows, stats.batches) == (1000000, 0)
+
+
+def test_stream_result_error(database):
+    error = psycopg2.errors.RaiseException('oops')
+    database.run_sql.side_effect = lambda sql, **kwargs: _raise(error) \
+        if sql.startswith('FETCH') else []
+
+    with pytest.raises(psycopg2.Error):
+        stream_result(database, 'SELECT * FROM f()', LogSink())
+
+    assert _statements(database)[-1] == 'ROLLBACK'
+
+
+def _raise(error):
+    raise error
+
+
+def test_file_sink(database, tmp_path):
+    path = tmp_path / 'result.tsv'
+    database.run_sql.side_effect = lambda sql, **kwargs: \
+        [(1, 'a b'), (2, None)] if sql.startswith('FETCH') else []
+
+    sink = FileSink(str(path))
+    for _ in range(2):
+        stream_result(database, 'SELECT * FROM f()', sink, fetch_size=10)
+
+    assert path.read_text() == '1\ta b\n2\t\n'
+    assert str(sink) == f'file {path}'
@@ -0,0 +1,46 @@
+
+from lib.proxy import Breakpoint
+from lib.slow import SlowLineTracker, SlowStep, step_until_slow
+
+
+def test_tracker_top():
+    tracker = SlowLineTracker()
+    tracker.record(Breakpoint(1, 5, 'f'), 3.0)
+    tracker.record(Breakpoint(1, 6, 'f'), 10.0)
+    tracker.record(Breakpoint(1, 5, 'f'), 1.0)
+
+    assert len(tracker) == 2
+    top = tracker.top(1)
+    assert [(line.line, line.max_ms) for line in top] == [(6, 10.0)]
+    assert tracker.top()[1] == (1, 5, 'f', 2, 3.0, 4.0)
+
+    tracker.reset()
+    assert not tracker.top()
+
+
+def test_step_until_slow(mocker):
+    proxy = mocker.MagicMock()
+    proxy.position = Breakpoint(1, 4, 'f')
+    proxy.step_over.side_effect = [Breakpoint(1, 5, 'f'), Breakpoint(1, 6, 'f'),
+                                   Breakpoint(1, 7, 'f')]
+    # Every step takes 1 ms, except the second one which takes 50 ms
+    mocker.patch('lib.slow.perf_counter', side_effect=[0, 0.001, 1, 1.05, 2, 2.001])
+
+    tracker = SlowLineTracker()
+    slow = step_until_slow(proxy, tracker, 20)
+
+    assert slow.line == Breakpoint(1, 5, 'f')
+    assert slow.position == Breakpoint(1, 6, 'f')
+    assert round(slow.elapsed_ms) == 50
+    assert len(tracker) == 2
+    assert proxy.step_over.call_count == 2
+
+
+def test_step_until_slow_finished(mocker):
+    proxy = mocker.MagicMock()
+    proxy.position = None
+    proxy.step_over.side_effect = [Breakpoint(1, 5, 'f'), None]
+
+    tracker = SlowLineTracker()
+    assert step_until_slow(proxy, tracker, 1000) is None
+    assert len(tracker) == 1
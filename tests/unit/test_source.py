@@ -0,0 +1,70 @@
+
+import pytest
+
+from prompt_toolkit.formatted_text.utils import fragment_list_to_text
+
+from lib.source import STYLES, SourceView, highlight_line
+
+
+SOURCE = '\n'.join(f'line {x}' for x in range(1, 101))
+
+
+@pytest.fixture
+def proxy(mocker):
+    proxy = mocker.MagicMock()
+    proxy.get_source.return_value = SOURCE
+    return proxy
+
+
+def test_highlight_line():
+    line = "  RAISE NOTICE 'It''s %', 42; -- done"
+    fragments = highlight_line(line)
+
+    assert ''.join(text for _, text in fragments) == line
+    assert (STYLES['keyword'], 'RAISE') in fragments
+    assert (STYLES['string'], "'It''s %'") in fragments
+    assert (STYLES['number'], '42') in fragments
+    assert (STYLES['comment'], '-- done') in fragments
+
+
+def _line_numbers(lines):
+    return [int(fragment_list_to_text(line)[2:8]) for line in lines]
+
+
+def test_render_window(proxy):
+    view = SourceView(window=2)
+    lines = view.render(proxy, 1, current_line=50, breakpoints=[51])
+
+    assert _line_numbers(lines) == [48, 49, 50, 51, 52]
+    assert fragment_list_to_text(lines[2]).startswith(' >')
+    assert fragment_list_to_text(lines[3]).startswith('* ')
+
+
+def test_render_annotations(proxy):
+    view = SourceView(window=2)
+    lines = view.render(proxy, 1, current_line=50, annotations={51: '3 calls'})
+
+    assert fragment_list_to_text(lines[3]).endswith('  -- 3 calls')
+    assert '--' not in fragment_list_to_text(lines[2])
+
+
+def test_render_paging(proxy):
+    view = SourceView(window=2)
+    view.render(proxy, 1, current_line=50)
+
+    assert _line_numbers(view.render(proxy, 1, '+')) == [53, 54, 55, 56, 57]
+    assert _line_numbers(view.render(proxy, 1, '-')) == [48, 49, 50, 51, 52]
+    assert _line_numbers(view.render(proxy, 1, '10')) == [8, 9, 10, 11, 12]
+    assert _line_numbers(view.render(proxy, 1, '1')) == [1, 2, 3, 4, 5]
+    assert _line_numbers(view.render(proxy, 1, '100')) == [96, 97, 98, 99, 100]
+
+
+def test_render_cached(proxy):
+    view = SourceView()
+    for _ in range(3):
+        view.render(proxy, 1)
+    proxy.get_source.assert_called_once_with(1)
+
+    view.forget(1)
+    view.render(proxy, 1)
+    assert proxy.get_source.call_count == 2
@@ -0,0 +1,75 @@
+
+import pytest
+
+from lib.proxy import Breakpoint, Frame
+from lib.stack import StackEntry, StackNavigator
+
+
+FRAMES = [
+    Frame(0, 'inner(integer)', 2, 5, 'i=1'),
+    Frame(1, 'middle(integer)', 3, 10, 'j=' + 'x' * 100),
+    Frame(2, 'outer()', 4, 20, ''),
+]
+
+
+@pytest.fixture
+def proxy(mocker):
+    proxy = mocker.MagicMock()
+    proxy.epoch = 1
+    proxy.deposits = 0
+    proxy.frame = 0
+    proxy.position = Breakpoint(2, 5, 'inner(integer)')
+    proxy.get_stack.return_value = FRAMES
+
+    def _select_frame(level):
+        proxy.frame = level
+    proxy.select_frame.side_effect = _select_frame
+    return proxy
+
+
+def test_frames_cached_per_stop(proxy):
+    stack = StackNavigator(proxy)
+    for _ in range(3):
+        assert stack.frames() == FRAMES
+    proxy.get_stack.assert_called_once()
+
+    proxy.epoch += 1
+    stack.frames()
+    assert proxy.get_stack.call_count == 2
+
+    proxy.deposits += 1
+    stack.frames()
+    assert proxy.get_stack.call_count == 3
+
+
+def test_entries(proxy):
+    entries = StackNavigator(proxy, width=10).entries()
+    assert entries[0] == StackEntry(0, 'inner(integer)', 2, 5, 'i=1', True)
+    assert entries[1].args == 'j=xxxxx... (102 chars)'
+    assert not entries[1].selected
+
+
+def test_location_no_stack_fetch(proxy):
+    stack = StackNavigator(proxy)
+    assert stack.location() == Frame(0, 'inner(integer)', 2, 5, None)
+    proxy.get_stack.assert_not_called()
+
+    proxy.position = None
+    assert stack.location() is None
+
+
+def test_navigation(proxy):
+    stack = StackNavigator(proxy)
+
+    assert stack.up() == FRAMES[1]
+    assert stack.up() == FRAMES[2]
+    assert stack.location() == FRAMES[2]
+    with pytest.raises(IndexError):
+        stack.up()
+
+    assert stack.down() == FRAMES[1]
+    assert stack.select(1) == FRAMES[1]
+    assert proxy.select_frame.call_count == 3
+
+    with pytest.raises(IndexError):
+        stack.select(-1)
@@ -0,0 +1,63 @@
+
+import pytest
+
+from lib.proxy import Breakpoint
+from lib.statements import LineStats, StatementCollector, stats_delta
+
+
+@pytest.fixture
+def collector(mocker):
+    collector = StatementCollector(mocker.MagicMock())
+    collector._time_column = 'total_exec_time'
+    return collector
+
+
+@pytest.mark.parametrize('result,track,available,warned', [
+    ([('total_exec_time', 'all')], 'all', True, False),
+    ([('total_time', 'top')], 'top', True, True),
+    ([], None, False, False),
+])
+def test_available(mocker, collector, result, track, available, warned):
+    warning_mock = mocker.patch('loguru.logger.warning')
+    mocker.patch('loguru.logger.error')
+    collector.database.run_sql.return_value = result
+
+    assert collector.available() == available
+    assert warning_mock.called == warned
+    if result:
+        assert collector._time_column == result[0][0]
+
+
+def test_stats_delta():
+    assert stats_delta(LineStats(1, 2, 3, 4, 1.0), LineStats(3, 2, 5, 2, 3.5)) == \
+        LineStats(2, 0, 2, 0, 2.5)
+
+
+def test_collect(collector):
+    collector.database.run_sql.side_effect = [
+        [(10, 5, 100, 1, 2.0)], [(12, 15, 110, 3, 4.5)],
+        [(12, 15, 110, 3, 4.5)], [(12, 15, 110, 3, 4.5)],
+        [(12, 15, 110, 3, 4.5)], [(13, 16, 110, 3, 5.5)],
+    ]
+    position = Breakpoint(7, 4, 'f')
+
+    for _ in range(3):
+        collector.before()
+        collector.after(position)
+
+    assert collector.lines == {(7, 4): LineStats(3, 11, 10, 2, 3.5)}
+    assert collector.annotations(7) == {4: '3 calls, 11 rows, 12 blks, 3.50 ms'}
+    assert collector.annotations(8) == {}
+    assert collector.entries()[0].func == 'f'
+    assert 'total_exec_time' in collector.database.run_sql.call_args[0][0]
+
+    collector.reset()
+    assert not collector.entries()
+
+
+def test_collect_not_stopped(collector):
+    collector.database.run_sql.return_value = [(1, 1, 1, 1, 1.0)]
+    collector.before()
+    collector.after(None)
+    assert collector.database.run_sql.call_count == 1
+    assert not collector.lines
@@ -0,0 +1,34 @@
+
+import psycopg2
+
+from lib.stepper import STEPPER_SQL, install_stepper, has_stepper
+
+
+def test_has_stepper(mocker):
+    database = mocker.MagicMock()
+    database.run_sql.return_value = [(True,)]
+    assert has_stepper(database)
+    assert 'to_regprocedure' in database.run_sql.call_args[0][0]
+
+    database.run_sql.return_value = [(False,)]
+    assert not has_stepper(database)
+
+
+def test_install_stepper_installed(mocker):
+    database = mocker.MagicMock()
+    database.run_sql.return_value = [(True,)]
+    assert install_stepper(database)
+    database.run_sql.assert_called_once()
+
+
+def test_install_stepper_install(mocker):
+    database = mocker.MagicMock()
+    database.run_sql.side_effect = [[(False,)], [], [(True,)]]
+    assert install_stepper(database)
+    assert database.run_sql.call_args_list[1] == mocker.call(STEPPER_SQL)
+
+
+def test_install_stepper_no_privilege(mocker):
+    database = mocker.MagicMock()
+    database.run_sql.side_effect = [[(False,)], psycopg2.errors.InsufficientPrivilege]
+    assert not install_stepper(database)
@@ -1,4 +1,5 @@
 
+import psycopg2
 import pytest
 
 from psycopg2.errors import QueryCanceled
@@ -33,17 +34,66 @@ def test_get_notices(target_fixture):
     assert target_fixture.get_notices() == NOTICES
 
 
-def test_parse_port():
-    port = Target._parse_port('abc:123')
-    assert port == 123
+@pytest.mark.parametrize('notice,port', [
+    ('NOTICE:  PLDBGBREAK:123\n', 123),
+    ('PLDBGBREAK:54321', 54321),
+    ('NOTICE:  Iteration: 1', None),
+    ('NOTICE:  PLDBGBREAK:garbage', None),
+])
+def test_parse_port(notice, port):
+    assert Target._parse_port(notice) == port
+
+
+def test_wait_for_port(target_fixture):
+    for notice in ['NOTICE:  hello', 'NOTICE:  PLDBGBREAK:42', 'NOTICE:  after']:
+        target_fixture.notice_queue.put_nowait(notice)
+
+    assert target_fixture._wait_for_port(1.0) == 42
+    target_fixture.notice_queue.put_nowait('NOTICE:  later')
+    assert target_fixture.get_notices() == ['NOTICE:  hello', 'NOTICE:  after', 'NOTICE:  later']
+    assert target_fixture.get_notices() == []
+
+
+def test_wait_for_port_timeout(target_fixture):
+    target_fixture.notice_queue.put_nowait('NOTICE:  hello')
+    assert target_fixture._wait_for_port(0.2) is None
+    assert target_fixture.get_notices() == ['NOTICE:  hello']
+
+
+def test_wait_for_port_executor_died(mocker, target_fixture):
+    target_fixture.executor = mocker.MagicMock()
+    target_fixture.executor.is_alive.return_value = False
+    assert target_fixture._wait_for_port(10.0) is None
+
+
+def test_wait_for_port_cancelled(target_fixture):
+    target_fixture.cancelled.set()
+    assert target_fixture._wait_for_port(10.0) is None
+
+
+def test_cancel(mocker, target_fixture):
+    target_fixture.executor = mocker.MagicMock()
+    target_fixture.cancel()
+    assert target_fixture.cancelled.is_set()
+    target_fixture.database.cancel.assert_called_once()
+    target_fixture.executor.join.assert_called_once()
 
 
 def test_wait_for_shutdown(mocker, target_fixture):
     target_fixture.executor = mocker.MagicMock()
-    target_fixture.wait_for_shutdown()
+    target_fixture.executor.is_alive.return_value = False
+    assert target_fixture.wait_for_shutdown()
     target_fixture.executor.join.assert_called_once()
 
 
+def test_wait_for_shutdown_timeout(mocker, target_fixture):
+    target_fixture.executor = mocker.MagicMock()
+    target_fixture.executor.is_alive.return_value = True
+    assert not target_fixture.wait_for_shutdown(1.0)
+    target_fixture.executor.join.assert_any_call(1.0)
+    target_fixture.database.cancel.assert_called_once()
+
+
 @pytest.mark.parametrize('func_call, func_name, func_args', [
     ('foobar(arg1, arg2)', 'foobar', ['arg1', 'arg2']),
     ('foobar (arg1, arg2)', 'foobar', ['arg1', 'arg2']),
@@ -81,23 +131,73 @@ def test_start_no_func_oid(mocker, target_fixture):
 
 def test_start_valid_func(mocker, target_fixture):
     mocker.patch('lib.target.get_func_oid_by_name', return_value=100)
-    target_fixture.notice_queue.get = mocker.MagicMock(return_value='FOO: 42')
+    target_fixture.notice_queue.get = mocker.MagicMock(return_value='NOTICE:  PLDBGBREAK:42')
     target_fixture._run_executor_thread = mocker.MagicMock()
 
     assert target_fixture.start('func_call(arg)')
+    assert target_fixture.port == 42
+    assert target_fixture.attach_time is not None
+
+
+def test_start_timeout(mocker, target_fixture):
+    mocker.patch('lib.target.get_func_oid_by_name', return_value=100)
+    target_fixture._run_executor_thread = mocker.MagicMock()
+
+    assert not target_fixture.start('func_call(arg)', timeout=0.1)
+    assert target_fixture.cancelled.is_set()
+    target_fixture.database.cancel.assert_called_once()
+
+
+def test_start_known_oid(mocker, target_fixture):
+    get_func_oid_mock = mocker.patch('lib.target.get_func_oid_by_name')
+    target_fixture.notice_queue.get = mocker.MagicMock(return_value='PLDBGBREAK:42')
+    target_fixture._run_executor_thread = mocker.MagicMock()
+
+    assert target_fixture.start('func_call(arg)', once=True, func_oid=100)
+    get_func_oid_mock.assert_not_called()
+    target_fixture._run_executor_thread.assert_called_once_with('func_call(arg)', 100)
+    assert target_fixture.once
+
+
+def test_run_once(mocker, target_fixture):
+    target_fixture.once = True
+    target_fixture.database.run_sql.return_value = []
+    target_fixture._run('hello_world(2,3)', 123)
+
+    statements = [call[0][0] for call in target_fixture.database.run_sql.call_args_list]
+    assert statements == [
+        'SELECT * FROM pldbg_oid_debug(123)',
+        'BEGIN',
+        'DECLARE pydebug_target_result NO SCROLL CURSOR FOR SELECT * FROM hello_world(2,3)',
+        'FETCH FORWARD 1000 FROM pydebug_target_result',
+        'CLOSE pydebug_target_result',
+        'COMMIT',
+    ]
+
+
+def test_run_error(mocker, target_fixture):
+    error = psycopg2.errors.RaiseException('oops')
+
+    def _run_sql(sql, **kwargs):
+        if sql.startswith('FETCH'):
+            raise error
+    target_fixture.database.run_sql.side_effect = _run_sql
+    target_fixture._run('hello_world(2,3)', 123)
+
+    assert target_fixture.error is error
+    # The function failed while its rows were fetched, not when it started
+    statements = [call[0][0].split()[0]
+                  for call in target_fixture.database.run_sql.call_args_list]
+    assert statements == ['SELECT', 'BEGIN', 'DECLARE', 'FETCH', 'ROLLBACK']
 
 
 def test_run(mocker, target_fixture):
-    side_effects = [None, 'foo', QueryCanceled]
-    target_fixture.database.run_sql.side_effect = iter(side_effects)
+    stream_mock = mocker.patch('lib.target.stream_result',
+                               side_effect=[mocker.MagicMock(), QueryCanceled])
     target_fixture._run('hello_world(2,3)', 123)
 
-    target_fixture.database.run_sql.assert_has_calls([
-        mocker.call('SELECT * FROM pldbg_oid_debug(123)'),
-        mocker.call('SELECT * FROM hello_world(2,3)',
-                    fetch_result=True,
-                    notice_queue=target_fixture.notice_queue),
-        mocker.call('SELECT * FROM hello_world(2,3)',
-                    fetch_result=True,
-                    notice_queue=target_fixture.notice_queue)
-    ])
+    target_fixture.database.run_sql.assert_called_once_with('SELECT * FROM pldbg_oid_debug(123)')
+    stream_mock.assert_has_calls([
+        mocker.call(target_fixture.database, 'SELECT * FROM hello_world(2,3)',
+                    target_fixture.sink, target_fixture.fetch_size, target_fixture.notice_queue),
+    ] * 2)
@@ -0,0 +1,71 @@
+
+import pytest
+
+from lib.proxy import Breakpoint, Step
+from lib.trace import TRACE_HEADER, TraceRecorder, auto_step
+
+
+POSITIONS = [Breakpoint(1, 5, 'f'), Breakpoint(1, 6, 'f'), Breakpoint(1, 5, 'f')]
+
+
+@pytest.fixture
+def proxy(mocker):
+    proxy = mocker.MagicMock()
+    proxy.step_into.side_effect = POSITIONS + [None]
+    proxy.step_over.side_effect = POSITIONS + [None]
+    return proxy
+
+
+def test_auto_step(proxy):
+    assert [position for position, _ in auto_step(proxy)] == POSITIONS
+    proxy.step_over.assert_not_called()
+
+
+def test_auto_step_over(proxy):
+    assert [position for position, _ in auto_step(proxy, step_into=False)] == POSITIONS
+    proxy.step_into.assert_not_called()
+
+
+def test_auto_step_max_steps(proxy):
+    assert [position for position, _ in auto_step(proxy, max_steps=2)] == POSITIONS[:2]
+    assert proxy.step_into.call_count == 2
+
+
+def test_trace_recorder(tmp_path):
+    path = str(tmp_path / 'test.trace')
+    with TraceRecorder(path) as recorder:
+        for position in POSITIONS:
+            recorder.record(position, 0.001)
+
+    assert recorder.steps == 3
+    assert recorder.coverage == {(1, 5): 2, (1, 6): 1}
+
+    with open(path) as trace_file:
+        assert trace_file.read() == TRACE_HEADER + '1\t1\t5\t1000\n2\t1\t6\t1000\n3\t1\t5\t1000\n'
+
+
+def test_auto_step_batched(mocker):
+    proxy = mocker.MagicMock()
+    batches = [[Step(1, 5, 'f', 1000, None), Step(1, 6, 'f', 2000, None)],
+               [Step(1, 5, 'f', 1000, None)]]
+
+    def _step_many(count, step_into):
+        stops = batches.pop(0)
+        proxy.position = None if not batches else stops[-1]
+        return stops
+
+    proxy.step_many.side_effect = _step_many
+
+    steps = list(auto_step(proxy, batch=2))
+
+    assert [position for position, _ in steps] == POSITIONS
+    assert steps[1][1] == 0.002
+    proxy.step_into.assert_not_called()
+
+
+def test_auto_step_batched_max_steps(mocker):
+    proxy = mocker.MagicMock()
+    proxy.step_many.side_effect = lambda count, step_into: [Step(1, 5, 'f', 1, None)] * count
+
+    assert len(list(auto_step(proxy, max_steps=5, batch=2))) == 5
+    assert [call[0][0] for call in proxy.step_many.call_args_list] == [2, 2, 1]
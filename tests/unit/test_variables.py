@@ -0,0 +1,185 @@
+
+import pytest
+
+import lib.variables as lib_variables
+
+from lib.helpers import TypeInfo
+from lib.proxy import Variable
+from lib.variables import (VariableInspector, VariableSummary, parse_array, parse_path,
+                           parse_record, truncate)
+
+
+INT4, TEXT, JSONB, INT4_ARRAY, ROW, ROW_ARRAY = 23, 25, 3802, 1007, 5000, 5001
+
+TYPES = {
+    INT4: TypeInfo('int4', 'N', 0, [], []),
+    TEXT: TypeInfo('text', 'S', 0, [], []),
+    JSONB: TypeInfo('jsonb', 'U', 0, [], []),
+    INT4_ARRAY: TypeInfo('_int4', 'A', INT4, [], []),
+    ROW: TypeInfo('my_row', 'C', 0, ['id', 'tags', 'doc'], [INT4, INT4_ARRAY, JSONB]),
+    ROW_ARRAY: TypeInfo('_my_row', 'A', ROW, [], []),
+}
+
+
+def _variable(name, dtype, value):
+    return Variable(name, 'L', 1, False, False, False, dtype, value)
+
+
+@pytest.fixture
+def inspector(mocker):
+    proxy = mocker.MagicMock()
+    proxy.epoch = 1
+    proxy.deposits = 0
+    proxy.frame = 0
+    proxy.database.cursor.return_value.__enter__.return_value = None
+    proxy.get_variables.return_value = [
+        _variable('i', INT4, '42'),
+        _variable('t', TEXT, 'x' * 100),
+        _variable('n', TEXT, None),
+        _variable('arr', INT4_ARRAY, '{1,2,NULL}'),
+        _variable('matrix', INT4_ARRAY, '{{1,2},{3,4}}'),
+        _variable('rows', ROW_ARRAY,
+                  '{"(1,\\"{5,6}\\",\\"{\\"\\"a\\"\\": [1, 2]}\\")","(2,{},)"}'),
+        _variable('doc', JSONB, '{"a": [{"b": 1}]}'),
+    ]
+    get_type_infos = mocker.patch('lib.variables.get_type_infos')
+    get_type_infos.side_effect = lambda database, oids: {oid: TYPES[oid] for oid in oids}
+    return VariableInspector(proxy, width=10)
+
+
+@pytest.mark.parametrize('path,name,steps', [
+    ('var', 'var', []),
+    ('var[3].field', 'var', [3, 'field']),
+    ('var["key"][0]', 'var', ['key', 0]),
+    (' x.a.b ', 'x', ['a', 'b']),
+])
+def test_parse_path(path, name, steps):
+    assert parse_path(path) == (name, steps)
+
+
+@pytest.mark.parametrize('path', ['', '1abc', 'var[', 'var.', 'var x'])
+def test_parse_path_invalid(path):
+    with pytest.raises(ValueError):
+        parse_path(path)
+
+
+@pytest.mark.parametrize('literal,elements,lower_bound', [
+    ('{}', [], 1),
+    ('{1,2,NULL}', ['1', '2', None], 1),
+    ('{"a b","c\\"d",NULL}', ['a b', 'c"d', None], 1),
+    ('{{1,2},{3,4}}', [['1', '2'], ['3', '4']], 1),
+    ('[0:1]={7,8}', ['7', '8'], 0),
+])
+def test_parse_array(literal, elements, lower_bound):
+    assert parse_array(literal) == (elements, lower_bound)
+
+
+@pytest.mark.parametrize('literal,fields', [
+    ('(1,abc)', ['1', 'abc']),
+    ('(1,,"")', ['1', None, '']),
+    ('("a ""b""",x)', ['a "b"', 'x']),
+])
+def test_parse_record(literal, fields):
+    assert parse_record(literal) == fields
+
+
+def test_truncate():
+    assert truncate(None, 10) == 'NULL'
+    assert truncate('abc', 10) == 'abc'
+    assert truncate('x' * 20, 10) == 'xxxxxxx... (20 chars)'
+
+
+def test_summary(inspector):
+    summary = inspector.summary()
+    assert summary[0] == VariableSummary('i', 'int4', '42')
+    assert summary[1] == VariableSummary('t', 'text', 'xxxxxxx... (100 chars)')
+    assert summary[2] == VariableSummary('n', 'text', 'NULL')
+
+
+@pytest.mark.parametrize('path,value', [
+    ('i', '42'),
+    ('n', None),
+    ('arr', ['1', '2', None]),
+    ('arr[1]', '1'),
+    ('arr[3]', None),
+    ('matrix[2][1]', '3'),
+    ('rows[1].id', '1'),
+    ('rows[1].tags[2]', '6'),
+    ('rows[1].doc["a"][1]', 2),
+    ('rows[2]', {'id': '2', 'tags': '{}', 'doc': None}),
+    ('doc.a[0].b', 1),
+])
+def test_expand(inspector, path, value):
+    assert inspector.expand(path) == value
+
+
+@pytest.mark.parametrize('path,error', [
+    ('nope', KeyError),
+    ('arr[4]', IndexError),
+    ('arr.field', TypeError),
+    ('matrix[1].field', TypeError),
+    ('rows[1].nope', KeyError),
+    ('i[1]', ValueError),
+    ('rows[2].doc.a', ValueError),
+])
+def test_expand_errors(inspector, path, error):
+    with pytest.raises(error):
+        inspector.expand(path)
+
+
+def test_cached_per_stop(mocker, inspector):
+    parse_array_spy = mocker.spy(lib_variables, 'parse_array')
+    for _ in range(3):
+        inspector.expand('rows[1].id')
+        inspector.summary()
+
+    inspector.proxy.get_variables.assert_called_once()
+    assert parse_array_spy.call_count == 1
+
+    inspector.proxy.epoch += 1
+    inspector.expand('rows[1].id')
+    assert inspector.proxy.get_variables.call_count == 2
+
+    # Changing a variable does not end the stop, but its value is stale
+    inspector.proxy.deposits += 1
+    assert inspector.cached() is None
+    inspector.expand('i')
+    assert inspector.proxy.get_variables.call_count == 3
+
+
+def test_cached_per_frame(inspector):
+    inspector.expand('i')
+    inspector.proxy.frame = 1
+    inspector.expand('i')
+    inspector.proxy.frame = 0
+    inspector.expand('i')
+    assert inspector.proxy.get_variables.call_count == 2
+
+
+def test_children(inspector):
+    assert inspector.children('arr') == [
+        ('1', 'arr[1]', '1', False),
+        ('2', 'arr[2]', '2', False),
+        ('3', 'arr[3]', None, False),
+    ]
+    assert [child[1:] for child in inspector.children('rows[1]')] == [
+        ('rows[1].id', '1', False),
+        ('rows[1].tags', '{5,6}', True),
+        ('rows[1].doc', '{"a": [1, 2]}', True),
+    ]
+    assert inspector.children('matrix')[0] == ('1', 'matrix[1]', ['1', '2'], True)
+    assert inspector.children('doc.a') == [('0', 'doc.a[0]', {'b': 1}, True)]
+
+
+def test_typed(inspector):
+    assert inspector.typed('i') == 42
+    assert inspector.typed('t') == 'x' * 100
+    assert inspector.typed('n') is None
+    assert inspector.typed('arr') == [1, 2, None]
+    assert inspector.typed('arr[2]') == 2
+    assert inspector.typed('rows[1].id') == 1
+    assert inspector.typed('doc.a[0]') == {'b': 1}
+
+    # Decoded once per stop
+    inspector.decoder.decode = None
+    assert inspector.typed('i') == 42
@@ -0,0 +1,61 @@
+
+from collections import Counter
+from time import sleep
+
+import pytest
+
+from lib.proxy import Breakpoint
+from lib.waits import WaitSample, WaitSampler, wait_label
+
+
+@pytest.mark.parametrize('sample,label', [
+    (WaitSample('active', None, None, None), 'CPU'),
+    (WaitSample('active', 'IO', 'DataFileRead', None), 'IO: DataFileRead'),
+    (WaitSample('active', 'Lock', 'transactionid', 'transactionid ShareLock'),
+     'Lock: transactionid ShareLock'),
+    (WaitSample('idle', 'Client', 'ClientRead', None), 'Client: ClientRead'),
+    (WaitSample(None, None, None, None), 'unknown'),
+])
+def test_wait_label(sample, label):
+    assert wait_label(sample) == label
+
+
+def test_sample(mocker):
+    sampler = WaitSampler(mocker.MagicMock())
+    sampler.pid = 1234
+    sampler.database.run_sql.return_value = [('active', 'IO', 'DataFileRead', None)]
+
+    assert sampler.sample() == WaitSample('active', 'IO', 'DataFileRead', None)
+    assert 'a.pid = 1234' in sampler.database.run_sql.call_args[0][0]
+
+
+def test_sampling(mocker):
+    sampler = WaitSampler(mocker.MagicMock(), interval=0.001)
+    sampler.pid = 1234
+    sampler.database.run_sql.return_value = [('active', None, None, None)]
+    position = Breakpoint(7, 4, 'f')
+
+    sampler.before()
+    for _ in range(1000):
+        if sampler._samples:
+            break
+        sleep(0.001)
+    sampler.after(position)
+
+    assert sampler._thread is None
+    assert set(sampler.last) == {'CPU'}
+    entries = sampler.entries()
+    assert [(entry.oid, entry.line, entry.func) for entry in entries] == [(7, 4, 'f')]
+    assert entries[0].events[0][0] == 'CPU'
+
+    sampler.reset()
+    assert not sampler.entries()
+
+
+def test_sampling_without_pid(mocker):
+    sampler = WaitSampler(mocker.MagicMock())
+    sampler.before()
+    sampler.after(Breakpoint(7, 4, 'f'))
+
+    sampler.database.run_sql.assert_not_called()
+    assert sampler.last == Counter()
@@ -0,0 +1,108 @@
+
+import psycopg2
+import pytest
+
+from lib.helpers import TypeInfo
+from lib.proxy import Variable
+from lib.watches import WatchList, WatchResult, substitute_variables
+
+
+def _variable(name, dtype, value):
+    return Variable(name, 'L', 1, False, False, False, dtype, value)
+
+
+@pytest.fixture
+def inspector(mocker):
+    inspector = mocker.MagicMock()
+    inspector.get_variables.return_value = {
+        'i': _variable('i', 23, '42'),
+        's': _variable('s', 25, "it's"),
+    }
+    inspector.get_types.return_value = {23: TypeInfo('int4', 'N', 0, [], []),
+                                         25: TypeInfo('text', 'S', 0, [], [])}
+    inspector.expand.side_effect = lambda path: {'i': '42', 's': "it's"}[path]
+    inspector.typed.side_effect = lambda path: {'i': 42, 's': "it's"}[path]
+    return inspector
+
+
+def test_substitute_variables():
+    variables = {'i': _variable('i', 23, '1'), 'n': _variable('n', 25, None)}
+    sql = substitute_variables("I + length('i') + n + x", variables, {23: 'int4', 25: 'text'})
+    assert sql == "('1'::int4) + length('i') + (NULL::text) + x"
+
+
+def test_substitute_variables_skips_functions_and_columns():
+    variables = {'count': _variable('count', 23, '3'), 'sum': _variable('sum', 23, '4'),
+                 'x': _variable('x', 23, '5')}
+    sql = substitute_variables('count(*) + sum (t.x) + count + x', variables, {23: 'int4'})
+    assert sql == "count(*) + sum (t.x) + ('3'::int4) + ('5'::int4)"
+
+
+def test_add_remove():
+    watches = WatchList()
+    watches.add('a')
+    watches.add('b')
+    watches.add('a')
+    assert list(watches) == ['a', 'b']
+
+    assert watches.remove('1')
+    assert not watches.remove('a')
+    assert watches.remove('b')
+    assert not watches
+
+
+def test_evaluate(inspector):
+    inspector.proxy.database.run_sql.return_value = [('43',)]
+    watches = WatchList()
+    watches.add('i')
+    watches.add('i + 1')
+
+    assert watches.evaluate(inspector) == [
+        WatchResult('i', '42', False),
+        WatchResult('i + 1', '43', False),
+    ]
+    inspector.proxy.database.run_sql.assert_called_once_with(
+        "SELECT (('42'::int4) + 1)::text", fetch_result=True)
+
+    inspector.proxy.database.run_sql.return_value = [('44',)]
+    assert watches.evaluate(inspector) == [
+        WatchResult('i', '42', False),
+        WatchResult('i + 1', '44', True),
+    ]
+
+
+def test_evaluate_batched(inspector):
+    inspector.proxy.database.run_sql.return_value = [('43', '4')]
+    watches = WatchList()
+    watches.add('i + 1')
+    watches.add('length(s)')
+    watches.evaluate(inspector)
+    inspector.proxy.database.run_sql.assert_called_once()
+
+
+def test_evaluate_failure(inspector):
+    inspector.proxy.database.run_sql.side_effect = [
+        psycopg2.errors.UndefinedFunction, [('43',)], psycopg2.errors.UndefinedFunction
+    ]
+    watches = WatchList()
+    watches.add('i + 1')
+    watches.add('nope(i)')
+
+    assert watches.evaluate(inspector) == [
+        WatchResult('i + 1', '43', False),
+        WatchResult('nope(i)', '<error>', False),
+    ]
+
+
+def test_evaluate_typed(inspector):
+    watches = WatchList()
+    watches.add('i')
+    watches.evaluate(inspector)
+
+    # Same numeric value, different text
+    inspector.expand.side_effect = lambda path: '42.0'
+    inspector.typed.side_effect = lambda path: 42.0
+    assert watches.evaluate(inspector) == [WatchResult('i', '42.0', False)]
+
+    inspector.typed.side_effect = lambda path: 43
+    assert watches.evaluate(inspector)[0].changed